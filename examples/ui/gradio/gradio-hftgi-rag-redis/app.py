@@ -5,7 +5,6 @@ from collections.abc import Generator
 from queue import Empty, Queue
 from threading import Thread
 from typing import Optional
-import os
 from markdown import markdown
 import pdfkit
 import uuid
@@ -41,6 +40,7 @@ PDF_FILE_DIR = "proposal-docs"
 REDIS_URL = os.getenv('REDIS_URL')
 REDIS_INDEX = os.getenv('REDIS_INDEX')
 TIMEOUT = int(os.getenv('TIMEOUT', 30))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 4))
 
 # Start Prometheus metrics server
 start_http_server(8000)
@@ -49,6 +49,8 @@ start_http_server(8000)
 FEEDBACK_COUNTER = Counter("feedback_stars", "Number of feedbacks by stars", ["stars", "model_id"])
 MODEL_USAGE_COUNTER = Counter('model_usage', 'Number of times a model was used', ['model_id'])
 REQUEST_TIME = Gauge('request_duration_seconds', 'Time spent processing a request', ['model_id'])
+SLOTS_GAUGE = Gauge('llm_concurrency_slots', 'Generation slots of a provider and model', ['provider_model'])
+SLOTS_IN_USE_GAUGE = Gauge('llm_concurrency_slots_in_use', 'Generation slots in use for a provider and model', ['provider_model'])
         
 def get_model_id():
     model_id = "Unavailable"
@@ -95,10 +97,13 @@ def remove_source_duplicates(input_list):
             unique_list.append(item.metadata['source'])
     return unique_list
 
-lock = threading.Lock()
+# Generation slots of the inference server, requests beyond the limit wait for a free one
+slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+SLOTS_GAUGE.labels(provider_model=model_id).set(MAX_CONCURRENT_REQUESTS)
 
 def stream(input_text, session_id) -> Generator:
     # Create a Queue
+    q = Queue()
     job_done = object()
 
     # Create a function to call - this will run in a thread
@@ -106,10 +111,15 @@ def stream(input_text, session_id) -> Generator:
         MODEL_USAGE_COUNTER.labels(model_id=model_id).inc() 
         # Call this function at the start of your application
         initialize_feedback_counters(model_id)
-        with lock:
-            start_time = time.perf_counter() # start and end time to get the precise timing of the request
-            resp = qa_chain({"query": input_text})
-            end_time = time.perf_counter()
+        with slots:
+            SLOTS_IN_USE_GAUGE.labels(provider_model=model_id).inc()
+            try:
+                start_time = time.perf_counter() # start and end time to get the precise timing of the request
+                # The callback is given per request so concurrent streams don't share a queue
+                resp = qa_chain({"query": input_text}, callbacks=[QueueCallback(q)])
+                end_time = time.perf_counter()
+            finally:
+                SLOTS_IN_USE_GAUGE.labels(provider_model=model_id).dec()
             sources = remove_source_duplicates(resp['source_documents'])
             # Record successful request time
             REQUEST_TIME.labels(model_id=model_id).set(end_time - start_time)
@@ -138,9 +148,6 @@ def stream(input_text, session_id) -> Generator:
         except Empty:
             continue
 
-# A Queue is needed for Streaming implementation
-q = Queue()
-
 ############################
 # LLM chain implementation #
 ############################
@@ -164,8 +171,7 @@ llm = HuggingFaceTextGenInference(
     temperature=TEMPERATURE,
     repetition_penalty=REPETITION_PENALTY,
     streaming=True,
-    verbose=False,
-    callbacks=[QueueCallback(q)]
+    verbose=False
 )
 
 
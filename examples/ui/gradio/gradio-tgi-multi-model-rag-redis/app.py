@@ -1,24 +1,39 @@
+import asyncio
+import json
 import os
 import time
-from collections.abc import Generator
-from queue import Empty, Queue
-from threading import Thread
-import os
-from markdown import markdown
+from collections.abc import AsyncGenerator
+from typing import Optional
+from contextlib import aclosing
 from llm.llm_factory import LLMFactory, NVIDIA
-import pdfkit
+from llm.admission import AdmissionError
+from llm.concurrency import ConcurrencyManager
+from llm.failover import is_retriable
+from llm.health import HealthChecker
+from llm.huggingface_text_gen_inference import close_shared_clients
+from llm.metrics import FAILOVER_ATTEMPTS_COUNTER
 import uuid
-import threading
 import gradio as gr
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
 from prometheus_client import Gauge, start_http_server, Counter
 from dotenv import load_dotenv
 from utils import config_loader
+from utils.config import Config
 import llm.query_helper as QueryHelper
+from scheduler.load_aware import LoadAwareScheduler, LoadCallback, LoadTracker
 from scheduler.round_robin import RoundRobinScheduler
 import pandas as pd
-from utils.callback import QueueCallback
-
-que = Queue()
+from utils.callback import AsyncQueueCallback
+from utils.circuit_breaker import get_circuit_breaker, is_available
+from utils.frame_throttle import FrameThrottle
+from utils.artifact_store import ArtifactStore
+from utils.downloads import file_response
+from utils.pdf_renderer import PdfRenderer
+from utils.proposal_sections import SectionUpdate, plan_section_update
+from utils.request_pool import RequestPool, ServerBusyError
+from utils.shared_state import get_shared_state
+from utils.single_flight import SingleFlight
 
 os.environ["REQUESTS_CA_BUNDLE"] = ""
 # initialization
@@ -27,12 +42,29 @@ config_loader.init_config()
 llm_factory = LLMFactory()
 llm_factory.init_providers(config_loader.config)
 
-global sched
+sched = None
 
 # Parameters
 APP_TITLE = os.getenv("APP_TITLE", "Talk with your documentation")
 PDF_FILE_DIR = "proposal-docs"
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", 2))
+# Disk space of the proposal PDFs and how long one is kept after it was rendered
+PDF_STORE_MAX_MB = int(os.getenv("PDF_STORE_MAX_MB", 512))
+PDF_STORE_MAX_AGE_HOURS = float(os.getenv("PDF_STORE_MAX_AGE_HOURS", 24))
 TIMEOUT = int(os.getenv("TIMEOUT", 30))
+# Proposals generated at once, requests waiting for a worker and their maximum wait
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", 16))
+REQUEST_QUEUE_SIZE = int(os.getenv("REQUEST_QUEUE_SIZE", 32))
+REQUEST_QUEUE_TIMEOUT = float(os.getenv("REQUEST_QUEUE_TIMEOUT", 30))
+# The output is sent to the browser at most every UI_FLUSH_INTERVAL_MS or every UI_FLUSH_TOKENS tokens
+UI_FLUSH_INTERVAL_MS = int(os.getenv("UI_FLUSH_INTERVAL_MS", 100))
+UI_FLUSH_TOKENS = int(os.getenv("UI_FLUSH_TOKENS", 32))
+# Regenerate only the sections of a proposal affected by an update
+SECTION_UPDATES = os.getenv("SECTION_UPDATES", "true").lower() == "true"
+# A generation failing before its first token is retried on another model,
+# at most FAILOVER_ATTEMPTS attempts in all, none started after FAILOVER_DEADLINE seconds
+FAILOVER_ATTEMPTS = int(os.getenv("FAILOVER_ATTEMPTS", 3))
+FAILOVER_DEADLINE = float(os.getenv("FAILOVER_DEADLINE", 20))
 
 # Start Prometheus metrics server
 start_http_server(8000)
@@ -47,30 +79,99 @@ MODEL_USAGE_COUNTER = Counter(
 REQUEST_TIME = Gauge(
     "request_duration_seconds", "Time spent processing a request", ["model_id"]
 )
+CANCELLED_COUNTER = Counter(
+    "cancelled_requests", "Number of requests cancelled before completion", ["model_id"]
+)
+
+
+# Generation slots per "provider: model", limits come from config.yaml
+concurrency = ConcurrencyManager(config_loader.get_max_concurrency)
+# Outstanding generations and latency per "provider: model", for the load_aware type
+load_tracker = LoadTracker(concurrency.outstanding)
+
+# Values of config.type selecting the provider and model of a session
+SCHEDULER_TYPES = ["round_robin", "load_aware", "all"]
 
 
 def create_scheduler():
     global sched
     provider_model_weight_list = config_loader.get_provider_model_weight_list()
     # initialize scheduler
-    sched = RoundRobinScheduler(provider_model_weight_list)
+    if config_loader.config.type == "load_aware":
+        sched = LoadAwareScheduler(provider_model_weight_list, load_tracker, available=is_available)
+    elif isinstance(sched, RoundRobinScheduler):
+        # Configuration changes keep the counters and the position in the rotation
+        sched.update_weights(provider_model_weight_list)
+    else:
+        sched = RoundRobinScheduler(
+            provider_model_weight_list,
+            available=is_available,
+            position=shared_state.next_position if shared_state is not None else None,
+        )
+
 
+def share_config():
+    """Send the configuration changed in the Configuration tab to the other replicas."""
+    if shared_state is not None:
+        shared_state.publish(config_loader.config.to_dict())
 
+
+def apply_shared_config(data):
+    """Apply a configuration changed on another replica."""
+    config = Config(data)
+    if config.llm_providers is not None and config_loader.config.llm_providers is not None:
+        config.llm_providers.keep_credentials(config_loader.config.llm_providers)
+
+    def swap():
+        config_loader.set_config(config)
+        create_scheduler()
+
+    # The configuration and the scheduler are swapped in with the providers, under the factory lock
+    llm_factory.init_providers(config, swap)
+
+
+# Configuration and round robin position shared by the replicas, when enabled
+shared_state = get_shared_state()
 create_scheduler()
+if shared_state is not None:
+    shared_state.start(config_loader.config.to_dict(), apply_shared_config)
+
+# Probes the models in the background, open circuits are skipped by the schedulers
+health_checker = HealthChecker(float(os.getenv("HEALTH_CHECK_INTERVAL", 15)))
+health_checker.start()
 
 
-# PDF Generation
-def get_pdf_file(session_id):
-    return os.path.join("./assets", PDF_FILE_DIR, f"proposal-{session_id}.pdf")
+# PDF Generation, only when the user downloads a proposal
+pdf_store = ArtifactStore(
+    os.path.join("./assets", PDF_FILE_DIR),
+    PDF_STORE_MAX_MB * 1024 * 1024,
+    PDF_STORE_MAX_AGE_HOURS * 3600,
+)
+pdf_renderer = PdfRenderer(pdf_store, PDF_WORKERS)
 
 
-def create_pdf(text, session_id):
+async def prepare_pdf(proposal):
+    """PDF of the generated `proposal`, without the sources and errors shown with it."""
+    if not proposal:
+        raise gr.Error("There is no proposal to download yet")
     try:
-        output_filename = get_pdf_file(session_id)
-        html_text = markdown(text, output_format="html4")
-        pdfkit.from_string(html_text, output_filename)
+        name = await pdf_renderer.render(proposal)
     except Exception as e:
         print(e)
+        raise gr.Error("The PDF could not be created. Contact the administrator.")
+    # Generate the download link HTML
+    return f' <input type="hidden" id="pdf_file" name="pdf_file" value="/proposals/{name}" />'
+
+
+async def download_proposal(name: str, request: Request):
+    try:
+        f = pdf_store.open(name)
+    except ValueError:
+        f = None
+    if f is None:
+        raise HTTPException(status_code=404, detail="Proposal not found, download it again")
+    # The name is a hash of the proposal, it changes with the content
+    return file_response(f, request.headers, etag=f'"{name}"', media_type="application/pdf", filename=name)
 
 
 # Function to initialize all star ratings to 0
@@ -87,87 +188,248 @@ def remove_source_duplicates(input_list):
     return unique_list
 
 
-lock = threading.Lock()
+# Generation workers of the whole pod, requests are rejected early when they run out
+request_pool = RequestPool(WORKER_POOL_SIZE, REQUEST_QUEUE_SIZE, REQUEST_QUEUE_TIMEOUT)
+
+
+# Identical requests in flight share one generation
+single_flight = SingleFlight()
+JOB_DONE = object()
+
+
+class Notice(str):
+    """Output sent along with the answer, the sources or an error, left out of the PDF."""
 
 
-def stream(chain, que, model_input: dict, session_id, model_id) -> Generator:
-    # Create a Queue
-    job_done = object()
+async def update_sections(chain, flight, section_update: SectionUpdate, user_query, provider_model):
+    """Regenerate the affected sections in parallel, return their source documents.
+
+    The tokens of each section are sent tagged with its index.
+    """
+    outline = section_update.outline()
+
+    async def update_section(index):
+        config = {"callbacks": [AsyncQueueCallback(flight, tag=index), LoadCallback(load_tracker, provider_model)]}
+        section_input = {
+            "section": section_update.sections[index].text,
+            "outline": outline,
+            "user_query": user_query,
+        }
+        # Each section is a generation of its own and takes a slot of the backend
+        async with concurrency.aslot(provider_model):
+            resp = await chain.ainvoke(section_input, config=config)
+        return resp["source_documents"]
+
+    tasks = [asyncio.ensure_future(update_section(index)) for index in section_update.affected]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # The other sections are not needed anymore if one failed
+        for task in tasks:
+            task.cancel()
+    return [document for documents in results for document in documents]
+
+
+def next_candidate(tried):
+    """Next "provider: model" from the scheduler for a failed request, None if none is left.
+
+    Only when a scheduler picks the model: with type "all" the user chose it.
+    """
+    if config_loader.config.type not in ("round_robin", "load_aware"):
+        return None
+    # The scheduler skips open circuits, the models already tried are skipped here
+    for _ in range(len(sched.data_set)):
+        item = sched.get_next()
+        if item is not None and item[0] not in tried and is_available(item[0]):
+            return item[0]
+    for provider_model, _ in config_loader.get_provider_model_weight_list():
+        if provider_model not in tried and is_available(provider_model):
+            return provider_model
+    return None
+
 
-    # Create a function to call - this will run in a thread
-    def task():
-        MODEL_USAGE_COUNTER.labels(model_id=model_id).inc()
-        # Call this function at the start of your application
-        initialize_feedback_counters(model_id)
-        with lock:
+async def attempt(flight, model_input: dict, provider_model, chain_without_llm, section_update=None):
+    """Run the chain once on `provider_model`, return the source documents."""
+    provider_id, model_id = get_provider_model(provider_model)
+    # The chain is shared by every request, the streaming and load callbacks are given per run
+    config = {"callbacks": [AsyncQueueCallback(flight), LoadCallback(load_tracker, provider_model)]}
+    chain = llm_factory.get_chain(provider_id, model_id, chain_without_llm)
+    MODEL_USAGE_COUNTER.labels(model_id=model_id).inc()
+    # Call this function at the start of your application
+    initialize_feedback_counters(model_id)
+    if section_update is None:
+        # Waits for a free slot of this backend, the task is cancelled if every user leaves meanwhile
+        async with concurrency.aslot(provider_model):
             start_time = (
                 time.perf_counter()
             )  # start and end time to get the precise timing of the request
-            try:
-                resp = chain.invoke(input=model_input)
-                end_time = time.perf_counter()
-                sources = remove_source_duplicates(resp["source_documents"])
-                REQUEST_TIME.labels(model_id=model_id).set(end_time - start_time)
-                create_pdf(resp["result"], session_id)
-                if len(sources) != 0:
-                    que.put("\n*Sources:* \n")
-                    for source in sources:
-                        que.put("* " + str(source) + "\n")
-            except Exception as e:
-                print(e)
-                que.put("Error executing request. Contact the administrator.")
-
-            que.put(job_done)
-
-    # Create a thread and start the function
-    t = Thread(target=task)
-    t.start()
+            resp = await chain.ainvoke(model_input, config=config)
+            end_time = time.perf_counter()
+        source_documents = resp["source_documents"]
+    else:
+        start_time = time.perf_counter()
+        source_documents = await update_sections(
+            chain, flight, section_update, model_input["user_query"], provider_model
+        )
+        end_time = time.perf_counter()
+    REQUEST_TIME.labels(model_id=model_id).set(end_time - start_time)
+    return source_documents
+
+
+async def generate(flight, model_input: dict, session_id, provider_model, chain_without_llm, section_update=None):
+    """Run the chain for `model_input`, tokens are sent to every request of the flight.
+
+    With a `section_update`, `chain_without_llm` builds the chain updating one
+    section and only the affected sections are regenerated.
+
+    A generation failing on its backend before any token was sent is retried
+    on the next candidate of the scheduler, up to FAILOVER_ATTEMPTS attempts
+    started within FAILOVER_DEADLINE seconds of the request.
+    """
+    deadline = time.monotonic() + FAILOVER_DEADLINE
+    tried = []
+    try:
+        async with request_pool.worker():
+            if not is_available(provider_model):
+                # Sessions keep the model picked when they started, its circuit may have opened since
+                provider_model = next_candidate([provider_model]) or provider_model
+            while True:
+                tried.append(provider_model)
+                sent = len(flight.buffer)
+                breaker = get_circuit_breaker(provider_model)
+                # Claims the trial of a half-open circuit, given back below if no outcome is recorded
+                breaker.acquire(flight)
+                try:
+                    source_documents = await attempt(
+                        flight, model_input, provider_model, chain_without_llm, section_update
+                    )
+                    breaker.record_success()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Rejections by the client-side limits and errors of this application
+                    # (retriever, vector database, PDF) are not failures of the model
+                    if is_retriable(e) and not isinstance(e, AdmissionError):
+                        breaker.record_failure(str(e))
+                    next_model = None
+                    # Once the users have seen tokens the answer cannot change model anymore
+                    if (
+                        len(flight.buffer) == sent
+                        and len(tried) < FAILOVER_ATTEMPTS
+                        and time.monotonic() < deadline
+                        and is_retriable(e)
+                    ):
+                        next_model = next_candidate(tried)
+                    if next_model is None:
+                        FAILOVER_ATTEMPTS_COUNTER.labels(provider_model=provider_model, outcome="error").inc()
+                        raise
+                    print(f"Request {session_id} failed on {provider_model}, retrying on {next_model}: {e!r}")
+                    FAILOVER_ATTEMPTS_COUNTER.labels(provider_model=provider_model, outcome="failover").inc()
+                    provider_model = next_model
+                finally:
+                    breaker.release(flight)
+        FAILOVER_ATTEMPTS_COUNTER.labels(provider_model=provider_model, outcome="ok").inc()
+        sources = remove_source_duplicates(source_documents)
+        if len(sources) != 0:
+            flight.put_nowait(Notice("\n*Sources:* \n"))
+            for source in sources:
+                flight.put_nowait(Notice("* " + str(source) + "\n"))
+    except asyncio.CancelledError:
+        print(f"Request {session_id} cancelled")
+        CANCELLED_COUNTER.labels(model_id=get_provider_model(provider_model)[1]).inc()
+        raise
+    except ServerBusyError as e:
+        print(e)
+        flight.put_nowait(Notice(f"The server is busy. Please retry in {e.retry_after} seconds."))
+    except AdmissionError as e:
+        print(e)
+        flight.put_nowait(Notice("The model server is busy. Please retry in a few seconds."))
+    except Exception as e:
+        print(e)
+        flight.put_nowait(Notice("Error executing request. Contact the administrator."))
+
+    flight.put_nowait(JOB_DONE)
 
+
+async def stream(que: asyncio.Queue, section_update: Optional[SectionUpdate] = None) -> AsyncGenerator:
+    """Yield the output shown and the answer alone, without the notices, in coalesced frames."""
+    # Text of the regenerated sections, by index, spliced into the old proposal
+    generated = {}
     content = ""
+    answer = ""
+
+    def render(text):
+        if section_update is None:
+            return text
+        return section_update.render(generated) + text
 
-    # Get each new token from the queue and yield for our generator
-    while True:
-        try:
-            next_token = que.get(True, timeout=100)
-            if next_token is job_done:
+    throttle = FrameThrottle(UI_FLUSH_INTERVAL_MS / 1000, UI_FLUSH_TOKENS)
+
+    # Get each new token from the queue and yield the content in coalesced frames
+    try:
+        while True:
+            try:
+                # Tokens pending since the last frame are flushed once they are due,
+                # even if the model pauses
+                next_token = await asyncio.wait_for(que.get(), throttle.timeout())
+            except asyncio.TimeoutError:
+                next_token = None
+            if next_token is JOB_DONE:
                 break
             if isinstance(next_token, str):
                 content += next_token
-                yield next_token, content
-        except Empty:
-            continue
+                if not isinstance(next_token, Notice):
+                    answer += next_token
+                throttle.add()
+            elif isinstance(next_token, tuple):
+                index, token = next_token
+                generated[index] = generated.get(index, "") + token
+                throttle.add()
+            if throttle.due():
+                yield throttle.flush(render(content)), render(answer)
+        # The final state is always sent
+        if throttle.pending or not throttle.frames:
+            yield throttle.flush(render(content)), render(answer)
+    finally:
+        throttle.finish()
 
 
 # Gradio implementation
-def ask_llm(provider_model, model_input, chain_without_llm):
-    que = Queue()
-    callback = QueueCallback(que)
+async def ask_llm(provider_model, model_input, chain_without_llm, section_update=None):
     session_id = str(uuid.uuid4())
-    provider_id, model_id = get_provider_model(provider_model)
-    llm = llm_factory.get_llm(provider_id, model_id, callback)
-    chain = chain_without_llm(llm)
+    key = (provider_model, chain_without_llm.__name__, json.dumps(model_input, sort_keys=True))
+
+    def start(flight):
+        return generate(flight, model_input, session_id, provider_model, chain_without_llm, section_update)
 
-    for next_token, content in stream(chain, que, model_input, session_id, model_id):
-        # Generate the download link HTML
-        download_link_html = f' <input type="hidden" id="pdf_file" name="pdf_file" value="/file={get_pdf_file(session_id)}" />'
-        yield content, download_link_html
+    # Leaving the flight when Gradio closes the generator (user disconnected or pressed Clear)
+    # cancels the generation right away if no other user is reading it
+    with single_flight.join(key, start) as que:
+        async with aclosing(stream(que, section_update)) as frames:
+            async for frame in frames:
+                yield frame
 
-def generate_proposal(provider_model, company, product):
+async def generate_proposal(provider_model, company, product):
     chain_without_llm = QueryHelper.get_qa_chain
 
     query = f"Generate a sales proposal for the product '{product}', to sell to company '{company}' that includes overview, features, benefits, and support options of the product '{product}'."
     model_input = {'query': query}
     
-    for content, download_link_html in ask_llm(provider_model, model_input, chain_without_llm):
-        yield content, download_link_html
-    
-def update_proposal(provider_model: str, old_proposal: str, user_query: str):
+    async for output in ask_llm(provider_model, model_input, chain_without_llm):
+        yield output
+
+async def update_proposal(provider_model: str, old_proposal: str, user_query: str):
     chain_without_llm = QueryHelper.get_update_proposal_chain
-    
+    # Only the sections the user asks to change are regenerated, when they can be told apart
+    section_update = plan_section_update(old_proposal, user_query) if SECTION_UPDATES else None
+    if section_update is not None:
+        chain_without_llm = QueryHelper.get_update_section_chain
+
     model_input = {'old_proposal': old_proposal, 'user_query': user_query}
     
-    for content, download_link_html in ask_llm(provider_model, model_input, chain_without_llm):
-        yield content, download_link_html
+    async for output in ask_llm(provider_model, model_input, chain_without_llm, section_update):
+        yield output
 
 def get_provider_model(provider_model):
     if provider_model is None:
@@ -181,7 +443,7 @@ def is_provider_visible():
 
 
 def get_selected_provider():
-    if config_loader.config.type == "round_robin":
+    if config_loader.config.type in ("round_robin", "load_aware"):
         return sched.get_next()
 
     provider_list = config_loader.get_provider_model_weight_list()
@@ -226,6 +488,7 @@ def get_provider_list_as_df():
             "enabled": "Enabled",
             "url": "URL",
             "model_name": "Model",
+            "health": "Health",
         }
     )
     return df
@@ -285,8 +548,14 @@ with gr.Blocks(title="HatBot", css=css) as demo:
                 update_proposal_button = gr.Button('Update proposal', visible=False)
                 download_button = gr.Button("Download as PDF", visible=False)
                 download_link_html = gr.HTML(visible=False)
+                # The answer alone, rendered as PDF
+                answer_state = gr.State()
 
         download_button.click(
+            prepare_pdf,
+            inputs=[answer_state],
+            outputs=[download_link_html],
+        ).success(
             None,
             [],
             [],
@@ -295,13 +564,13 @@ with gr.Blocks(title="HatBot", css=css) as demo:
         def validate_update_proposal_input(text):
             if not text:
                 raise gr.Error('Update proposal cannot be blank')
-        update_proposal_button.click(
+        update_event = update_proposal_button.click(
             validate_update_proposal_input,
             inputs=[input_update_proposal]
         ).success(
             update_proposal,
             inputs=[providers_dropdown, output_answer, input_update_proposal],
-            outputs=[output_answer, download_link_html]
+            outputs=[output_answer, answer_state]
         )
         def make_visable_chat_with_pdf():
             return gr.update(visible=True), gr.update(visible=True), gr.update(visible=True)
@@ -319,28 +588,32 @@ with gr.Blocks(title="HatBot", css=css) as demo:
 
             return
 
-        submit_button.click(
+        generate_event = submit_button.click(
             validate_generate_input,
             inputs=[providers_dropdown, customer_box, product_text_box],
         ).success(
             generate_proposal,
             inputs=[providers_dropdown, customer_box, product_text_box],
-            outputs=[output_answer, download_link_html],
-        ).success(
+            outputs=[output_answer, answer_state],
+        )
+        generate_event.success(
             make_visable_chat_with_pdf,
             inputs=None,
             outputs=[input_update_proposal, download_button, update_proposal_button]
         )
         clear_button.click(
-            lambda: [None, None, None, None, None],
+            lambda: [None, None, None, None, None, None],
             inputs=[],
             outputs=[
                 customer_box,
                 product_text_box,
                 output_answer,
+                answer_state,
                 radio,
                 output_rating,
             ],
+            # Stop any proposal still streaming so the server frees its slot
+            cancels=[generate_event, update_event],
         )
 
         @radio.input(inputs=[radio, provider_model_var], outputs=output_rating)
@@ -357,10 +630,10 @@ with gr.Blocks(title="HatBot", css=css) as demo:
 
         with gr.Accordion("Type"):
             type_dropdown = gr.Dropdown(
-                ["round_robin", "all"],
+                SCHEDULER_TYPES,
                 label="Type",
                 value=config_loader.config.type,
-                info="Select LLM providers based on type (round_robin,  all)",
+                info="Select LLM providers based on type (round_robin, load_aware, all)",
             )
 
             update_type_btn = gr.Button("Submit", elem_classes="add_provider_bu")
@@ -368,12 +641,13 @@ with gr.Blocks(title="HatBot", css=css) as demo:
             def update_type(type):
                 config_loader.config.type = type
                 create_scheduler()
+                share_config()
                 return {
                     type_dropdown: gr.Dropdown(
-                        ["round_robin", "all"],
+                        SCHEDULER_TYPES,
                         label="Type",
                         value=type,
-                        info="Select LLM providers based on type (round_robin,  all)",
+                        info="Select LLM providers based on type (round_robin, load_aware, all)",
                     )
                 }
 
@@ -487,7 +761,9 @@ with gr.Blocks(title="HatBot", css=css) as demo:
                     def delete_provider(provider, model):
 
                         config_loader.delete_provider(provider, model)
+                        llm_factory.init_providers(config_loader.config)
                         create_scheduler()
+                        share_config()
                         p_dropdown = gr.Dropdown(
                             interactive=True,
                             choices=provider_model_list,
@@ -497,7 +773,7 @@ with gr.Blocks(title="HatBot", css=css) as demo:
 
                         df = get_provider_list_as_df()
                         df_component = gr.Dataframe(
-                            headers=["Provider", "Model", "URL", "Enabled"], value=df
+                            headers=["Provider", "Model", "URL", "Enabled", "Health"], value=df
                         )
                         add_p_dropdown = gr.Dropdown(
                             interactive=True,
@@ -659,13 +935,13 @@ with gr.Blocks(title="HatBot", css=css) as demo:
             m = f"<div><span id='model_id'>Model: {model_id}</span></div>"
             df = get_provider_list_as_df()
             df_component = gr.Dataframe(
-                headers=["Provider", "Model", "URL", "Enabled"], value=df
+                headers=["Provider", "Model", "URL", "Enabled", "Health"], value=df
             )
             td = gr.Dropdown(
-                ["round_robin", "all"],
+                SCHEDULER_TYPES,
                 label="Type",
                 value=config_loader.config.type,
-                info="Select LLM providers based on type (round_robin,  all)",
+                info="Select LLM providers based on type (round_robin, load_aware, all)",
             )
             return {
                 providers_dropdown: p_dropdown,
@@ -748,9 +1024,10 @@ with gr.Blocks(title="HatBot", css=css) as demo:
             gr.Info("Provider added successfully!")
             df = get_provider_list_as_df()
             df_component = gr.Dataframe(
-                headers=["Provider", "Model", "URL", "Enabled"], value=df
+                headers=["Provider", "Model", "URL", "Enabled", "Health"], value=df
             )
             create_scheduler()
+            share_config()
             return {
                 providers_dropdown: p_dropdown,
                 add_provider_dropdown: None,
@@ -824,9 +1101,20 @@ with gr.Blocks(title="HatBot", css=css) as demo:
 if __name__ == "__main__":
     os.environ.pop("LANGCHAIN_TRACING_V2", None)
 
-    demo.queue().launch(
+    # Let Gradio hand every request our pool can hold over to it, so the pool
+    # applies the backpressure and answers "busy" instead of Gradio's queue
+    demo.queue(
+        default_concurrency_limit=WORKER_POOL_SIZE + REQUEST_QUEUE_SIZE,
+        max_size=REQUEST_QUEUE_SIZE,
+    ).launch(
         server_name="0.0.0.0",
         share=False,
         favicon_path="./assets/robot-head.ico",
-        allowed_paths=["assets"],
+        # Not the proposals, they are only sent by /proposals/{name}
+        allowed_paths=["assets/robot-head.ico", "assets/robot-head.svg"],
+        # Routes of the app created by Gradio, they come before its own
+        app_kwargs={
+            "routes": [APIRoute("/proposals/{name}", download_proposal, methods=["GET", "HEAD"])],
+        },
     )
+    close_shared_clients()
@@ -0,0 +1,220 @@
+"""Load generator reporting throughput and latency percentiles of the LLM paths.
+
+Targets:
+    client    llm.client.Client streaming straight from a TGI endpoint
+    provider  the LangChain LLM built by LLMFactory for a "provider: model"
+    pipeline  the full async app.ask_llm pipeline (workers, slots, callback queue),
+              all requests on one event loop like in Gradio
+
+The provider and pipeline targets read the models from CONFIG_FILE, which
+defaults to benchmarks/mock-config.yaml pointing to the mock server.
+
+Run from the application directory, against the bundled mock server:
+
+    python -m benchmarks.load_generator client --mock --requests 200 --concurrency 16
+    python -m benchmarks.load_generator provider --mock --provider-model "OpenShift AI (vLLM): mock-model"
+    python -m benchmarks.load_generator pipeline --mock --provider-model "Hugging Face: mock-model"
+"""
+
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, closing, nullcontext
+from typing import Callable, List, Optional
+
+from benchmarks.mock_server import MockServer, add_settings_arguments, settings_from_args
+
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(__file__), "mock-config.yaml")
+PROMPT = (
+    "Generate a sales proposal for the product 'OpenShift AI', to sell to company "
+    "'Acme' that includes overview, features, benefits, and support options."
+)
+
+
+class Result:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.end: Optional[float] = None
+        self.tokens = 0
+        self.error: Optional[Exception] = None
+
+    def token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += 1
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, `q` between 0 and 100."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def client_target(args) -> Callable[[Result], None]:
+    from llm.client import Client
+
+    client = Client(args.url, timeout=args.timeout, pool_maxsize=args.concurrency)
+
+    def run(result: Result) -> None:
+        with closing(client.generate_stream(PROMPT, max_new_tokens=args.max_new_tokens, lite=True)) as stream:
+            for _ in stream:
+                result.token()
+
+    return run
+
+
+def _load_config(args) -> None:
+    os.environ.setdefault("CONFIG_FILE", args.config or DEFAULT_CONFIG_FILE)
+    from utils import config_loader
+
+    config_loader.init_config()
+
+
+def provider_target(args) -> Callable[[Result], None]:
+    from langchain.callbacks.base import BaseCallbackHandler
+
+    from llm.llm_factory import LLMFactory
+    from utils import config_loader
+
+    _load_config(args)
+    factory = LLMFactory()
+    factory.init_providers(config_loader.config)
+    provider, model = args.provider_model.split(": ")
+
+    class TimingCallback(BaseCallbackHandler):
+        def __init__(self, result: Result) -> None:
+            self.result = result
+
+        def on_llm_new_token(self, token: str, **kwargs) -> None:
+            self.result.token()
+
+    def run(result: Result) -> None:
+        llm = factory.get_llm(provider, model)
+        llm.invoke(PROMPT, config={"callbacks": [TimingCallback(result)]})
+
+    return run
+
+
+def pipeline_target(args) -> Callable[[Result], None]:
+    _load_config(args)
+    import app
+    from langchain_core.runnables import RunnableLambda
+
+    def benchmark_chain(llm, packer=None):
+        # Same output as the RAG chains, without the vector database
+        return RunnableLambda(
+            lambda model_input: {"result": llm.invoke(model_input["query"]), "source_documents": []}
+        )
+
+    # Identical requests in flight share one generation, unless the prompts differ
+    request_ids = itertools.count()
+
+    async def run(result: Result) -> None:
+        query = PROMPT if args.same_prompt else f"{PROMPT} ({next(request_ids)})"
+        outputs = app.ask_llm(args.provider_model, {"query": query}, benchmark_chain)
+        async with aclosing(outputs):
+            async for _ in outputs:
+                result.token()
+
+    return run
+
+
+TARGETS = {
+    "client": client_target,
+    "provider": provider_target,
+    "pipeline": pipeline_target,
+}
+
+
+def run_load(run: Callable[[Result], None], requests: int, concurrency: int) -> List[Result]:
+    if asyncio.iscoroutinefunction(run):
+        return asyncio.run(run_async_load(run, requests, concurrency))
+    results: List[Result] = []
+    lock = threading.Lock()
+
+    def one(_):
+        result = Result()
+        try:
+            run(result)
+        except Exception as e:
+            result.error = e
+        result.end = time.perf_counter()
+        with lock:
+            results.append(result)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    return results
+
+
+async def run_async_load(run, requests: int, concurrency: int) -> List[Result]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(_):
+        async with semaphore:
+            result = Result()
+            try:
+                await run(result)
+            except Exception as e:
+                result.error = e
+            result.end = time.perf_counter()
+            return result
+
+    return list(await asyncio.gather(*(one(i) for i in range(requests))))
+
+
+def report(results: List[Result], elapsed: float) -> None:
+    ok = [r for r in results if r.error is None]
+    errors = [r for r in results if r.error is not None]
+    tokens = sum(r.tokens for r in ok)
+    print(f"requests        {len(results)} ({len(errors)} failed)")
+    print(f"elapsed         {elapsed:.2f}s")
+    print(f"throughput      {len(ok) / elapsed:.2f} req/s, {tokens / elapsed:.1f} tokens/s")
+    series = {
+        "ttft": [r.first_token - r.start for r in ok if r.first_token is not None],
+        "latency": [r.end - r.start for r in ok],
+    }
+    for name, values in series.items():
+        p50, p95, p99 = (percentile(values, q) for q in (50, 95, 99))
+        print(f"{name:<15} p50 {p50 * 1000:8.1f}ms  p95 {p95 * 1000:8.1f}ms  p99 {p99 * 1000:8.1f}ms")
+    if errors:
+        print(f"first error     {errors[0].error!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("target", choices=sorted(TARGETS))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="TGI endpoint of the client target")
+    parser.add_argument("--provider-model", default="Hugging Face: mock-model")
+    parser.add_argument("--config", help=f"configuration file, defaults to {DEFAULT_CONFIG_FILE}")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument(
+        "--same-prompt", action="store_true", help="send the same prompt from every request of the pipeline target"
+    )
+    parser.add_argument("--mock", action="store_true", help="start the mock server in process on --mock-port")
+    parser.add_argument("--mock-port", type=int, default=8080)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(settings_from_args(args), port=args.mock_port) if args.mock else nullcontext()
+    with server:
+        run = TARGETS[args.target](args)
+        start = time.perf_counter()
+        results = run_load(run, args.requests, args.concurrency)
+        report(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Mock TGI and OpenAI compatible inference server for offline benchmarks.
+
+Serves the text-generation-inference API (`/`, `/generate`,
+`/generate_stream`, `/info`) and the OpenAI `/v1/completions` and
+`/v1/chat/completions` endpoints, streaming or not, with a configurable time
+to first token, per-token delay, error rate and concurrency cap.
+
+Run from the application directory:
+
+    python -m benchmarks.mock_server --port 8080 --ttft 0.2 --token-delay 0.02
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+MODEL_ID = "mock-model"
+
+WORDS = (
+    "the product delivers secure scalable hybrid cloud support with automated "
+    "operations enterprise grade features and a predictable subscription model"
+).split()
+
+
+class MockSettings:
+    """Behaviour of the mock server, shared by all the request handlers."""
+
+    def __init__(
+        self,
+        ttft: float = 0.2,
+        token_delay: float = 0.02,
+        tokens: int = 128,
+        error_rate: float = 0.0,
+        max_concurrency: int = 32,
+        max_queue: int = 128,
+        model_id: str = MODEL_ID,
+    ) -> None:
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.model_id = model_id
+        self._slots = threading.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take a generation slot, waiting in the queue. False when the queue is full."""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                return False
+            self._waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+def generate_tokens(count: int, seed: int) -> Iterator[str]:
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield " " + rng.choice(WORDS)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/info":
+            self._send_json(
+                200,
+                {
+                    "model_id": self.settings.model_id,
+                    "model_dtype": "torch.float16",
+                    "model_device_type": "cpu",
+                    "max_concurrent_requests": self.settings.max_concurrency,
+                    "max_input_length": 4096,
+                    "max_total_tokens": 8192,
+                    "version": "mock",
+                },
+            )
+        elif self.path.rstrip("/") in ("/health", "/v1/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.settings.model_id, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}", "error_type": "not_found"})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        body = self._read_json()
+        if path in ("", "/generate", "/generate_stream"):
+            parameters = body.get("parameters") or {}
+            stream = path == "/generate_stream" or (path == "" and body.get("stream", False))
+            count = parameters.get("max_new_tokens") or self.settings.tokens
+            self._serve(self._tgi_stream if stream else self._tgi_generate, count, body)
+        elif path in ("/v1/completions", "/v1/chat/completions"):
+            count = body.get("max_tokens") or self.settings.tokens
+            chat = path.endswith("chat/completions")
+            if body.get("stream", False):
+                self._serve(self._openai_stream, count, body, chat)
+            else:
+                self._serve(self._openai_complete, count, body, chat)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}", "error_type": "not_found"})
+
+    def _serve(self, generate, count: int, body: Dict, *args) -> None:
+        settings = self.settings
+        if not settings.acquire():
+            self._send_json(429, {"error": "Model is overloaded", "error_type": "overloaded"})
+            return
+        try:
+            if random.random() < settings.error_rate:
+                time.sleep(settings.ttft)
+                self._send_json(500, {"error": "Mock generation error", "error_type": "generation"})
+                return
+            count = min(int(count), settings.tokens)
+            seed = body.get("seed") or (body.get("parameters") or {}).get("seed") or random.randrange(1 << 30)
+            generate(count, seed, *args)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away, like a cancelled generation
+            pass
+        finally:
+            settings.release()
+
+    def _start_stream(self) -> None:
+        # Chunked like TGI: a body delimited by the end of the connection is
+        # read to the end by the HTTP clients before the first event is seen
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_event(self, payload) -> None:
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self._send_chunk(b"data:" + data.encode("utf-8") + b"\n\n")
+
+    def _end_stream(self) -> None:
+        self._send_chunk(b"")
+
+    def _tokens(self, count: int, seed: int) -> Iterator[str]:
+        time.sleep(self.settings.ttft)
+        for i, token in enumerate(generate_tokens(count, seed)):
+            if i:
+                time.sleep(self.settings.token_delay)
+            yield token
+
+    def _tgi_generate(self, count: int, seed: int) -> None:
+        text = "".join(self._tokens(count, seed))
+        self._send_json(
+            200,
+            {
+                "generated_text": text,
+                "details": {
+                    "finish_reason": "length",
+                    "generated_tokens": count,
+                    "seed": seed,
+                    "prefill": [],
+                    "tokens": [],
+                },
+            },
+        )
+
+    def _tgi_stream(self, count: int, seed: int) -> None:
+        self._start_stream()
+        text = ""
+        for i, token in enumerate(self._tokens(count, seed)):
+            text += token
+            last = i == count - 1
+            self._send_event(
+                {
+                    "token": {"id": i, "text": token, "logprob": -0.1, "special": False},
+                    "generated_text": text if last else None,
+                    "details": (
+                        {"finish_reason": "length", "generated_tokens": count, "seed": seed}
+                        if last
+                        else None
+                    ),
+                }
+            )
+        self._end_stream()
+
+    def _openai_choice(self, text: str, chat: bool, finish_reason: Optional[str], delta: bool) -> Dict:
+        if not chat:
+            return {"index": 0, "text": text, "logprobs": None, "finish_reason": finish_reason}
+        message = {"role": "assistant", "content": text}
+        return {"index": 0, "delta" if delta else "message": message, "finish_reason": finish_reason}
+
+    def _openai_body(self, chat: bool, choice: Dict, usage: Optional[Dict] = None) -> Dict:
+        body = {
+            "id": "cmpl-" + uuid.uuid4().hex,
+            "object": "chat.completion.chunk" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": self.settings.model_id,
+            "choices": [choice],
+        }
+        if usage is not None:
+            body["usage"] = usage
+        return body
+
+    def _openai_complete(self, count: int, seed: int, chat: bool) -> None:
+        text = "".join(self._tokens(count, seed))
+        body = self._openai_body(chat, self._openai_choice(text, chat, "length", delta=False), {
+            "prompt_tokens": 0, "completion_tokens": count, "total_tokens": count,
+        })
+        body["object"] = "chat.completion" if chat else "text_completion"
+        self._send_json(200, body)
+
+    def _openai_stream(self, count: int, seed: int, chat: bool) -> None:
+        self._start_stream()
+        for i, token in enumerate(self._tokens(count, seed)):
+            finish_reason = "length" if i == count - 1 else None
+            self._send_event(
+                self._openai_body(chat, self._openai_choice(token, chat, finish_reason, delta=True))
+            )
+        self._send_event("[DONE]")
+        self._end_stream()
+
+
+class MockServer:
+    """Run the mock server in a background thread.
+
+    Example:
+        .. code-block:: python
+
+            with MockServer(MockSettings(ttft=0.1), port=0) as server:
+                client = Client(server.url)
+    """
+
+    def __init__(self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 8080) -> None:
+        handler = type("BoundMockHandler", (MockHandler,), {"settings": settings or MockSettings()})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=128, help="maximum tokens per generation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="generations served at once")
+    parser.add_argument("--max-queue", type=int, default=128, help="waiting requests before 429")
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        ttft=args.ttft,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(settings_from_args(args), args.host, args.port)
+    print(f"Mock inference server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Concurrency stress test of the smooth weighted round robin scheduler.
+
+Many threads pick from one scheduler at once, like the Gradio workers do.
+Every full period of picks must give each item exactly its weight, whatever
+the interleaving, and weight updates in the middle must not break it.
+
+Run from the application directory:
+
+    python -m benchmarks.scheduler_stress --threads 32 --periods 2000
+"""
+
+import argparse
+import sys
+import threading
+from collections import Counter
+
+from scheduler.round_robin import RoundRobinScheduler
+
+DATA = [("a", 5), ("b", 3), ("c", 1), ("d", 1)]
+UPDATED = [("a", 1), ("b", 1), ("c", 2), ("e", 4)]
+
+
+def run(scheduler: RoundRobinScheduler, threads: int, picks: int) -> Counter:
+    """Pick `picks` items from `threads` threads started together."""
+    counts = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    per_thread, extra = divmod(picks, threads)
+
+    def worker(n: int) -> None:
+        local = Counter()
+        barrier.wait()
+        for _ in range(n):
+            local[scheduler.get_next()[0]] += 1
+        with lock:
+            counts.update(local)
+
+    workers = [threading.Thread(target=worker, args=(per_thread + (i < extra),)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return counts
+
+
+def check(name: str, counts: Counter, expected: Counter) -> bool:
+    ok = counts == expected
+    print(f"{name}: {'ok' if ok else 'FAILED'} {dict(counts)}")
+    if not ok:
+        print(f"  expected {dict(expected)}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--periods", type=int, default=2000)
+    args = parser.parse_args()
+    # Make the threads switch as often as possible
+    sys.setswitchinterval(1e-6)
+
+    ok = True
+    scheduler = RoundRobinScheduler(DATA)
+    period = sum(weight for _, weight in DATA)
+    counts = run(scheduler, args.threads, period * args.periods)
+    ok &= check("picks", counts, Counter({key: weight * args.periods for key, weight in DATA}))
+    ok &= check("counter", Counter(scheduler.counter), counts)
+
+    # After an update from the start of a period, the new weights apply exactly
+    scheduler.update_weights(UPDATED)
+    period = sum(weight for _, weight in UPDATED)
+    counts = run(scheduler, args.threads, period * args.periods)
+    ok &= check("updated picks", counts, Counter({key: weight * args.periods for key, weight in UPDATED}))
+
+    # Updates racing with the picks must neither fail nor pick a removed item
+    stop = threading.Event()
+
+    def updater() -> None:
+        while not stop.is_set():
+            scheduler.update_weights(DATA)
+            scheduler.update_weights(UPDATED)
+
+    t = threading.Thread(target=updater)
+    t.start()
+    try:
+        counts = run(scheduler, args.threads, 10 * args.periods)
+    finally:
+        stop.set()
+        t.join()
+    known = {key for key, _ in DATA + UPDATED}
+    racing_ok = sum(counts.values()) == 10 * args.periods and set(counts) <= known
+    print(f"racing updates: {'ok' if racing_ok else 'FAILED'} {dict(counts)}")
+    ok &= racing_ok
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compare tokens/sec of the legacy line-based TGI stream parser with llm.sse.
+
+Run from the application directory:
+
+    python -m benchmarks.sse_parser_benchmark --tokens 20000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from pydantic import ValidationError
+from text_generation.types import StreamResponse
+
+from llm.client import _decode_stream_event
+from llm.sse import SSEParser
+
+
+def build_stream(tokens: int) -> bytes:
+    """Build a TGI-like SSE body with `tokens` token events."""
+    events = []
+    for i in range(tokens):
+        payload = {
+            "token": {"id": i, "text": f" tok{i}", "logprob": -0.25, "special": False},
+            "generated_text": None,
+            "details": None,
+        }
+        events.append(b"data:" + json.dumps(payload).encode("utf-8") + b"\n\n")
+    return b"".join(events)
+
+
+def split_chunks(body: bytes, max_chunk: int, seed: int = 42) -> list:
+    """Split the body at random offsets, like a network would."""
+    rng = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(body):
+        size = rng.randint(1, max_chunk)
+        chunks.append(body[pos : pos + size])
+        pos += size
+    return chunks
+
+
+def legacy_parse(chunks: list) -> int:
+    """The previous parser: decode each line to str, lstrip, json.loads, pydantic."""
+    count = 0
+    for byte_payload in b"".join(chunks).splitlines():
+        if byte_payload == b"\n":
+            continue
+        payload = byte_payload.decode("utf-8")
+        if payload.startswith("data:"):
+            json_payload = json.loads(payload.lstrip("data:").rstrip("/n"))
+            try:
+                StreamResponse(**json_payload)
+            except ValidationError:
+                raise
+            count += 1
+    return count
+
+
+def new_parse(chunks: list, lite: bool) -> int:
+    count = 0
+    parser = SSEParser()
+    for chunk in chunks:
+        for data in parser.feed(chunk):
+            _decode_stream_event(data, 200, lite)
+            count += 1
+    for data in parser.flush():
+        _decode_stream_event(data, 200, lite)
+        count += 1
+    return count
+
+
+def run(name: str, fn, chunks: list, tokens: int, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    assert parsed == tokens, f"{name} parsed {parsed} of {tokens} tokens"
+    print(f"{name:<16} {tokens / best:>14,.0f} tokens/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--max-chunk", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = split_chunks(build_stream(args.tokens), args.max_chunk)
+    run("legacy", legacy_parse, chunks, args.tokens, args.repeat)
+    run("sse full", lambda c: new_parse(c, lite=False), chunks, args.tokens, args.repeat)
+    run("sse lite", lambda c: new_parse(c, lite=True), chunks, args.tokens, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
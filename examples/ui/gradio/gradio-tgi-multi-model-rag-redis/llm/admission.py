@@ -0,0 +1,251 @@
+"""Client-side admission control per inference endpoint.
+
+Limits the number of requests in flight to an endpoint and the tokens they
+may hold in its KV cache (prompt plus `max_new_tokens`). Requests that cannot
+be admitted wait in a bounded FIFO queue, or are rejected right away
+depending on the configured policy.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+
+from langchain.callbacks.base import AsyncCallbackHandler
+
+from llm.metrics import (
+    ADMISSION_INFLIGHT_GAUGE,
+    ADMISSION_QUEUED_GAUGE,
+    ADMISSION_REJECTED_COUNTER,
+)
+
+WAIT = "wait"
+REJECT = "reject"
+
+# Rough number of characters per token, used when no tokenizer is at hand
+CHARS_PER_TOKEN = 4
+
+
+class AdmissionError(Exception):
+    """Request was not admitted to the inference endpoint."""
+
+
+class AdmissionQueueFullError(AdmissionError):
+    """The local queue of the endpoint is full."""
+
+
+class AdmissionTimeoutError(AdmissionError):
+    """The request waited longer than the queue timeout."""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class AdmissionController:
+    """Admit requests to one endpoint within concurrency and token limits.
+
+    Requests wait without blocking the event loop, and the slots may be
+    released from any thread: a waiter is handed its slot on its own loop.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_concurrency: Optional[int] = None,
+        max_inflight_tokens: Optional[int] = None,
+        max_queue: int = 64,
+        queue_timeout: float = 60.0,
+        policy: str = WAIT,
+    ) -> None:
+        self.endpoint = endpoint
+        self.inflight = 0
+        self.inflight_tokens = 0
+        # (loop, future, tokens) of the waiting requests, in arrival order
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self.configure(max_concurrency, max_inflight_tokens, max_queue, queue_timeout, policy)
+
+    def configure(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_inflight_tokens: Optional[int] = None,
+        max_queue: int = 64,
+        queue_timeout: float = 60.0,
+        policy: str = WAIT,
+    ) -> None:
+        """Change the limits, the requests in flight and waiting are kept."""
+        if policy not in (WAIT, REJECT):
+            raise ValueError(f"Unknown admission policy {policy}")
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.max_inflight_tokens = max_inflight_tokens
+            self.max_queue = max_queue
+            self.queue_timeout = queue_timeout
+            self.policy = policy
+            # Waiting requests may fit within higher limits
+            self._dispatch()
+
+    def _fits(self, tokens: int) -> bool:
+        if self.max_concurrency is not None and self.inflight >= self.max_concurrency:
+            return False
+        if (
+            self.max_inflight_tokens is not None
+            and self.inflight > 0
+            and self.inflight_tokens + tokens > self.max_inflight_tokens
+        ):
+            # A request larger than the budget is still admitted when the endpoint is idle
+            return False
+        return True
+
+    def _reject(self, reason: str, error: AdmissionError):
+        ADMISSION_REJECTED_COUNTER.labels(endpoint=self.endpoint, reason=reason).inc()
+        raise error
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until the request is admitted, or raise an `AdmissionError`.
+
+        Cancel the calling task to give up waiting.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._queue and self._fits(tokens):
+                self._admit(tokens)
+                return
+            if self.policy == REJECT:
+                self._reject("busy", AdmissionQueueFullError(f"{self.endpoint} is busy"))
+            if len(self._queue) >= self.max_queue:
+                self._reject("queue_full", AdmissionQueueFullError(f"{self.endpoint} queue is full"))
+            waiter = (loop, loop.create_future(), tokens)
+            self._queue.append(waiter)
+            ADMISSION_QUEUED_GAUGE.labels(endpoint=self.endpoint).set(len(self._queue))
+        try:
+            # Shielded, the future tells below whether the slot was handed over
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+                    ADMISSION_QUEUED_GAUGE.labels(endpoint=self.endpoint).set(len(self._queue))
+                    # The next request in line may fit now
+                    self._dispatch()
+            if not waiter[1].cancel():
+                # The slot was handed over just before, give it back
+                self.release(tokens)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(
+                "timeout",
+                AdmissionTimeoutError(f"Waited more than {self.queue_timeout}s for {self.endpoint}"),
+            )
+
+    def _admit(self, tokens: int) -> None:
+        self.inflight += 1
+        self.inflight_tokens += tokens
+        ADMISSION_INFLIGHT_GAUGE.labels(endpoint=self.endpoint).set(self.inflight)
+
+    def _dispatch(self) -> None:
+        # Admit the requests at the head of the queue while they fit, with the lock held
+        while self._queue and self._fits(self._queue[0][2]):
+            loop, future, tokens = self._queue.popleft()
+            self._admit(tokens)
+            loop.call_soon_threadsafe(self._hand_over, future, tokens)
+        ADMISSION_QUEUED_GAUGE.labels(endpoint=self.endpoint).set(len(self._queue))
+
+    def _hand_over(self, future: asyncio.Future, tokens: int) -> None:
+        # Runs on the loop of the waiting request
+        if future.done():
+            # It gave up waiting meanwhile
+            self.release(tokens)
+        else:
+            future.set_result(None)
+
+    def release(self, tokens: int) -> None:
+        with self._lock:
+            self.inflight -= 1
+            self.inflight_tokens -= tokens
+            ADMISSION_INFLIGHT_GAUGE.labels(endpoint=self.endpoint).set(self.inflight)
+            self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tokens: int):
+        await self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release(tokens)
+
+
+class AdmissionCallback(AsyncCallbackHandler):
+    """Callback handler gating LLM runs through an `AdmissionController`.
+
+    The run is admitted in `on_llm_start`/`on_chat_model_start`, which waits
+    on the event loop while the run is queued, and released when the run ends
+    or fails. Cancelling the run while it waits gives up its place.
+    `on_admitted` is called with the run id once the run is admitted.
+    """
+
+    raise_error = True
+
+    def __init__(
+        self,
+        controller: AdmissionController,
+        max_new_tokens: int,
+        on_admitted: Optional[Callable[[UUID], None]] = None,
+    ) -> None:
+        self.controller = controller
+        self.max_new_tokens = max_new_tokens
+        self.on_admitted = on_admitted
+        self._runs: Dict[UUID, int] = {}
+        self._lock = threading.Lock()
+
+    async def _start(self, run_id: UUID, texts: List[str]) -> None:
+        tokens = sum(estimate_tokens(text) + self.max_new_tokens for text in texts)
+        await self.controller.acquire(tokens)
+        with self._lock:
+            self._runs[run_id] = tokens
+        if self.on_admitted is not None:
+            self.on_admitted(run_id)
+
+    def _end(self, run_id: UUID) -> None:
+        with self._lock:
+            tokens = self._runs.pop(run_id, None)
+        if tokens is not None:
+            self.controller.release(tokens)
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        await self._start(run_id, prompts)
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        await self._start(run_id, ["".join(str(m.content) for m in batch) for batch in messages])
+
+    async def on_llm_end(self, *args: Any, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    async def on_llm_error(self, *args: Any, run_id: UUID, **kwargs: Any) -> None:
+        # Also called when the run is cancelled once admitted
+        self._end(run_id)
+
+
+_controllers_lock = threading.Lock()
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(endpoint: str, admission: Optional[dict]) -> Optional[AdmissionController]:
+    """Return the shared controller of an endpoint, or None when no limits are configured.
+
+    The limits of an existing controller are updated to `admission`, the
+    configuration may have changed since it was created.
+    """
+    if not admission:
+        return None
+    with _controllers_lock:
+        controller = _controllers.get(endpoint)
+        if controller is None:
+            controller = AdmissionController(endpoint, **admission)
+            _controllers[endpoint] = controller
+        else:
+            controller.configure(**admission)
+        return controller
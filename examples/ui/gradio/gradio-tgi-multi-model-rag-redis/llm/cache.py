@@ -0,0 +1,298 @@
+"""Response cache for deterministic LLM calls.
+
+Responses are keyed by provider, model, fully rendered prompt and sampling
+parameters, and stored as the list of streamed tokens so a cache hit is
+replayed to the callbacks token by token, like a live generation.
+
+Configured with environment variables:
+    LLM_CACHE: "none" (default), "memory" or "redis" (uses REDIS_URL)
+    LLM_CACHE_TTL: seconds an entry is kept, defaults to 3600
+    LLM_CACHE_MAX_ENTRIES: size of the in-process LRU, defaults to 256
+    LLM_CACHE_MAX_TEMPERATURE: highest temperature considered deterministic, defaults to 0.05
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing, closing
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from llm.metrics import RESPONSE_CACHE_COUNTER
+
+MEMORY = "memory"
+REDIS = "redis"
+
+# Sampling parameters that change the generated text, when the LLM has them
+SAMPLING_PARAMS = [
+    "temperature",
+    "top_k",
+    "top_p",
+    "typical_p",
+    "repetition_penalty",
+    "frequency_penalty",
+    "presence_penalty",
+    "max_new_tokens",
+    "max_tokens",
+    "do_sample",
+    "seed",
+    "stop_sequences",
+    "truncate",
+]
+
+
+def make_cache_key(provider: str, model: str, prompt: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"provider": provider, "model": model, "prompt": prompt, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU cache with a TTL and a maximum number of entries."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, tokens = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return tokens
+
+    def set(self, key: str, tokens: List[str]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, tokens)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisResponseCache:
+    """Response cache shared by every replica through Redis."""
+
+    prefix = "llm-response-cache:"
+
+    def __init__(self, url: str, ttl: float = 3600) -> None:
+        import redis
+
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            print(f"Response cache lookup failed: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, tokens: List[str]) -> None:
+        try:
+            self.client.set(self.prefix + key, json.dumps(tokens), ex=int(self.ttl))
+        except Exception as e:
+            print(f"Response cache update failed: {e}")
+
+
+def get_response_cache():
+    """Create the response cache selected by the LLM_CACHE environment variable."""
+    backend = os.getenv("LLM_CACHE", "none").lower()
+    ttl = float(os.getenv("LLM_CACHE_TTL", 3600))
+    if backend == MEMORY:
+        return ResponseCache(int(os.getenv("LLM_CACHE_MAX_ENTRIES", 256)), ttl)
+    if backend == REDIS:
+        url = os.getenv("REDIS_URL")
+        if url is None:
+            raise ValueError("REDIS_URL is not specified")
+        return RedisResponseCache(url, ttl)
+    return None
+
+
+class CachedLLM(LLM):
+    """Wrap an LLM or chat model and serve deterministic requests from a response cache.
+
+    The wrapped LLM is called outside of the wrapper run, so only the wrapper
+    reports tokens to the streaming callbacks of the request, both for live
+    generations and for replayed cache hits, so the UI behaves the same.
+    Replayed tokens are reported with `cached=True`, for the callbacks
+    measuring the backend.
+    """
+
+    llm: Any
+    """Wrapped LangChain LLM or chat model"""
+    provider: str
+    model: str
+    response_cache: Any
+    max_temperature: float = 0.05
+    """Requests sampled above this temperature bypass the cache"""
+
+    @classmethod
+    def wrap(cls, llm: Any, provider: str, model: str, response_cache: Any) -> "CachedLLM":
+        return cls(
+            llm=llm,
+            provider=provider,
+            model=model,
+            response_cache=response_cache,
+            max_temperature=float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", 0.05)),
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "cached_" + self.llm._llm_type
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"provider": self.provider, "model": self.model, **self._sampling_params()}
+
+    def _sampling_params(self) -> Dict[str, Any]:
+        return {
+            name: getattr(self.llm, name)
+            for name in SAMPLING_PARAMS
+            if getattr(self.llm, name, None) is not None
+        }
+
+    def _is_deterministic(self, params: Dict[str, Any]) -> bool:
+        if params.get("do_sample"):
+            return False
+        temperature = params.get("temperature")
+        return temperature is None or temperature <= self.max_temperature
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(
+            chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs)
+        )
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        params = {**self._sampling_params(), **kwargs, "stop": stop}
+        if not self._is_deterministic(params):
+            RESPONSE_CACHE_COUNTER.labels(result="bypass").inc()
+            yield from self._generate_stream(prompt, stop, run_manager, **kwargs)
+            return
+
+        key = make_cache_key(self.provider, self.model, prompt, params)
+        tokens = self.response_cache.get(key)
+        if tokens is not None:
+            RESPONSE_CACHE_COUNTER.labels(result="hit").inc()
+            for token in tokens:
+                chunk = GenerationChunk(text=token)
+                yield chunk
+                if run_manager:
+                    run_manager.on_llm_new_token(token, cached=True)
+            return
+
+        RESPONSE_CACHE_COUNTER.labels(result="miss").inc()
+        tokens = []
+        for chunk in self._generate_stream(prompt, stop, run_manager, **kwargs):
+            tokens.append(chunk.text)
+            yield chunk
+        # Only complete generations are cached, not cancelled or failed ones
+        self.response_cache.set(key, tokens)
+
+    def _generate_stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]],
+        run_manager: Optional[CallbackManagerForLLMRun],
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        with closing(iter(self.llm.stream(prompt, stop=stop, **kwargs))) as stream:
+            for part in stream:
+                # LLMs stream strings, chat models stream message chunks
+                text = part if isinstance(part, str) else part.content
+                if not text:
+                    continue
+                chunk = GenerationChunk(text=text)
+                yield chunk
+                if run_manager:
+                    run_manager.on_llm_new_token(text)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(
+            [chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)]
+        )
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        params = {**self._sampling_params(), **kwargs, "stop": stop}
+        if not self._is_deterministic(params):
+            RESPONSE_CACHE_COUNTER.labels(result="bypass").inc()
+            async for chunk in self._agenerate_stream(prompt, stop, run_manager, **kwargs):
+                yield chunk
+            return
+
+        key = make_cache_key(self.provider, self.model, prompt, params)
+        # The Redis cache does network I/O, keep it off the event loop
+        tokens = await asyncio.to_thread(self.response_cache.get, key)
+        if tokens is not None:
+            RESPONSE_CACHE_COUNTER.labels(result="hit").inc()
+            for token in tokens:
+                chunk = GenerationChunk(text=token)
+                yield chunk
+                if run_manager:
+                    await run_manager.on_llm_new_token(token, cached=True)
+            return
+
+        RESPONSE_CACHE_COUNTER.labels(result="miss").inc()
+        tokens = []
+        async for chunk in self._agenerate_stream(prompt, stop, run_manager, **kwargs):
+            tokens.append(chunk.text)
+            yield chunk
+        await asyncio.to_thread(self.response_cache.set, key, tokens)
+
+    async def _agenerate_stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]],
+        run_manager: Optional[AsyncCallbackManagerForLLMRun],
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        async with aclosing(self.llm.astream(prompt, stop=stop, **kwargs)) as stream:
+            async for part in stream:
+                text = part if isinstance(part, str) else part.content
+                if not text:
+                    continue
+                chunk = GenerationChunk(text=text)
+                yield chunk
+                if run_manager:
+                    await run_manager.on_llm_new_token(text)
@@ -1,9 +1,11 @@
-import json
+import asyncio
 import requests
+import weakref
 
-from aiohttp import ClientSession, ClientTimeout
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from pydantic import ValidationError
-from typing import Dict, Optional, List, AsyncIterator, Iterator
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Optional, List, AsyncIterator, Iterator, Tuple, Union
 
 from text_generation.types import (
     StreamResponse,
@@ -13,6 +15,57 @@ from text_generation.types import (
 )
 from text_generation.errors import parse_error
 
+from llm.hedging import HedgePolicy, ahedged_stream, hedged_stream
+from llm.latency import StreamTimer
+from llm.sse import SSEParser, StreamToken, iter_sse_data, loads
+
+# Connection pool defaults shared by Client and AsyncClient
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+
+
+def create_session(
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+) -> requests.Session:
+    """
+    Create a `requests.Session` backed by a keep-alive connection pool
+
+    Args:
+        pool_connections (`int`):
+            Number of per-host connection pools to cache
+        pool_maxsize (`int`):
+            Maximum number of connections kept alive per host
+
+    Returns:
+        requests.Session: pooled session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.verify = False
+    return session
+
+
+def _decode_stream_event(
+    data: bytes, status: int, lite: bool
+) -> Union[StreamResponse, StreamToken]:
+    """Decode the data of one stream event into a token"""
+    payload = loads(data)
+    if lite:
+        token = payload.get("token")
+        if token is None:
+            # Error payloads do not carry a token
+            raise parse_error(status, payload)
+        return StreamToken(token["id"], token["text"], token["special"])
+    try:
+        return StreamResponse(**payload)
+    except ValidationError:
+        # If we failed to parse the payload, then it is an error payload
+        raise parse_error(status, payload)
+
 
 class Client:
     """Client to make calls to a text-generation-inference instance
@@ -41,6 +94,10 @@ class Client:
         headers: Optional[Dict[str, str]] = None,
         cookies: Optional[Dict[str, str]] = None,
         timeout: int = 10,
+        session: Optional[requests.Session] = None,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        hedge_policy: Optional[HedgePolicy] = None,
+        model_id: Optional[str] = None,
     ):
         """
         Args:
@@ -52,11 +109,34 @@ class Client:
                 Cookies to include in the requests
             timeout (`int`):
                 Timeout in seconds
+            session (`Optional[requests.Session]`):
+                Pooled session to reuse. When not provided, the client creates and owns one
+            pool_maxsize (`int`):
+                Maximum number of keep-alive connections to the inference server
+            hedge_policy (`Optional[HedgePolicy]`):
+                When set, streams are hedged to the policy alternate URLs if the first token is late
+            model_id (`Optional[str]`):
+                Model served by the instance, used to label the streaming latency metrics
         """
         self.base_url = base_url
         self.headers = headers
         self.cookies = cookies
         self.timeout = timeout
+        self._owns_session = session is None
+        self.session = session if session is not None else create_session(pool_maxsize=pool_maxsize)
+        self.hedge_policy = hedge_policy
+        self.model_id = model_id
+
+    def close(self):
+        """Close the underlying session if it is owned by this client"""
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def generate(
         self,
@@ -141,13 +221,12 @@ class Client:
         )
         request = Request(inputs=prompt, stream=False, parameters=parameters)
 
-        resp = requests.post(
+        resp = self.session.post(
             self.base_url,
             json=request.dict(),
             headers=self.headers,
             cookies=self.cookies,
             timeout=self.timeout,
-            verify=False,
         )
         payload = resp.json()
         if resp.status_code != 200:
@@ -170,7 +249,8 @@ class Client:
         typical_p: Optional[float] = None,
         watermark: bool = False,
         top_n_tokens: Optional[int] = None,
-    ) -> Iterator[StreamResponse]:
+        lite: bool = False,
+    ) -> Iterator[Union[StreamResponse, StreamToken]]:
         """
         Given a prompt, generate the following stream of tokens
 
@@ -206,9 +286,11 @@ class Client:
                 Watermarking with [A Watermark for Large Language Models](https://arxiv.org/abs/2301.10226)
             top_n_tokens (`int`):
                 Return the `n` most likely tokens at each step
+            lite (`bool`):
+                Yield `StreamToken` tuples (id, text, special) without pydantic validation
 
         Returns:
-            Iterator[StreamResponse]: stream of generated tokens
+            Iterator[Union[StreamResponse, StreamToken]]: stream of generated tokens
         """
         # Validate parameters
         parameters = Parameters(
@@ -230,39 +312,51 @@ class Client:
             top_n_tokens=top_n_tokens,
         )
         request = Request(inputs=prompt, stream=True, parameters=parameters)
-
-        resp = requests.post(
-            self.base_url,
-            json=request.dict(),
+        payload = request.dict()
+
+        if self.hedge_policy is None:
+            yield from self._post_stream(self.base_url, payload, lite)
+        else:
+            yield from hedged_stream(
+                lambda attempt: self._post_stream(attempt.url, payload, lite, attempt.on_cancel),
+                self.base_url,
+                self.hedge_policy,
+            )
+
+    def _post_stream(
+        self,
+        url: str,
+        payload: Dict,
+        lite: bool,
+        on_open: Optional[Callable[[Callable[[], None]], None]] = None,
+    ) -> Iterator[Union[StreamResponse, StreamToken]]:
+        timer = StreamTimer(url, self.model_id)
+        resp = self.session.post(
+            url,
+            json=payload,
             headers=self.headers,
             cookies=self.cookies,
             timeout=self.timeout,
             stream=True,
-            verify=False,
         )
-
-        if resp.status_code != 200:
-            raise parse_error(resp.status_code, resp.json())
-
-        # Parse ServerSentEvents
-        for byte_payload in resp.iter_lines():
-            # Skip line
-            if byte_payload == b"\n":
-                continue
-
-            payload = byte_payload.decode("utf-8")
-
-            # Event data
-            if payload.startswith("data:"):
-                # Decode payload
-                json_payload = json.loads(payload.lstrip("data:").rstrip("/n"))
-                # Parse payload
-                try:
-                    response = StreamResponse(**json_payload)
-                except ValidationError:
-                    # If we failed to parse the payload, then it is an error payload
-                    raise parse_error(resp.status_code, json_payload)
+        timer.connected()
+        if on_open is not None:
+            # Lets a hedged call abort this request from another thread
+            on_open(resp.close)
+
+        try:
+            if resp.status_code != 200:
+                raise parse_error(resp.status_code, resp.json())
+
+            # Parse ServerSentEvents incrementally on raw bytes
+            for data in iter_sse_data(resp.iter_content(chunk_size=None)):
+                response = _decode_stream_event(data, resp.status_code, lite)
+                timer.token()
                 yield response
+        finally:
+            timer.finish()
+            # Release the connection back to the pool even if the consumer stops early
+            resp.close()
 
 
 class AsyncClient:
@@ -293,6 +387,11 @@ class AsyncClient:
         headers: Optional[Dict[str, str]] = None,
         cookies: Optional[Dict[str, str]] = None,
         timeout: int = 10,
+        limit: int = 100,
+        limit_per_host: int = DEFAULT_POOL_MAXSIZE,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+        hedge_policy: Optional[HedgePolicy] = None,
+        model_id: Optional[str] = None,
     ):
         """
         Args:
@@ -304,11 +403,68 @@ class AsyncClient:
                 Cookies to include in the requests
             timeout (`int`):
                 Timeout in seconds
+            limit (`int`):
+                Total number of simultaneous connections in the pool
+            limit_per_host (`int`):
+                Number of simultaneous connections to the same endpoint
+            keepalive_timeout (`float`):
+                Seconds an idle connection is kept open for reuse
+            hedge_policy (`Optional[HedgePolicy]`):
+                When set, streams are hedged to the policy alternate URLs if the first token is late
+            model_id (`Optional[str]`):
+                Model served by the instance, used to label the streaming latency metrics
         """
         self.base_url = base_url
         self.headers = headers
         self.cookies = cookies
         self.timeout = ClientTimeout(timeout * 60)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.hedge_policy = hedge_policy
+        self.model_id = model_id
+        # aiohttp sessions are bound to the loop they were created on, so keep one per loop
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ClientSession]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _get_session(self) -> ClientSession:
+        """Return the pooled session of the running event loop, creating it lazily"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            session = ClientSession(
+                headers=self.headers,
+                cookies=self.cookies,
+                timeout=self.timeout,
+                connector=connector,
+            )
+            self._sessions[loop] = session
+        return session
+
+    def close_sessions(self):
+        """Close the pooled sessions of every event loop, from any thread"""
+        for loop, session in list(self._sessions.items()):
+            if not session.closed and loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+        self._sessions.clear()
+
+    async def close(self):
+        """Close the pooled session of the running event loop"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
 
     async def generate(
         self,
@@ -393,15 +549,13 @@ class AsyncClient:
         )
         request = Request(inputs=prompt, stream=False, parameters=parameters)
 
-        async with ClientSession(
-            headers=self.headers, cookies=self.cookies, timeout=self.timeout
-        ) as session:
-            async with session.post(self.base_url, json=request.dict()) as resp:
-                payload = await resp.json()
+        session = self._get_session()
+        async with session.post(self.base_url, json=request.dict()) as resp:
+            payload = await resp.json()
 
-                if resp.status != 200:
-                    raise parse_error(resp.status, payload)
-                return Response(**payload[0])
+            if resp.status != 200:
+                raise parse_error(resp.status, payload)
+            return Response(**payload[0])
 
     async def generate_stream(
         self,
@@ -419,7 +573,8 @@ class AsyncClient:
         typical_p: Optional[float] = None,
         watermark: bool = False,
         top_n_tokens: Optional[int] = None,
-    ) -> AsyncIterator[StreamResponse]:
+        lite: bool = False,
+    ) -> AsyncIterator[Union[StreamResponse, StreamToken]]:
         """
         Given a prompt, generate the following stream of tokens asynchronously
 
@@ -455,9 +610,11 @@ class AsyncClient:
                 Watermarking with [A Watermark for Large Language Models](https://arxiv.org/abs/2301.10226)
             top_n_tokens (`int`):
                 Return the `n` most likely tokens at each step
+            lite (`bool`):
+                Yield `StreamToken` tuples (id, text, special) without pydantic validation
 
         Returns:
-            AsyncIterator[StreamResponse]: stream of generated tokens
+            AsyncIterator[Union[StreamResponse, StreamToken]]: stream of generated tokens
         """
         # Validate parameters
         parameters = Parameters(
@@ -479,30 +636,125 @@ class AsyncClient:
             top_n_tokens=top_n_tokens,
         )
         request = Request(inputs=prompt, stream=True, parameters=parameters)
-
-        async with ClientSession(
-            headers=self.headers, cookies=self.cookies, timeout=self.timeout
-        ) as session:
-            async with session.post(self.base_url, json=request.dict()) as resp:
+        payload = request.dict()
+
+        if self.hedge_policy is None:
+            stream = self._post_stream(self.base_url, payload, lite)
+        else:
+            stream = ahedged_stream(
+                lambda url: self._post_stream(url, payload, lite),
+                self.base_url,
+                self.hedge_policy,
+            )
+        async for response in stream:
+            yield response
+
+    async def _post_stream(
+        self, url: str, payload: Dict, lite: bool
+    ) -> AsyncIterator[Union[StreamResponse, StreamToken]]:
+        session = self._get_session()
+        timer = StreamTimer(url, self.model_id)
+        try:
+            async with session.post(url, json=payload) as resp:
+                timer.connected()
                 if resp.status != 200:
                     raise parse_error(resp.status, await resp.json())
 
-                # Parse ServerSentEvents
-                async for byte_payload in resp.content:
-                    # Skip line
-                    if byte_payload == b"\n":
-                        continue
-
-                    payload = byte_payload.decode("utf-8")
-
-                    # Event data
-                    if payload.startswith("data:"):
-                        # Decode payload
-                        json_payload = json.loads(payload.lstrip("data:").rstrip("/n"))
-                        # Parse payload
-                        try:
-                            response = StreamResponse(**json_payload)
-                        except ValidationError:
-                            # If we failed to parse the payload, then it is an error payload
-                            raise parse_error(resp.status, json_payload)
+                # Parse ServerSentEvents incrementally on raw bytes
+                parser = SSEParser()
+                async for chunk in resp.content.iter_any():
+                    for data in parser.feed(chunk):
+                        response = _decode_stream_event(data, resp.status, lite)
+                        timer.token()
                         yield response
+                for data in parser.flush():
+                    response = _decode_stream_event(data, resp.status, lite)
+                    timer.token()
+                    yield response
+        finally:
+            timer.finish()
+
+    async def generate_batch(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        **kwargs,
+    ) -> List[Union[Response, Exception]]:
+        """
+        Generate the completion of several prompts concurrently over the pooled session
+
+        Args:
+            prompts (`List[str]`):
+                Input texts
+            max_concurrency (`int`):
+                Maximum number of requests in flight at the same time
+            kwargs:
+                Generation parameters forwarded to `generate`
+
+        Returns:
+            List[Union[Response, Exception]]: one entry per prompt, in input order. A failed
+            request is returned as its exception instead of failing the whole batch
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _generate(prompt: str) -> Union[Response, Exception]:
+            async with semaphore:
+                try:
+                    return await self.generate(prompt, **kwargs)
+                except Exception as e:
+                    return e
+
+        return await asyncio.gather(*[_generate(prompt) for prompt in prompts])
+
+    async def generate_stream_many(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        **kwargs,
+    ) -> AsyncIterator[Tuple[int, Union[StreamResponse, StreamToken, Exception]]]:
+        """
+        Stream the completion of several prompts concurrently over the pooled session
+
+        Args:
+            prompts (`List[str]`):
+                Input texts
+            max_concurrency (`int`):
+                Maximum number of streams open at the same time
+            kwargs:
+                Generation parameters forwarded to `generate_stream`
+
+        Returns:
+            AsyncIterator[Tuple[int, Union[StreamResponse, StreamToken, Exception]]]: tokens of
+            all streams as they arrive, tagged with the index of their prompt. A failed stream
+            yields its exception once and ends
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def _stream(index: int, prompt: str):
+            async with semaphore:
+                try:
+                    async for response in self.generate_stream(prompt, **kwargs):
+                        await queue.put((index, response))
+                except Exception as e:
+                    await queue.put((index, e))
+                finally:
+                    await queue.put((index, done))
+
+        tasks = [
+            asyncio.create_task(_stream(index, prompt))
+            for index, prompt in enumerate(prompts)
+        ]
+        try:
+            remaining = len(tasks)
+            while remaining > 0:
+                index, item = await queue.get()
+                if item is done:
+                    remaining -= 1
+                    continue
+                yield index, item
+        finally:
+            # Stop the producers if the consumer went away early
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,115 @@
+"""Concurrency limits per "provider: model".
+
+Replaces the process wide generation lock: each backend gets its own number
+of generation slots, so requests to different backends run in parallel while
+a single model server is not flooded by the pod.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+
+from llm.metrics import (
+    CONCURRENCY_LIMIT_GAUGE,
+    CONCURRENCY_IN_USE_GAUGE,
+    CONCURRENCY_WAITING_GAUGE,
+)
+
+class _Slots:
+    def __init__(self) -> None:
+        self.in_use = 0
+        self.waiting = 0
+        # Futures of the coroutines waiting for a slot, with their event loop
+        self.async_waiters: deque = deque()
+
+
+class ConcurrencyManager:
+    """Generation slots keyed on the "provider: model" string.
+
+    `limit_for` returns the current limit of a key. It is read every time a
+    slot is requested, so limits changed in the configuration apply to the
+    next requests without rebuilding the manager.
+    """
+
+    def __init__(self, limit_for: Callable[[str], int]) -> None:
+        self.limit_for = limit_for
+        self._slots: Dict[str, _Slots] = {}
+        self._lock = threading.Lock()
+
+    def _limit(self, key: str) -> int:
+        limit = max(1, int(self.limit_for(key)))
+        CONCURRENCY_LIMIT_GAUGE.labels(provider_model=key).set(limit)
+        return limit
+
+    async def aacquire(self, key: str) -> None:
+        """Wait for a free slot of `key` without blocking the event loop.
+
+        Cancel the calling task to give up waiting.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._slots.setdefault(key, _Slots())
+            if not slots.async_waiters and slots.in_use < self._limit(key):
+                self._take(key, slots)
+                return
+            future = loop.create_future()
+            slots.async_waiters.append((loop, future))
+            slots.waiting += 1
+            CONCURRENCY_WAITING_GAUGE.labels(provider_model=key).set(slots.waiting)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, future) in slots.async_waiters:
+                    slots.async_waiters.remove((loop, future))
+                    slots.waiting -= 1
+                    CONCURRENCY_WAITING_GAUGE.labels(provider_model=key).set(slots.waiting)
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release(key)
+            raise
+
+    def _take(self, key: str, slots: _Slots) -> None:
+        slots.in_use += 1
+        CONCURRENCY_IN_USE_GAUGE.labels(provider_model=key).set(slots.in_use)
+
+    def _hand_over(self, key: str, future: asyncio.Future) -> None:
+        # Runs on the loop of the waiting coroutine
+        if future.cancelled():
+            self.release(key)
+        else:
+            future.set_result(None)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            slots = self._slots[key]
+            slots.in_use -= 1
+            if slots.async_waiters and slots.in_use < self._limit(key):
+                # Hand the slot over to the first waiting coroutine
+                loop, future = slots.async_waiters.popleft()
+                slots.waiting -= 1
+                CONCURRENCY_WAITING_GAUGE.labels(provider_model=key).set(slots.waiting)
+                self._take(key, slots)
+                loop.call_soon_threadsafe(self._hand_over, key, future)
+            CONCURRENCY_IN_USE_GAUGE.labels(provider_model=key).set(slots.in_use)
+
+    @asynccontextmanager
+    async def aslot(self, key: str):
+        await self.aacquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def in_use(self, key: str) -> int:
+        with self._lock:
+            slots = self._slots.get(key)
+            return slots.in_use if slots is not None else 0
+
+    def outstanding(self, key: str) -> int:
+        """Generations of `key` running or waiting for a slot."""
+        with self._lock:
+            slots = self._slots.get(key)
+            return slots.in_use + slots.waiting if slots is not None else 0
@@ -0,0 +1,66 @@
+"""Which generation errors may be retried on another model.
+
+A generation that failed before its first token can be sent to the next
+candidate if the failure belongs to the backend: it could not be reached,
+timed out, is overloaded or answered with a server error. Errors about the
+request itself, such as a prompt rejected by validation, would fail on any
+backend and are not retried.
+"""
+
+from typing import Optional
+
+import aiohttp
+import httpx
+import openai
+import requests
+from text_generation import errors as tgi_errors
+
+from llm.admission import AdmissionError
+
+# Raised by the clients of the providers when the backend is unreachable,
+# too slow or overloaded
+RETRIABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    AdmissionError,
+    aiohttp.ClientConnectionError,
+    httpx.TransportError,
+    requests.ConnectionError,
+    requests.Timeout,
+    openai.APIConnectionError,
+    tgi_errors.OverloadedError,
+    tgi_errors.RateLimitExceededError,
+    tgi_errors.ShardNotReadyError,
+    tgi_errors.ShardTimeoutError,
+    # TGI answers 5xx errors without a known type with it
+    tgi_errors.UnknownError,
+)
+
+# HTTP statuses worth another backend: timeout, too many requests
+RETRIABLE_STATUSES = (408, 429)
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of the response `error` was raised for, if any."""
+    for value in (
+        getattr(error, "status_code", None),
+        getattr(error, "status", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retriable(error: BaseException) -> bool:
+    """Whether `error`, or an error it was raised from, is a failure of the backend."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, RETRIABLE_ERRORS):
+            return True
+        status = status_code(error)
+        if status is not None:
+            return status in RETRIABLE_STATUSES or status >= 500
+        error = error.__cause__ or error.__context__
+    return False
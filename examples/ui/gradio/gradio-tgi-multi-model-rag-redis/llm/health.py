@@ -0,0 +1,93 @@
+"""Active health checks of the configured models.
+
+A background thread probes every enabled "provider: model" at a fixed
+interval: `/health` (then `/info`) on TGI, `/models` under the OpenAI
+compatible base URL of the other providers. Failing probes open the circuit
+breaker of the model, a probe succeeding on an open one lets a trial request
+through. Only the live requests close it.
+"""
+
+import threading
+from typing import Optional
+
+import httpx
+
+from llm.llm_factory import HUGGING_FACE
+from utils import config_loader
+from utils.circuit_breaker import get_circuit_breaker
+
+# Seconds before a probe is considered failed
+PROBE_TIMEOUT = 5.0
+
+
+def probe_urls(provider: str, url: str) -> list:
+    """URLs probed for a model of `provider` served at `url`, in order."""
+    url = url.rstrip("/")
+    if provider == HUGGING_FACE:
+        return [f"{url}/health", f"{url}/info"]
+    return [f"{url}/models"]
+
+
+def probe(client: httpx.Client, provider: str, url: str, credentials: Optional[str] = None) -> Optional[str]:
+    """Probe a model endpoint, return None if healthy or the reason it is not."""
+    headers = {"Authorization": f"Bearer {credentials}"} if credentials else {}
+    error = None
+    for probe_url in probe_urls(provider, url):
+        try:
+            response = client.get(probe_url, headers=headers)
+        except httpx.HTTPError as e:
+            return f"{probe_url}: {e!r}"
+        if response.is_success:
+            return None
+        error = f"{probe_url}: HTTP {response.status_code}"
+        if response.status_code != 404:
+            break
+    return error
+
+
+class HealthChecker:
+    """Probe the enabled models every `interval` seconds from a daemon thread."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check_all(self, client: httpx.Client) -> None:
+        for provider_model in config_loader.get_provider_model_list(include_unavailable=True):
+            try:
+                provider_name, model_name = provider_model.split(": ", 1)
+                provider_cfg, model_cfg = config_loader.get_provider_model(provider_name, model_name)
+                url = model_cfg.url or provider_cfg.url
+                if not url:
+                    continue
+                credentials = model_cfg.credentials or provider_cfg.credentials
+            except Exception as e:
+                # The model may be deleted from the configuration meanwhile
+                print(f"Health check of {provider_model} skipped: {e}")
+                continue
+            error = probe(client, provider_name, url, credentials)
+            breaker = get_circuit_breaker(provider_model)
+            if error is None:
+                breaker.record_success(health_check=True)
+            else:
+                breaker.record_failure(error, health_check=True)
+
+    def _run(self) -> None:
+        with httpx.Client(timeout=PROBE_TIMEOUT, verify=False) as client:
+            while not self._stop.is_set():
+                try:
+                    self.check_all(client)
+                except Exception as e:
+                    # The configuration may change while it is read, retry on the next round
+                    print(f"Health check failed: {e}")
+                self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="health-checker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
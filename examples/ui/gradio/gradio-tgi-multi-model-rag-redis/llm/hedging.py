@@ -0,0 +1,428 @@
+"""Hedged requests across inference replicas.
+
+A hedged request is sent to the primary URL first. When its first token has
+not arrived after a delay derived from recent time-to-first-token (TTFT)
+samples, a duplicate is sent to an alternate URL. Whichever stream starts
+first is kept and the other one is cancelled. An error, or a non-2xx answer
+of the transports, is not a start: the other attempt keeps running.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from queue import Empty, Queue
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+import httpx
+
+from llm.metrics import HEDGE_FIRED_COUNTER, HEDGE_WON_COUNTER
+
+_END = object()
+
+
+class HedgePolicy:
+    """Hedge delay and counters of one inference endpoint.
+
+    The delay is the configured percentile of the last `window` TTFT samples,
+    clamped between `min_delay` and `max_delay`. Until `min_samples` have been
+    recorded, `initial_delay` is used.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        alternate_urls: List[str],
+        percentile: float = 95,
+        initial_delay: float = 2.0,
+        min_delay: float = 0.05,
+        max_delay: float = 30.0,
+        window: int = 200,
+        min_samples: int = 20,
+    ) -> None:
+        self.endpoint = endpoint
+        self.alternate_urls = list(alternate_urls)
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.fired = 0
+        self.won = 0
+        self._samples: deque = deque(maxlen=window)
+        self._alternates = itertools.cycle(self.alternate_urls)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, endpoint: str, alternate_urls: List[str], hedge: dict) -> "HedgePolicy":
+        """Build a policy from the `hedge` section of a model configuration."""
+        settings = {k: v for k, v in hedge.items() if k != "enabled"}
+        return cls(endpoint, alternate_urls, **settings)
+
+    def delay(self) -> float:
+        """Seconds to wait for the first token before hedging."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.initial_delay
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, samples[index]))
+
+    def record(self, ttft: float) -> None:
+        """Record the time-to-first-token of a request."""
+        with self._lock:
+            self._samples.append(ttft)
+
+    def next_alternate(self) -> str:
+        with self._lock:
+            return next(self._alternates)
+
+    def hedge_fired(self) -> None:
+        with self._lock:
+            self.fired += 1
+        HEDGE_FIRED_COUNTER.labels(endpoint=self.endpoint).inc()
+
+    def hedge_won(self) -> None:
+        with self._lock:
+            self.won += 1
+        HEDGE_WON_COUNTER.labels(endpoint=self.endpoint).inc()
+
+
+_policies_lock = threading.Lock()
+_policies: dict = {}
+
+
+def get_hedge_policy(endpoint: str, alternate_urls: List[str], hedge: Optional[dict]) -> Optional[HedgePolicy]:
+    """Return the shared policy of an endpoint, or None when hedging is disabled."""
+    if not hedge or not hedge.get("enabled", False) or not alternate_urls:
+        return None
+    with _policies_lock:
+        policy = _policies.get(endpoint)
+        if policy is None:
+            policy = HedgePolicy.from_config(endpoint, alternate_urls, hedge)
+            _policies[endpoint] = policy
+        return policy
+
+
+class HedgeAttempt:
+    """One of the racing requests of a hedged call.
+
+    The opener passed to `hedged_stream` receives the attempt and must register
+    a way to abort its request with `on_cancel` as soon as it has one.
+    """
+
+    def __init__(self, index: int, url: str) -> None:
+        self.index = index
+        self.url = url
+        self.first: Any = None
+        self.rest: Optional[Iterator] = None
+        self.error: Optional[BaseException] = None
+        self._cancelled = False
+        self._closers: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, closer: Callable[[], None]) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._closers.append(closer)
+                return
+        closer()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            try:
+                closer()
+            except Exception:
+                pass
+
+
+def _run_attempt(attempt: HedgeAttempt, opener: Callable, done: Queue) -> None:
+    try:
+        stream = opener(attempt)
+        attempt.first = next(stream, _END)
+        attempt.rest = stream
+        attempt.on_cancel(stream.close)
+    except BaseException as e:
+        attempt.error = e
+    done.put(attempt)
+
+
+def hedged_stream(
+    opener: Callable[[HedgeAttempt], Iterator], primary_url: str, policy: HedgePolicy
+) -> Iterator:
+    """Stream from `primary_url`, hedging to an alternate URL when the first item is late.
+
+    Args:
+        opener: Opens the stream of an attempt (`attempt.url`) and returns an iterator
+        primary_url: URL of the first attempt
+        policy: Hedge policy of the endpoint
+
+    Returns:
+        Iterator: items of the stream that produced its first item first
+    """
+    done: Queue = Queue()
+    start = time.perf_counter()
+    attempts = [HedgeAttempt(0, primary_url)]
+    threading.Thread(target=_run_attempt, args=(attempts[0], opener, done), daemon=True).start()
+
+    winner: Optional[HedgeAttempt] = None
+    failed: List[HedgeAttempt] = []
+    timeout: Optional[float] = policy.delay()
+    while winner is None:
+        try:
+            attempt = done.get(timeout=timeout)
+        except Empty:
+            # First token is late: send the duplicate request
+            policy.hedge_fired()
+            hedge = HedgeAttempt(1, policy.next_alternate())
+            attempts.append(hedge)
+            threading.Thread(target=_run_attempt, args=(hedge, opener, done), daemon=True).start()
+            timeout = None
+            continue
+        if attempt.error is None:
+            winner = attempt
+            continue
+        failed.append(attempt)
+        if len(failed) == len(attempts):
+            # Every attempt started so far failed, report the primary error
+            raise failed[0].error
+
+    policy.record(time.perf_counter() - start)
+    if winner.index > 0:
+        policy.hedge_won()
+    for attempt in attempts:
+        if attempt is not winner:
+            attempt.cancel()
+
+    try:
+        if winner.first is _END:
+            return
+        yield winner.first
+        yield from winner.rest
+    finally:
+        winner.cancel()
+
+
+async def ahedged_stream(
+    opener: Callable[[str], AsyncIterator], primary_url: str, policy: HedgePolicy
+) -> AsyncIterator:
+    """Async version of `hedged_stream`, the attempts are tasks of the running loop.
+
+    Args:
+        opener: Opens the stream of an attempt to the given URL and returns an async iterator
+        primary_url: URL of the first attempt
+        policy: Hedge policy of the endpoint
+
+    Returns:
+        AsyncIterator: items of the stream that produced its first item first
+    """
+    start = time.perf_counter()
+
+    async def first(url: str):
+        stream = opener(url)
+        try:
+            return await stream.__anext__(), stream
+        except StopAsyncIteration:
+            return _END, stream
+
+    primary = asyncio.create_task(first(primary_url))
+    tasks = [primary]
+    try:
+        await asyncio.wait(tasks, timeout=policy.delay())
+        if not primary.done():
+            # First token is late: send the duplicate request
+            policy.hedge_fired()
+            tasks.append(asyncio.create_task(first(policy.next_alternate())))
+
+        winner = None
+        while winner is None:
+            succeeded = [t for t in tasks if t.done() and t.exception() is None]
+            if succeeded:
+                winner = succeeded[0]
+                break
+            pending = [t for t in tasks if not t.done()]
+            if not pending:
+                # Every attempt failed, report the primary error
+                raise primary.exception()
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    policy.record(time.perf_counter() - start)
+    if winner is not primary:
+        policy.hedge_won()
+    for task in tasks:
+        if task is winner:
+            continue
+        if not task.done():
+            task.cancel()
+        elif task.exception() is None:
+            await task.result()[1].aclose()
+
+    item, stream = winner.result()
+    try:
+        if item is _END:
+            return
+        yield item
+        async for item in stream:
+            yield item
+    finally:
+        await stream.aclose()
+
+
+class _ErrorResponse(Exception):
+    """Non-2xx answer of an attempt: a failure for the race, returned if every attempt fails."""
+
+    def __init__(self, response: httpx.Response, body: bytes) -> None:
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+        self.body = body
+
+    def to_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            status_code=self.response.status_code,
+            headers=self.response.headers,
+            content=self.body,
+            extensions=self.response.extensions,
+            request=request,
+        )
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    """Response body read from the winning attempt of a hedged stream."""
+
+    def __init__(self, first: bytes, stream: Iterator[Tuple[httpx.Response, bytes]]) -> None:
+        self._first = first
+        self._stream = stream
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._first:
+            yield self._first
+        for _, chunk in self._stream:
+            yield chunk
+
+    def close(self) -> None:
+        # Closing the hedged stream closes the winning response
+        self._stream.close()
+
+
+class HedgingTransport(httpx.BaseTransport):
+    """httpx transport hedging requests to `base_url` across alternate replicas.
+
+    Used by OpenAI compatible providers (vLLM) through their `http_client`.
+    """
+
+    def __init__(self, base_url: str, policy: HedgePolicy, transport: Optional[httpx.BaseTransport] = None) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.policy = policy
+        self.transport = transport if transport is not None else httpx.HTTPTransport(verify=False)
+
+    def _request_for(self, request: httpx.Request, url: str) -> httpx.Request:
+        if url == self.base_url:
+            return request
+        headers = request.headers.copy()
+        headers.pop("host", None)
+        target = url.rstrip("/") + str(request.url)[len(self.base_url):]
+        return httpx.Request(request.method, target, headers=headers, content=request.content)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or not str(request.url).startswith(self.base_url):
+            return self.transport.handle_request(request)
+
+        def opener(attempt: HedgeAttempt) -> Iterator[Tuple[httpx.Response, bytes]]:
+            response = self.transport.handle_request(self._request_for(request, attempt.url))
+            attempt.on_cancel(response.close)
+            if not response.is_success:
+                # A fast error must not win the race against a slow answer
+                try:
+                    raise _ErrorResponse(response, b"".join(response.stream))
+                finally:
+                    response.close()
+            body = iter(response.stream)
+            yield response, next(body, b"")
+            yield from ((response, chunk) for chunk in body)
+
+        stream = hedged_stream(opener, self.base_url, self.policy)
+        try:
+            response, first = next(stream)
+        except _ErrorResponse as e:
+            return e.to_response(request)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReplayStream(first, stream),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    """Response body read from the winning attempt of an async hedged stream."""
+
+    def __init__(self, first: bytes, stream: AsyncIterator[Tuple[httpx.Response, bytes]]) -> None:
+        self._first = first
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._first:
+            yield self._first
+        async for _, chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class AsyncHedgingTransport(httpx.AsyncBaseTransport):
+    """Async version of `HedgingTransport`, for the `http_async_client` of the providers."""
+
+    def __init__(
+        self, base_url: str, policy: HedgePolicy, transport: Optional[httpx.AsyncBaseTransport] = None
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.policy = policy
+        self.transport = transport if transport is not None else httpx.AsyncHTTPTransport(verify=False)
+
+    _request_for = HedgingTransport._request_for
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or not str(request.url).startswith(self.base_url):
+            return await self.transport.handle_async_request(request)
+
+        async def opener(url: str) -> AsyncIterator[Tuple[httpx.Response, bytes]]:
+            response = await self.transport.handle_async_request(self._request_for(request, url))
+            try:
+                if not response.is_success:
+                    # A fast error must not win the race against a slow answer
+                    raise _ErrorResponse(response, b"".join([chunk async for chunk in response.stream]))
+                body = response.stream.__aiter__()
+                yield response, await anext(body, b"")
+                async for chunk in body:
+                    yield response, chunk
+            finally:
+                await response.aclose()
+
+        stream = ahedged_stream(opener, self.base_url, self.policy)
+        try:
+            response, first = await stream.__anext__()
+        except _ErrorResponse as e:
+            return e.to_response(request)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_AsyncReplayStream(first, stream),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -10,11 +10,11 @@ from llm.llm_provider import LLMProvider
 
 class HuggingFaceProvider(LLMProvider):
   
-  def __init__(self, provider, model, params):
-    super().__init__(provider, model, params)
+  def __init__(self, provider, model, params, llm_config=None):
+    super().__init__(provider, model, params, llm_config)
     pass
 
-  def _tgi_llm_instance(self, callback) -> LLM:
+  def _tgi_llm_instance(self, callback=None) -> LLM:
     """Note: TGI does not support specifying the model, it is an instance per model."""
     print(
         f"[{inspect.stack()[0][3]}] Creating Hugging Face TGI LLM instance"
@@ -31,7 +31,7 @@ class HuggingFaceProvider(LLMProvider):
     params: dict = {
         "inference_server_url": self._get_llm_url(""),
 #         "model_kwargs": {},  # TODO: add model args
-#          "max_new_tokens": 512,
+        "max_new_tokens": self._get_max_new_tokens(),
         "cache": None,
         "temperature": 0.01,
         "top_k": 10,
@@ -39,8 +39,13 @@ class HuggingFaceProvider(LLMProvider):
         "repetition_penalty": 1.03,
         "streaming": True,
         "verbose": False,
-        "callbacks": [callback]
+        # The TGI client records the streaming latency metrics itself
+        "callbacks": self._get_callbacks(callback, measure_latency=False),
+        "server_kwargs": {"model_id": self.model},
     }
+    hedge_policy = self._get_hedge_policy("")
+    if hedge_policy is not None:
+        params["server_kwargs"]["hedge_policy"] = hedge_policy
       # if self.model_config.params:
       #   params.update(self.model_config.params)  # override parameters
     self._llm_instance = HuggingFaceTextGenInference(**params)
@@ -51,5 +56,5 @@ class HuggingFaceProvider(LLMProvider):
 
     return self._llm_instance
 
-  def get_llm(self, callback) -> LLM:
+  def get_llm(self, callback=None) -> LLM:
     return self._tgi_llm_instance(callback)
@@ -1,5 +1,8 @@
+import asyncio
 import logging
-from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import threading
+from contextlib import aclosing, closing
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from langchain_core._api.deprecation import deprecated
 from langchain_core.callbacks import (
@@ -11,9 +14,46 @@ from langchain_core.outputs import GenerationChunk
 from langchain_core.pydantic_v1 import Extra, Field, root_validator
 from langchain_core.utils import get_pydantic_field_names
 from llm.client import AsyncClient, Client
+from llm.stop_sequences import StopSequenceMatcher, truncate_at_stop
 
 logger = logging.getLogger(__name__)
 
+# Clients are shared by every LLM instance pointing at the same server so that
+# their pooled keep-alive connections are reused across requests.
+_clients_lock = threading.Lock()
+_shared_clients: Dict[Tuple[str, int, str], Tuple[Client, AsyncClient]] = {}
+
+
+def _get_shared_clients(
+    inference_server_url: str, timeout: int, server_kwargs: Dict[str, Any]
+) -> Tuple[Client, AsyncClient]:
+    key = (inference_server_url, timeout, repr(sorted(server_kwargs.items())))
+    with _clients_lock:
+        clients = _shared_clients.get(key)
+        if clients is None:
+            clients = (
+                Client(inference_server_url, timeout=timeout, **server_kwargs),
+                AsyncClient(inference_server_url, timeout=timeout, **server_kwargs),
+            )
+            _shared_clients[key] = clients
+        return clients
+
+
+def close_shared_clients(keep_urls: Optional[Iterable[str]] = None) -> None:
+    """Close the pooled sessions of the shared clients.
+
+    With `keep_urls`, only the clients of the other servers are closed, those
+    of models removed from the configuration.
+    """
+    keep_urls = set(keep_urls or ())
+    with _clients_lock:
+        for key in list(_shared_clients):
+            if key[0] in keep_urls:
+                continue
+            client, async_client = _shared_clients.pop(key)
+            client.close()
+            async_client.close_sessions()
+
 
 @deprecated("0.0.21", removal="0.2.0", alternative="HuggingFaceEndpoint")
 class HuggingFaceTextGenInference(LLM):
@@ -136,15 +176,10 @@ class HuggingFaceTextGenInference(LLM):
         """Validate that python package exists in environment."""
 
         try:
-            values["client"] = Client(
-                values["inference_server_url"],
-                timeout=values["timeout"],
-                **values["server_kwargs"],
-            )
-            values["async_client"] = AsyncClient(
+            values["client"], values["async_client"] = _get_shared_clients(
                 values["inference_server_url"],
-                timeout=values["timeout"],
-                **values["server_kwargs"],
+                values["timeout"],
+                values["server_kwargs"],
             )
         except ImportError:
             raise ImportError(
@@ -199,13 +234,9 @@ class HuggingFaceTextGenInference(LLM):
 
         invocation_params = self._invocation_params(stop, **kwargs)
         res = self.client.generate(prompt, **invocation_params)
-        # remove stop sequences from the end of the generated text
-        for stop_seq in invocation_params["stop_sequences"]:
-            if stop_seq in res.generated_text:
-                res.generated_text = res.generated_text[
-                    : res.generated_text.index(stop_seq)
-                ]
-        return res.generated_text
+        return truncate_at_stop(
+            res.generated_text, invocation_params["stop_sequences"]
+        )
 
     async def _acall(
         self,
@@ -222,13 +253,71 @@ class HuggingFaceTextGenInference(LLM):
 
         invocation_params = self._invocation_params(stop, **kwargs)
         res = await self.async_client.generate(prompt, **invocation_params)
-        # remove stop sequences from the end of the generated text
-        for stop_seq in invocation_params["stop_sequences"]:
-            if stop_seq in res.generated_text:
-                res.generated_text = res.generated_text[
-                    : res.generated_text.index(stop_seq)
-                ]
-        return res.generated_text
+        return truncate_at_stop(
+            res.generated_text, invocation_params["stop_sequences"]
+        )
+
+    async def agenerate_batch(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[Union[str, Exception]]:
+        """Generate several prompts concurrently over the shared pooled session.
+
+        Results are returned in input order; a failed prompt is returned as its
+        exception so one error does not fail the whole batch.
+        """
+        invocation_params = self._invocation_params(stop, **kwargs)
+        responses = await self.async_client.generate_batch(
+            prompts, max_concurrency=max_concurrency, **invocation_params
+        )
+        return [
+            res
+            if isinstance(res, Exception)
+            else truncate_at_stop(
+                res.generated_text, invocation_params["stop_sequences"]
+            )
+            for res in responses
+        ]
+
+    def generate_batch(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[Union[str, Exception]]:
+        """Synchronous version of `agenerate_batch`."""
+
+        async def _run() -> List[Union[str, Exception]]:
+            try:
+                return await self.agenerate_batch(
+                    prompts, max_concurrency=max_concurrency, stop=stop, **kwargs
+                )
+            finally:
+                # The session is bound to this short-lived event loop
+                await self.async_client.close()
+
+        return asyncio.run(_run())
+
+    async def agenerate_stream_many(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Tuple[int, Union[str, Exception]]]:
+        """Stream several prompts concurrently, yielding (prompt index, token text)."""
+        invocation_params = self._invocation_params(stop, **kwargs)
+        async for index, res in self.async_client.generate_stream_many(
+            prompts, max_concurrency=max_concurrency, lite=True, **invocation_params
+        ):
+            if isinstance(res, Exception):
+                yield index, res
+            elif not res.special:
+                yield index, res.text
 
     def _stream(
         self,
@@ -239,33 +328,38 @@ class HuggingFaceTextGenInference(LLM):
     ) -> Iterator[GenerationChunk]:
         invocation_params = self._invocation_params(stop, **kwargs)
 
-        for res in self.client.generate_stream(prompt, **invocation_params):
-            # identify stop sequence in generated text, if any
-            stop_seq_found: Optional[str] = None
-            for stop_seq in invocation_params["stop_sequences"]:
-                if stop_seq in res.token.text:
-                    stop_seq_found = stop_seq
-
-            # identify text to yield
-            text: Optional[str] = None
-            if res.token.special:
-                text = None
-            elif stop_seq_found:
-                text = res.token.text[: res.token.text.index(stop_seq_found)]
-            else:
-                text = res.token.text
-
-            # yield text, if any
+        # Closing the stream aborts the upstream request, so an exception raised by a
+        # callback (e.g. the user cancelled) frees the server slot right away
+        with closing(
+            self.client.generate_stream(prompt, lite=True, **invocation_params)
+        ) as stream:
+            # text held back by the matcher may be the start of a stop sequence
+            # split over several tokens
+            matcher = StopSequenceMatcher(invocation_params["stop_sequences"])
+            stopped = False
+            for res in stream:
+                if res.special:
+                    continue
+                text, stopped = matcher.feed(res.text)
+
+                # yield text, if any
+                if text:
+                    chunk = GenerationChunk(text=text)
+                    yield chunk
+                    if run_manager:
+                        run_manager.on_llm_new_token(chunk.text)
+
+                # stop as soon as a stop sequence completes, closing the upstream stream
+                if stopped:
+                    break
+
+            text = matcher.flush() if not stopped else ""
             if text:
                 chunk = GenerationChunk(text=text)
                 yield chunk
                 if run_manager:
                     run_manager.on_llm_new_token(chunk.text)
 
-            # break if stop sequence found
-            if stop_seq_found:
-                break
-
     async def _astream(
         self,
         prompt: str,
@@ -275,29 +369,30 @@ class HuggingFaceTextGenInference(LLM):
     ) -> AsyncIterator[GenerationChunk]:
         invocation_params = self._invocation_params(stop, **kwargs)
 
-        async for res in self.async_client.generate_stream(prompt, **invocation_params):
-            # identify stop sequence in generated text, if any
-            stop_seq_found: Optional[str] = None
-            for stop_seq in invocation_params["stop_sequences"]:
-                if stop_seq in res.token.text:
-                    stop_seq_found = stop_seq
-
-            # identify text to yield
-            text: Optional[str] = None
-            if res.token.special:
-                text = None
-            elif stop_seq_found:
-                text = res.token.text[: res.token.text.index(stop_seq_found)]
-            else:
-                text = res.token.text
-
-            # yield text, if any
+        async with aclosing(
+            self.async_client.generate_stream(prompt, lite=True, **invocation_params)
+        ) as stream:
+            matcher = StopSequenceMatcher(invocation_params["stop_sequences"])
+            stopped = False
+            async for res in stream:
+                if res.special:
+                    continue
+                text, stopped = matcher.feed(res.text)
+
+                # yield text, if any
+                if text:
+                    chunk = GenerationChunk(text=text)
+                    yield chunk
+                    if run_manager:
+                        await run_manager.on_llm_new_token(chunk.text)
+
+                # stop as soon as a stop sequence completes, closing the upstream stream
+                if stopped:
+                    break
+
+            text = matcher.flush() if not stopped else ""
             if text:
                 chunk = GenerationChunk(text=text)
                 yield chunk
                 if run_manager:
                     await run_manager.on_llm_new_token(chunk.text)
-
-            # break if stop sequence found
-            if stop_seq_found:
-                break
@@ -0,0 +1,147 @@
+"""Streaming latency instrumentation, exported as Prometheus histograms.
+
+`StreamTimer` measures one streamed generation. The TGI client drives it
+directly from its SSE loop; for the OpenAI compatible providers it is driven by
+`LatencyCallback` from the LangChain run events, and the connect time comes
+from httpx event hooks on their HTTP clients (see `connect_time_hooks`).
+"""
+
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from llm.metrics import (
+    STREAM_CONNECT_HISTOGRAM,
+    STREAM_INTER_TOKEN_HISTOGRAM,
+    STREAM_TOKENS_HISTOGRAM,
+    STREAM_TOKENS_PER_SECOND_HISTOGRAM,
+    STREAM_TTFT_HISTOGRAM,
+)
+
+UNKNOWN_MODEL = "unknown"
+
+
+class StreamTimer:
+    """Record connect time, TTFT, inter-token latency and decode speed of a stream."""
+
+    def __init__(self, endpoint: str, model: Optional[str] = None) -> None:
+        self.labels = {"endpoint": endpoint, "model": model or UNKNOWN_MODEL}
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.tokens = 0
+        self._finished = False
+
+    def connected(self) -> None:
+        STREAM_CONNECT_HISTOGRAM.labels(**self.labels).observe(time.perf_counter() - self.start)
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+            STREAM_TTFT_HISTOGRAM.labels(**self.labels).observe(now - self.start)
+        else:
+            STREAM_INTER_TOKEN_HISTOGRAM.labels(**self.labels).observe(now - self.last_token)
+        self.last_token = now
+        self.tokens += 1
+
+    def finish(self) -> None:
+        """Record the totals of the stream, once, if it produced any token."""
+        if self._finished or not self.tokens:
+            return
+        self._finished = True
+        STREAM_TOKENS_HISTOGRAM.labels(**self.labels).observe(self.tokens)
+        decode_time = self.last_token - self.first_token
+        if self.tokens > 1 and decode_time > 0:
+            STREAM_TOKENS_PER_SECOND_HISTOGRAM.labels(**self.labels).observe(
+                (self.tokens - 1) / decode_time
+            )
+
+
+class LatencyCallback(BaseCallbackHandler):
+    """Callback handler timing the streamed tokens of the LLM runs of one endpoint.
+
+    The admission callback calls `admitted` once a queued run is let through,
+    so the time spent waiting for admission is not counted in the time to
+    first token, whichever handler runs first.
+    """
+
+    # Cheap and non-blocking, so async runs call it on the event loop, not in an executor
+    run_inline = True
+
+    def __init__(self, endpoint: str, model: str) -> None:
+        self.endpoint = endpoint
+        self.model = model
+        self._timers: Dict[UUID, StreamTimer] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID) -> None:
+        with self._lock:
+            self._timers[run_id] = StreamTimer(self.endpoint, self.model)
+
+    def admitted(self, run_id: UUID) -> None:
+        """Start the clock of a run again once the admission control let it through."""
+        with self._lock:
+            timer = self._timers.get(run_id)
+            if timer is not None and timer.first_token is None:
+                timer.start = time.perf_counter()
+
+    def _end(self, run_id: UUID) -> None:
+        with self._lock:
+            timer = self._timers.pop(run_id, None)
+        if timer is not None:
+            timer.finish()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        timer = self._timers.get(run_id)
+        if timer is not None and token:
+            timer.token()
+
+    def on_llm_end(self, *args: Any, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_llm_error(self, *args: Any, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+
+def connect_time_hooks(endpoint: str, model: str, asynchronous: bool = False) -> Dict[str, list]:
+    """httpx `event_hooks` recording the time until the response headers arrive.
+
+    Response hooks run before the body is read, so for a streaming request
+    this is the connection and server queueing time, without the generation.
+    Set `asynchronous` for an `httpx.AsyncClient`, which awaits its hooks.
+    """
+    started: "weakref.WeakKeyDictionary[Any, StreamTimer]" = weakref.WeakKeyDictionary()
+
+    def on_request(request) -> None:
+        started[request] = StreamTimer(endpoint, model)
+
+    def on_response(response) -> None:
+        timer = started.pop(response.request, None)
+        if timer is not None:
+            timer.connected()
+
+    hooks = {"request": [on_request], "response": [on_response]}
+    return async_event_hooks(hooks) if asynchronous else hooks
+
+
+def async_event_hooks(event_hooks: Dict[str, list]) -> Dict[str, list]:
+    """Wrap synchronous httpx event hooks for an `httpx.AsyncClient`."""
+
+    def wrap(hook):
+        async def async_hook(arg) -> None:
+            hook(arg)
+
+        return async_hook
+
+    return {event: [wrap(hook) for hook in hooks] for event, hooks in event_hooks.items()}
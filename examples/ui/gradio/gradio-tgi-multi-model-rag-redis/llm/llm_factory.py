@@ -1,5 +1,8 @@
-from typing import Tuple
+import threading
+from typing import Callable, Optional, Tuple
+from llm.cache import CachedLLM, get_response_cache
 from llm.huggingface_provider import HuggingFaceProvider
+from llm.huggingface_text_gen_inference import close_shared_clients
 from llm.llm_provider import LLMProvider
 from llm.nemo_provider import NeMoProvider
 from llm.openai_provider import OpenAIProvider
@@ -15,25 +18,42 @@ OPENSHIFT_AI_VLLM="OpenShift AI (vLLM)"
 class LLMFactory:
     _providers: dict[str, LLMProvider] = {}
     def __init__(self):
-        pass
+        self._response_cache = get_response_cache()
+        # LLM instances per provider and model, and chains per provider, model and chain type.
+        # Streaming callbacks are given per request through the run config.
+        self._llms: dict[str, LLM] = {}
+        self._chains: dict[Tuple[str, str], object] = {}
+        self._lock = threading.Lock()
 
     def _create_key(self, provider, model):
         return f"{provider}:{model}"
     
-    def init_providers(self, config):
-        self._providers = {}
-        providers = config.llm_providers.providers
-        for provider_name in providers:
-            provider_cfg = providers[provider_name]
-            for model_name in provider_cfg.models:
-                model_cfg = provider_cfg.models[model_name]
-                self._register_llm_provider(config, provider_cfg.name, model_cfg.name)
-
+    def init_providers(self, config, on_swap: Optional[Callable[[], None]] = None):
+        """(Re)create the providers from the configuration, dropping the cached LLMs and chains.
 
-    def _register_llm_provider(self, config, provider, model):
-        print(provider)
-        key = self._create_key(provider, model)
-        self._providers[key] = self._create_llm_provider(config, provider, model)
+        The new providers are built first and swapped in at once under the
+        lock, it may be called from another thread than the requests.
+        `on_swap` is called under the lock too, to swap in the state going
+        with the providers (the configuration, the scheduler).
+        """
+        providers = {}
+        for provider_cfg in config.llm_providers.providers.values():
+            for model_name in provider_cfg.models:
+                print(provider_cfg.name)
+                key = self._create_key(provider_cfg.name, model_name)
+                providers[key] = self._create_llm_provider(config, provider_cfg.name, model_name)
+        with self._lock:
+            self._providers = providers
+            self._llms = {}
+            self._chains = {}
+            if on_swap is not None:
+                on_swap()
+        # The pooled connections of the TGI servers no model uses anymore are closed
+        close_shared_clients(
+            provider._get_llm_url("")
+            for provider in providers.values()
+            if isinstance(provider, HuggingFaceProvider)
+        )
 
     def _get_NeMo_Provider(self, config, provider, model):
         if model.startswith("Remote-"):
@@ -41,26 +61,61 @@ class LLMFactory:
             provider_cfg = config.llm_providers.providers[provider]
             for model_name in provider_cfg.models:
                 if model_name.lower() == local_model.lower():
-                    return NeMoProvider(provider, model_name, None)
-        return NeMoProvider(provider, model, None)
+                    return NeMoProvider(provider, model_name, None, config.llm_providers)
+        return NeMoProvider(provider, model, None, config.llm_providers)
     
     def _create_llm_provider(self, config, provider, model) -> LLMProvider:
         if provider == OPENAI:
-            return OpenAIProvider(provider, model, None)
+            return OpenAIProvider(provider, model, None, config.llm_providers)
         elif provider == NVIDIA:
             return self._get_NeMo_Provider(config, provider, model)
         elif provider == HUGGING_FACE:
-            return HuggingFaceProvider(provider, model, None)
+            return HuggingFaceProvider(provider, model, None, config.llm_providers)
         elif provider == OPENSHIFT_AI_VLLM:
-            return OpenShiftAIvLLM(provider, model, None)
+            return OpenShiftAIvLLM(provider, model, None, config.llm_providers)
         else:
             raise ValueError(provider, model)
         
-    def get_llm(self, provider, model, callback) -> LLM:
+    def get_llm(self, provider, model) -> LLM:
+        """Shared LLM instance of a provider and model, built on first use."""
         key = self._create_key(provider, model)
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = self._create_llm(key)
+                self._llms[key] = llm
+            return llm
+
+    def _create_llm(self, key) -> LLM:
         provider = self._providers[key]
         if provider is not None:
-            return provider.get_llm(callback)
+            llm = provider.get_llm()
+            if self._response_cache is not None:
+                llm = CachedLLM.wrap(
+                    llm, provider.provider, provider.model, self._response_cache
+                )
+            return llm
+
+    def get_chain(self, provider, model, chain_without_llm: Callable[..., object]):
+        """Shared chain built by `chain_without_llm` around the LLM of a provider and model.
+
+        It is also given the prompt packer of the model, None when the model
+        has no context window configured.
+        """
+        key = (self._create_key(provider, model), chain_without_llm.__name__)
+        with self._lock:
+            chains = self._chains
+            chain = chains.get(key)
+            provider_instance = self._providers[key[0]]
+        if chain is None:
+            # Built outside the lock, it may connect to the vector database
+            packer = provider_instance.get_prompt_packer()
+            chain = chain_without_llm(self.get_llm(provider, model), packer=packer)
+            with self._lock:
+                # Not kept if the providers were replaced meanwhile
+                if self._chains is chains:
+                    chain = chains.setdefault(key, chain)
+        return chain
 
     @classmethod 
     def get_providers(cls) -> list:
@@ -4,7 +4,11 @@ from typing import Optional, Tuple
 from utils import config_loader
 from langchain.llms.base import LLM
 
-from utils.config import ProviderConfig
+from llm.admission import AdmissionCallback, get_admission_controller
+from llm.hedging import HedgePolicy, get_hedge_policy
+from llm.latency import LatencyCallback, connect_time_hooks
+from llm.prompt_packer import PromptPacker
+from utils.config import LLMProviders, ProviderConfig
 
 class LLMConfigurationError(Exception):
     """LLM configuration is wrong."""
@@ -30,16 +34,26 @@ class ModelConfigInvalidError(LLMConfigurationError):
     """Model configuration is not valid."""
 
 
+DEFAULT_MAX_NEW_TOKENS = 512
+
+
 class LLMProvider:
     """Load LLM backend.
     """
     _llm_instance: Optional [LLM] = None
+    _admission_callback: Optional[AdmissionCallback] = None
+    _latency_callback: Optional[LatencyCallback] = None
+    _prompt_packer: Optional[PromptPacker] = None
+    # Tokens generated at most unless the model params set max_new_tokens
+    default_max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS
     def __init__(
         self,
         provider: Optional[str] = None,
         model: Optional[str] = None,
         params: Optional[dict] = None,
+        llm_config: Optional[LLMProviders] = None,
     ) -> None:
+        """`llm_config` is the providers configuration to read, the current one by default."""
         if provider is None:
             msg = "Missing provider"
             print(msg)
@@ -50,12 +64,13 @@ class LLMProvider:
             print(msg)
             raise MissingModelError(msg)
         self.model = model
+        self.llm_config = llm_config if llm_config is not None else config_loader.llm_config
         self.provider_config = self._get_provider_config()
         self.model_config = self.provider_config.models.get(self.model)
 
     
     def _get_provider_config(self) -> ProviderConfig:
-        cfg = config_loader.llm_config.providers.get(self.provider)
+        cfg = self.llm_config.providers.get(self.provider)
         if not cfg:
             msg = f"Unsupported LLM provider {self.provider}"
             print(msg)
@@ -71,8 +86,56 @@ class LLMProvider:
             raise ModelConfigMissingError(msg)
         return cfg
 
-    def get_llm(self, callback) -> LLM:
+    def get_llm(self, callback=None) -> LLM:
       return None, None
+
+    def get_prompt_packer(self) -> Optional[PromptPacker]:
+        """Packer fitting the prompts in the context window of the model,
+        None unless `context_window` is configured for it."""
+        if self._prompt_packer is None and self.model_config.context_window:
+            self._prompt_packer = PromptPacker(
+                f"{self.provider}: {self.model}",
+                self.model_config.tokenizer or self.model,
+                int(self.model_config.context_window),
+                self._get_max_new_tokens(),
+            )
+        return self._prompt_packer
+
+    def _get_max_new_tokens(self) -> int:
+        """Tokens generated at most, the one limit given to the LLM instance,
+        the admission control and the prompt packer."""
+        params = getattr(self.model_config, "params", None) or {}
+        return int(params.get("max_new_tokens", params.get("max_tokens", self.default_max_new_tokens)))
+
+    def _get_callbacks(self, callback=None, default_url: str = "", measure_latency: bool = True) -> list:
+        """Callbacks of the LLM instance: the streaming callback if any (it is
+        usually given per request in the run config instead), the endpoint
+        admission control when limits are configured for the model, and the
+        streaming latency metrics unless the client records them itself.
+        The latency clock starts again when the run is admitted, so the
+        admission queueing is not counted in the time to first token."""
+        if measure_latency and self._latency_callback is None:
+            self._latency_callback = LatencyCallback(self._get_llm_url(default_url), self.model)
+        if self._admission_callback is None:
+            controller = get_admission_controller(
+                self._get_llm_url(default_url), self.model_config.admission
+            )
+            if controller is not None:
+                self._admission_callback = AdmissionCallback(
+                    controller,
+                    self._get_max_new_tokens(),
+                    self._latency_callback.admitted if measure_latency else None,
+                )
+        callbacks = [callback] if callback is not None else []
+        if self._admission_callback is not None:
+            callbacks.append(self._admission_callback)
+        if measure_latency:
+            callbacks.append(self._latency_callback)
+        return callbacks
+
+    def _get_event_hooks(self, default_url: str = "", asynchronous: bool = False) -> dict:
+        """httpx event hooks recording the connect time of the model endpoint."""
+        return connect_time_hooks(self._get_llm_url(default_url), self.model, asynchronous)
     
     def _get_llm_url(self, default: str) -> str:
         return (
@@ -85,6 +148,14 @@ class LLMProvider:
             )
         )
 
+    def _get_hedge_policy(self, default: str) -> Optional[HedgePolicy]:
+        """Hedge policy of the model endpoint, None unless hedging is enabled in config.yaml."""
+        return get_hedge_policy(
+            self._get_llm_url(default),
+            self.model_config.alternate_urls,
+            self.model_config.hedge,
+        )
+
     def _get_llm_credentials(self) -> str:
         return (
             self.provider_config.models[self.model].credentials
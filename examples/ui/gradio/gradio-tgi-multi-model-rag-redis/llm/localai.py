@@ -1,7 +1,9 @@
 from typing import Any, Dict
 from langchain_openai import ChatOpenAI
 
-class ChatOpenAILocal(ChatOpenAI):
+from llm.openai_compatible import StopSequenceMixin
+
+class ChatOpenAILocal(StopSequenceMixin, ChatOpenAI):
     @property
     def _default_params(self) -> Dict[str, Any]:
         """Get the default parameters for calling OpenAI API."""
@@ -14,4 +16,4 @@ class ChatOpenAILocal(ChatOpenAI):
         }
         if self.max_tokens is not None:
             params["max_tokens"] = self.max_tokens
-        return params
\ No newline at end of file
+        return params
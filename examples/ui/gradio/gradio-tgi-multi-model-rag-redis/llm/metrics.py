@@ -0,0 +1,88 @@
+"""Prometheus metrics recorded by the LLM client layer.
+
+They are registered on the default registry, so they are exported by the
+metrics server started in app.py.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+HEDGE_FIRED_COUNTER = Counter(
+    "llm_hedge_fired", "Number of hedged duplicate requests sent", ["endpoint"]
+)
+HEDGE_WON_COUNTER = Counter(
+    "llm_hedge_won", "Number of hedged requests that answered first", ["endpoint"]
+)
+
+ADMISSION_INFLIGHT_GAUGE = Gauge(
+    "llm_admission_inflight_requests", "Requests admitted to an endpoint and in flight", ["endpoint"]
+)
+ADMISSION_QUEUED_GAUGE = Gauge(
+    "llm_admission_queued_requests", "Requests waiting for admission to an endpoint", ["endpoint"]
+)
+ADMISSION_REJECTED_COUNTER = Counter(
+    "llm_admission_rejected", "Requests rejected by admission control", ["endpoint", "reason"]
+)
+
+RESPONSE_CACHE_COUNTER = Counter(
+    "llm_response_cache", "LLM response cache lookups by result (hit, miss, bypass)", ["result"]
+)
+
+# Streaming latency, per endpoint and model. Time to first token includes the
+# queueing and prefill on the server, inter-token latency is the decode speed.
+STREAM_CONNECT_HISTOGRAM = Histogram(
+    "llm_stream_connect_seconds",
+    "Time until the response headers of a streaming request are received",
+    ["endpoint", "model"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+STREAM_TTFT_HISTOGRAM = Histogram(
+    "llm_stream_time_to_first_token_seconds",
+    "Time from the request until the first generated token",
+    ["endpoint", "model"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+STREAM_INTER_TOKEN_HISTOGRAM = Histogram(
+    "llm_stream_inter_token_seconds",
+    "Time between two consecutive generated tokens",
+    ["endpoint", "model"],
+    buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1, 2.5),
+)
+STREAM_TOKENS_PER_SECOND_HISTOGRAM = Histogram(
+    "llm_stream_tokens_per_second",
+    "Decode speed of a generation, from its first to its last token",
+    ["endpoint", "model"],
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 40, 60, 80, 100, 150, 200),
+)
+STREAM_TOKENS_HISTOGRAM = Histogram(
+    "llm_stream_tokens",
+    "Number of tokens streamed by a generation",
+    ["endpoint", "model"],
+    buckets=(1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+
+CONCURRENCY_LIMIT_GAUGE = Gauge(
+    "llm_concurrency_slots", "Generation slots of a provider and model", ["provider_model"]
+)
+CONCURRENCY_IN_USE_GAUGE = Gauge(
+    "llm_concurrency_slots_in_use", "Generation slots in use for a provider and model", ["provider_model"]
+)
+CONCURRENCY_WAITING_GAUGE = Gauge(
+    "llm_concurrency_waiting_requests", "Requests waiting for a generation slot", ["provider_model"]
+)
+
+# Prompt packing, per "provider: model": prompt tokens removed to fit the
+# context window, and the prompts packed by action taken.
+PROMPT_TOKENS_SAVED_COUNTER = Counter(
+    "llm_prompt_tokens_saved", "Prompt tokens removed to fit the context window", ["provider_model"]
+)
+PROMPT_PACKING_COUNTER = Counter(
+    "llm_prompt_packing",
+    "Prompts packed by action (fit, packed, dropped_documents, trimmed_document, trimmed_text)",
+    ["provider_model", "action"],
+)
+
+# Generation attempts per "provider: model" by outcome: ok, failover when it
+# failed before its first token and was retried on another model, error otherwise.
+FAILOVER_ATTEMPTS_COUNTER = Counter(
+    "llm_generation_attempts", "Generation attempts by outcome (ok, failover, error)", ["provider_model", "outcome"]
+)
@@ -2,6 +2,7 @@ from typing import Optional, Tuple
 import inspect
 from langchain.llms.base import LLM
 from openai import AsyncOpenAI
+from llm.latency import async_event_hooks
 from llm.llm_provider import LLMProvider
 from queue import Queue
 import os
@@ -26,16 +27,17 @@ def log_response(response):
     print(f"Response event hook: {request.method} {request.url} - Status {response.status_code}")
 
 class NeMoProvider(LLMProvider):
-  def __init__(self, provider, model, params):
-    super().__init__(provider, model, params)
+  def __init__(self, provider, model, params, llm_config=None):
+    super().__init__(provider, model, params, llm_config)
     pass
 
-  def _nemo_llm_instance(self, callback) -> LLM:
+  def _nemo_llm_instance(self, callback=None) -> LLM:
     print(f"[{inspect.stack()[0][3]}] Creating OpenAI LLM instance")
     try:
       from langchain.chat_models import ChatOpenAI
       from openai import OpenAI
       from llm.localai import ChatOpenAILocal
+      from llm.openai_compatible import ChatOpenAIWithStops
     except Exception as e:
       print(
           "Missing openai libraries. Openai provider will be unavailable."
@@ -55,36 +57,46 @@ class NeMoProvider(LLMProvider):
         "cache": None,
         "streaming": True,
         "temperature": 0.01,
-        "max_tokens": 512,
+        "max_tokens": self._get_max_new_tokens(),
         #"top_p": 0.95,
         "verbose": True,
-        "callbacks": [callback]
+        "callbacks": self._get_callbacks(callback)
     }
     # if self.model_config.params:
     #   params.update(self.model_config.params)
     os.environ["OPENAI_API_KEY"] =  creds
 
+    event_hooks = self._get_event_hooks()
     if self.model.startswith("Remote-"):
-      httpx_client = httpx.Client(event_hooks={'request': [log_request, update_base_url], 'response': [log_response]})
+      remote_event_hooks = {
+          'request': [log_request, update_base_url] + event_hooks['request'],
+          'response': [log_response] + event_hooks['response'],
+      }
+      httpx_client = httpx.Client(event_hooks=remote_event_hooks)
       client = OpenAI(
           base_url=self._get_llm_url(""),
           http_client=httpx_client,
       )
 
+      # AsyncOpenAI needs an async httpx client, which awaits its hooks
       async_client = AsyncOpenAI(
           base_url=self._get_llm_url(""),
-          http_client=httpx_client,
+          http_client=httpx.AsyncClient(event_hooks=async_event_hooks(remote_event_hooks)),
       )
       params["client"] = client.chat.completions
       params["async_client"] = async_client.chat.completions
       self._llm_instance = ChatOpenAILocal(**params)
     else:
-      async_client=httpx.AsyncClient(verify=False)
-      http_client=httpx.Client(verify=False)
-      self._llm_instance = ChatOpenAI(**params, async_client=async_client, http_client=http_client)
+      async_client=AsyncOpenAI(
+          base_url=params["base_url"],
+          api_key=creds,
+          http_client=httpx.AsyncClient(verify=False, event_hooks=self._get_event_hooks(asynchronous=True)),
+      ).chat.completions
+      http_client=httpx.Client(verify=False, event_hooks=event_hooks)
+      self._llm_instance = ChatOpenAIWithStops(**params, async_client=async_client, http_client=http_client)
 
     print(f"[{inspect.stack()[0][3]}] OpenAI LLM instance {self._llm_instance}")
     return self._llm_instance
 
-  def get_llm(self, callback) -> LLM:
+  def get_llm(self, callback=None) -> LLM:
     return self._nemo_llm_instance(callback)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""OpenAI compatible LLMs enforcing stop sequences client side.
+
+OpenAI, vLLM and the NeMo proxies are sent the stop sequences, but a proxy
+may drop them and a server may only stop on whole tokens. The stream is
+cut right before the first stop sequence whatever the backend does, the
+same way as for TGI.
+"""
+
+from contextlib import aclosing, closing
+from typing import Any, AsyncIterator, Iterator, List, Optional, Union
+
+from langchain_community.llms.vllm import VLLMOpenAI
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, GenerationChunk
+from langchain_openai import ChatOpenAI
+
+from llm.stop_sequences import StopSequenceMatcher
+
+Chunk = Union[ChatGenerationChunk, GenerationChunk]
+
+
+def _chunk_like(part: Optional[Chunk], text: str) -> Chunk:
+    """Chunk of the same kind as `part` with `text`, chat models stream message chunks."""
+    generation_info = part.generation_info if part is not None else None
+    if isinstance(part, ChatGenerationChunk):
+        return ChatGenerationChunk(message=AIMessageChunk(content=text), generation_info=generation_info)
+    return GenerationChunk(text=text, generation_info=generation_info)
+
+
+class StopSequenceMixin:
+    """Cut the `_stream`/`_astream` of an OpenAI compatible LLM at its stop sequences.
+
+    The parent stream runs without the run manager, the tokens are reported
+    once the matcher released them.
+    """
+
+    def _stream(
+        self,
+        prompt: Any,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[Chunk]:
+        matcher = StopSequenceMatcher(stop)
+        stopped = False
+        part = None
+        with closing(super()._stream(prompt, stop, None, **kwargs)) as stream:
+            for part in stream:
+                text, stopped = matcher.feed(part.text)
+                if text:
+                    chunk = _chunk_like(part, text)
+                    yield chunk
+                    if run_manager:
+                        run_manager.on_llm_new_token(text, chunk=chunk)
+                if stopped:
+                    break
+        text = matcher.flush() if not stopped else ""
+        if text:
+            chunk = _chunk_like(part, text)
+            yield chunk
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+
+    async def _astream(
+        self,
+        prompt: Any,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Chunk]:
+        matcher = StopSequenceMatcher(stop)
+        stopped = False
+        part = None
+        async with aclosing(super()._astream(prompt, stop, None, **kwargs)) as stream:
+            async for part in stream:
+                text, stopped = matcher.feed(part.text)
+                if text:
+                    chunk = _chunk_like(part, text)
+                    yield chunk
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text, chunk=chunk)
+                if stopped:
+                    break
+        text = matcher.flush() if not stopped else ""
+        if text:
+            chunk = _chunk_like(part, text)
+            yield chunk
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+
+
+class ChatOpenAIWithStops(StopSequenceMixin, ChatOpenAI):
+    """ChatOpenAI (OpenAI, local NeMo) with client side stop sequences."""
+
+
+class VLLMOpenAIWithStops(StopSequenceMixin, VLLMOpenAI):
+    """VLLMOpenAI (vLLM) with client side stop sequences."""
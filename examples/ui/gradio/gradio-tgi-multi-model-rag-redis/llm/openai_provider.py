@@ -6,15 +6,15 @@ from queue import Queue
 import os
 
 class OpenAIProvider(LLMProvider):
-  def __init__(self, provider, model, params):
-    super().__init__(provider, model, params)
+  def __init__(self, provider, model, params, llm_config=None):
+    super().__init__(provider, model, params, llm_config)
     pass
 
-  def _openai_llm_instance(self, callback) -> LLM:
+  def _openai_llm_instance(self, callback=None) -> LLM:
     print(f"[{inspect.stack()[0][3]}] Creating OpenAI LLM instance")
     try:
         #from langchain.llms import OpenAI
-        from langchain_openai import ChatOpenAI
+        from llm.openai_compatible import ChatOpenAIWithStops
     except Exception as e:
         print(
             "Missing openai libraries. Openai provider will be unavailable."
@@ -31,18 +31,19 @@ class OpenAIProvider(LLMProvider):
         "cache": None,
         "streaming": True,
         "temperature": 0.01,
+        "max_tokens": self._get_max_new_tokens(),
         # "top_p": 0.95,
         "verbose": False,
-        "callbacks": [callback]
+        "callbacks": self._get_callbacks(callback, "https://api.openai.com/v1")
     }
     os.environ["OPENAI_API_KEY"] =  self._get_llm_credentials()
       # if self.model_config.params:
       #   params.update(self.model_config.params)  # override parameters
 
-    self._llm_instance = ChatOpenAI(**params)
+    self._llm_instance = ChatOpenAIWithStops(**params)
 
     print(f"[{inspect.stack()[0][3]}] OpenAI LLM instance {self._llm_instance}")
     return self._llm_instance
 
-  def get_llm(self, callback) -> LLM:
+  def get_llm(self, callback=None) -> LLM:
     return self._openai_llm_instance(callback)
@@ -2,20 +2,23 @@ from typing import Tuple
 import inspect
 from langchain.llms.base import LLM
 from openai import AsyncOpenAI
+from llm.hedging import AsyncHedgingTransport, HedgingTransport
 from llm.llm_provider import LLMProvider
 from queue import Queue
 import os
 import httpx
 
 class OpenShiftAIvLLM(LLMProvider):
-  def __init__(self, provider, model, params):
-    super().__init__(provider, model, params)
+  default_max_new_tokens = 1024
+
+  def __init__(self, provider, model, params, llm_config=None):
+    super().__init__(provider, model, params, llm_config)
     pass
 
-  def _openshift_ai_vllm_instance(self, callback) -> LLM:
+  def _openshift_ai_vllm_instance(self, callback=None) -> LLM:
     print(f"[{inspect.stack()[0][3]}] Creating OpenShift AI vLLM instance")
     try:
-      from langchain_community.llms.vllm import VLLMOpenAI
+      from llm.openai_compatible import VLLMOpenAIWithStops
     except Exception as e:
       print(
           "Missing vLLM libraries. VLLMOpenAI provider will be unavailable."
@@ -33,18 +36,36 @@ class OpenShiftAIvLLM(LLMProvider):
         "cache": None,
         "streaming": True,
         "temperature": 0.1,
-        "max_tokens": 1024,
+        "max_tokens": self._get_max_new_tokens(),
         #"top_p": 0.95,
         "verbose": True,
-        "callbacks": [callback]
+        "callbacks": self._get_callbacks(callback)
     }
     os.environ["OPENAI_API_KEY"] =  creds
-    async_client=httpx.AsyncClient(verify=False)
-    http_client=httpx.Client(verify=False)
-    self._llm_instance = VLLMOpenAI(**params, async_client=async_client, http_client=http_client)
+    event_hooks = self._get_event_hooks()
+    async_event_hooks = self._get_event_hooks(asynchronous=True)
+    hedge_policy = self._get_hedge_policy("")
+    if hedge_policy is not None:
+      # Duplicate slow requests to the alternate replicas configured for the model
+      http_client=httpx.Client(
+          transport=HedgingTransport(params["base_url"], hedge_policy), event_hooks=event_hooks
+      )
+      http_async_client=httpx.AsyncClient(
+          transport=AsyncHedgingTransport(params["base_url"], hedge_policy), event_hooks=async_event_hooks
+      )
+    else:
+      http_client=httpx.Client(verify=False, event_hooks=event_hooks)
+      http_async_client=httpx.AsyncClient(verify=False, event_hooks=async_event_hooks)
+    # The async client must be an OpenAI resource, it is used by the async pipeline
+    async_client = AsyncOpenAI(
+        base_url=params["base_url"],
+        api_key=creds,
+        http_client=http_async_client,
+    ).completions
+    self._llm_instance = VLLMOpenAIWithStops(**params, async_client=async_client, http_client=http_client)
 
     print(f"[{inspect.stack()[0][3]}] OpenShift AI vLLM instance {self._llm_instance}")
     return self._llm_instance
 
-  def get_llm(self, callback) -> LLM:
+  def get_llm(self, callback=None) -> LLM:
     return self._openshift_ai_vllm_instance(callback)
\ No newline at end of file
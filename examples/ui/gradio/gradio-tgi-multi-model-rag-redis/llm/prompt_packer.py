@@ -0,0 +1,131 @@
+"""Fit RAG prompts in the context window of the model.
+
+The prompt of a model may hold at most its context window minus the tokens
+it generates. `PromptPacker` counts the tokens of the inputs of a prompt with
+the tokenizer of the model and, when they do not fit, drops the lowest ranked
+retrieved documents and trims the last one kept. If the other inputs alone
+are too long, the old proposal of an update is trimmed from its end.
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from llm.admission import CHARS_PER_TOKEN, estimate_tokens
+from llm.metrics import PROMPT_PACKING_COUNTER, PROMPT_TOKENS_SAVED_COUNTER
+
+# Tokens of the separator between two documents stuffed in the prompt
+DOCUMENT_SEPARATOR_TOKENS = 2
+# A document trimmed below this is dropped, it would carry little context
+MIN_DOCUMENT_TOKENS = 64
+
+
+class Tokenizer:
+    """Count and truncate text in tokens of a model."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._tokenizer = None
+        try:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(name)
+        except Exception as e:
+            print(f"No tokenizer {name} ({e}), prompt tokens are estimated from their length")
+
+    def _encode(self, text: str) -> List[int]:
+        return self._tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is None:
+            return estimate_tokens(text)
+        return len(self._encode(text))
+
+    def truncate(self, text: str, tokens: int) -> str:
+        """The beginning of `text`, at most `tokens` long."""
+        if self._tokenizer is None:
+            return text[: max(0, tokens - 1) * CHARS_PER_TOKEN]
+        return self._tokenizer.decode(self._encode(text)[: max(0, tokens)])
+
+
+_tokenizers_lock = threading.Lock()
+_tokenizers: Dict[str, Tokenizer] = {}
+
+
+def get_tokenizer(name: str) -> Tokenizer:
+    """Shared tokenizer `name`, loaded once per process."""
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(name)
+        if tokenizer is None:
+            tokenizer = Tokenizer(name)
+            _tokenizers[name] = tokenizer
+        return tokenizer
+
+
+class PromptPacker:
+    """Fit the inputs of the prompts of one model in its context window."""
+
+    def __init__(self, provider_model: str, tokenizer: str, context_window: int, max_new_tokens: int) -> None:
+        self.provider_model = provider_model
+        self.tokenizer_name = tokenizer
+        self.budget = context_window - max_new_tokens
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        # Loaded on first use, from the worker thread running the chain step
+        return get_tokenizer(self.tokenizer_name)
+
+    def _record(self, action: str, saved: int = 0) -> None:
+        PROMPT_PACKING_COUNTER.labels(provider_model=self.provider_model, action=action).inc()
+        if saved:
+            PROMPT_TOKENS_SAVED_COUNTER.labels(provider_model=self.provider_model).inc(saved)
+
+    def pack(self, inputs: dict, template: str, documents_key: str = "context", trim_key: Optional[str] = None) -> dict:
+        """Return `inputs` fitting in the prompt `template`.
+
+        `inputs[documents_key]` are the retrieved documents, best ranked
+        first; `inputs[trim_key]`, if given, is trimmed when dropping every
+        document is not enough.
+        """
+        tokenizer = self.tokenizer
+        documents: List[Document] = inputs[documents_key]
+        texts = {key: value for key, value in inputs.items() if key != documents_key and isinstance(value, str)}
+        fixed = tokenizer.count(template) + sum(tokenizer.count(text) for text in texts.values())
+        document_tokens = [tokenizer.count(d.page_content) + DOCUMENT_SEPARATOR_TOKENS for d in documents]
+        total = fixed + sum(document_tokens)
+        if total <= self.budget:
+            self._record("fit")
+            return inputs
+
+        packed = dict(inputs)
+        available = self.budget - fixed
+        saved = 0
+        if trim_key is not None and available < 0:
+            # The text alone does not fit, trim it and leave no room for documents
+            text_tokens = tokenizer.count(texts[trim_key])
+            packed[trim_key] = tokenizer.truncate(texts[trim_key], text_tokens + available)
+            saved -= available
+            available = 0
+            self._record("trimmed_text")
+
+        kept = []
+        for document, tokens in zip(documents, document_tokens):
+            if tokens <= available:
+                kept.append(document)
+                available -= tokens
+                continue
+            if available - DOCUMENT_SEPARATOR_TOKENS >= MIN_DOCUMENT_TOKENS:
+                content = tokenizer.truncate(document.page_content, available - DOCUMENT_SEPARATOR_TOKENS)
+                kept.append(Document(page_content=content, metadata=document.metadata))
+                saved += tokens - available
+                self._record("trimmed_document")
+            # Documents are ranked, the ones after are dropped as well
+            break
+        dropped = len(documents) - len(kept)
+        if dropped:
+            saved += sum(document_tokens[len(document_tokens) - dropped:])
+            self._record("dropped_documents")
+        packed[documents_key] = kept
+        self._record("packed", saved)
+        return packed
@@ -1,6 +1,5 @@
 from langchain.prompts import PromptTemplate
 import os
-from langchain.chains import RetrievalQA
 from vector_db.db_provider_factory import FAISS, DBFactory
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.runnables import RunnableParallel, RunnableLambda
@@ -52,6 +51,41 @@ Old Proposal:
 [/INST]
 """
 
+UPDATE_SECTION_TEMPLATE = """
+### [INST]
+Instructions:
+- You are a helpful assistant tasked with updating one section of a project proposal for products owned by Red Hat.
+- Update the old section based on the user query, using the provided old section, context, and question.
+- Do not rely on prior knowledge; base your response solely on the provided information.
+- Update the section in markdown format, keeping its heading and the style of its headings and sub-headings.
+- Each sub-section should contain only three items.
+- Modify only the content based on the user's request, while keeping everything else the same.
+- Output only the updated section, without any text before or after it.
+
+Sections of the proposal:
+{outline}
+
+Context:
+{context}
+
+Old Section:
+{section}
+
+### User Query:
+{user_query}
+[/INST]
+"""
+
+QUERY_UPDATE_SECTION_TEMPLATE = """
+### [INST]
+Old Section:
+{section}
+
+### User Query:
+{user_query}
+[/INST]
+"""
+
 QUERY_UPDATE_PROPOSAL_TEMPLATE = """"
 ### [INST]
 Old Proposal:
@@ -77,21 +111,31 @@ def _get_retriever():
         retriever = db_factory.get_retriever(FAISS)  
     return retriever
 
-def get_qa_chain(llm):
+def _pack_prompt(packer, template, trim_key=None):
+    """Chain step fitting the prompt inputs in the context window of the model, when known."""
+    if packer is None:
+        return RunnableLambda(lambda x: x)
+    return RunnableLambda(lambda x: packer.pack(x, template, trim_key=trim_key))
+
+def get_qa_chain(llm, packer=None):
     generate_proposal_prompt = PromptTemplate.from_template(GENERATE_PROPOSAL_THEMPLATE)
     retriever = _get_retriever()
+    combine_docs_chain = create_stuff_documents_chain(llm, generate_proposal_prompt)
 
-    return RetrievalQA.from_chain_type(
-        llm,
-        retriever=retriever,
-        chain_type_kwargs={"prompt": generate_proposal_prompt},
-        return_source_documents=True,
-    )
+    return RunnableParallel({'context': RunnableLambda(lambda x: x['query']) | retriever, 'question': lambda x: x['query']}) | _pack_prompt(packer, GENERATE_PROPOSAL_THEMPLATE) | RunnableParallel({"source_documents": lambda x: x['context'], 'result': combine_docs_chain})
 
-def get_update_proposal_chain(llm):
+def get_update_proposal_chain(llm, packer=None):
     update_proposal_prompt = PromptTemplate.from_template(UPDATE_PROPOSAL_TEMPLATE)
     query_update_proposal_prompt = PromptTemplate.from_template(QUERY_UPDATE_PROPOSAL_TEMPLATE)
     retriever = _get_retriever()
     combine_docs_chain = create_stuff_documents_chain(llm, update_proposal_prompt)
 
-    return RunnableParallel({'context': query_update_proposal_prompt| RunnableLambda(lambda x: x.text)  | retriever, 'old_proposal': lambda x:x['old_proposal'], 'user_query': lambda x: x['user_query']}) | RunnableParallel({"source_documents": lambda x: x['context'], 'result': combine_docs_chain})
\ No newline at end of file
+    return RunnableParallel({'context': query_update_proposal_prompt| RunnableLambda(lambda x: x.text)  | retriever, 'old_proposal': lambda x:x['old_proposal'], 'user_query': lambda x: x['user_query']}) | _pack_prompt(packer, UPDATE_PROPOSAL_TEMPLATE, 'old_proposal') | RunnableParallel({"source_documents": lambda x: x['context'], 'result': combine_docs_chain})
+
+def get_update_section_chain(llm, packer=None):
+    update_section_prompt = PromptTemplate.from_template(UPDATE_SECTION_TEMPLATE)
+    query_update_section_prompt = PromptTemplate.from_template(QUERY_UPDATE_SECTION_TEMPLATE)
+    retriever = _get_retriever()
+    combine_docs_chain = create_stuff_documents_chain(llm, update_section_prompt)
+
+    return RunnableParallel({'context': query_update_section_prompt | RunnableLambda(lambda x: x.text) | retriever, 'section': lambda x: x['section'], 'outline': lambda x: x['outline'], 'user_query': lambda x: x['user_query']}) | _pack_prompt(packer, UPDATE_SECTION_TEMPLATE, 'section') | RunnableParallel({"source_documents": lambda x: x['context'], 'result': combine_docs_chain})
@@ -0,0 +1,87 @@
+"""Incremental Server-Sent Events parser for text-generation-inference streams."""
+
+import json
+from typing import Any, Iterable, Iterator, List, NamedTuple
+
+try:
+    import orjson
+
+    def loads(data: bytes) -> Any:
+        """Decode a JSON payload using orjson."""
+        return orjson.loads(data)
+
+except ImportError:  # pragma: no cover - orjson is optional
+
+    def loads(data: bytes) -> Any:
+        """Decode a JSON payload using the standard library."""
+        return json.loads(data)
+
+
+class StreamToken(NamedTuple):
+    """Minimal token emitted by the "lite" stream mode (no pydantic validation)."""
+
+    id: int
+    text: str
+    special: bool
+
+
+class SSEParser:
+    """Parse a stream of raw bytes into Server-Sent Event data payloads.
+
+    Chunks can be split anywhere, including in the middle of a line or of a
+    multi-byte UTF-8 character: incomplete lines are buffered until the rest
+    arrives. Lines may be terminated by `\\n` or `\\r\\n`.
+
+    Example:
+        .. code-block:: python
+
+            parser = SSEParser()
+            for chunk in response.iter_content(chunk_size=None):
+                for data in parser.feed(chunk):
+                    payload = loads(data)
+    """
+
+    def __init__(self) -> None:
+        self._buffer = b""
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Consume a chunk and return the data of every event completed by it."""
+        if not chunk:
+            return []
+        buffer = self._buffer + chunk if self._buffer else chunk
+        lines = buffer.split(b"\n")
+        # The last element is either empty or an incomplete line
+        self._buffer = lines.pop()
+
+        events = []
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                # Blank line dispatches the pending event
+                if self._data:
+                    events.append(self._data[0] if len(self._data) == 1 else b"\n".join(self._data))
+                    self._data = []
+                continue
+            if line.startswith(b"data:"):
+                value = line[5:]
+                if value.startswith(b" "):
+                    value = value[1:]
+                self._data.append(value)
+            # Comments (":") and other fields (event, id, retry) are not used by TGI
+        return events
+
+    def flush(self) -> List[bytes]:
+        """Dispatch any event left pending when the stream ends without a blank line."""
+        events = self.feed(b"\n\n") if self._buffer or self._data else []
+        self._buffer = b""
+        return events
+
+
+def iter_sse_data(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield the data payload of every event found in an iterable of byte chunks."""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.flush()
@@ -0,0 +1,105 @@
+"""Streaming stop-sequence matching across token boundaries."""
+
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class StopSequenceMatcher:
+    """Aho-Corasick matcher of several stop sequences over a token stream.
+
+    Each token is fed once, in O(len(token)) whatever the number of stop
+    sequences. Text that could be the beginning of a stop sequence split over
+    the next tokens is held back; everything else is released immediately.
+
+    Example:
+        .. code-block:: python
+
+            matcher = StopSequenceMatcher(["</s>", "###"])
+            for token in tokens:
+                text, stopped = matcher.feed(token)
+                emit(text)
+                if stopped:
+                    break
+            else:
+                emit(matcher.flush())
+    """
+
+    def __init__(self, stop_sequences: Optional[List[str]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._depth: List[int] = [0]
+        # Length of the longest stop sequence ending at each state
+        self._match: List[int] = [0]
+        for stop in stop_sequences or []:
+            if stop:
+                self._add(stop)
+        self._build()
+        self._state = 0
+        self._held = ""
+
+    def _add(self, stop: str) -> None:
+        state = 0
+        for ch in stop:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[state] + 1)
+                self._match.append(0)
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._match[state] = max(self._match[state], len(stop))
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._match[nxt] = max(self._match[nxt], self._match[self._fail[nxt]])
+                queue.append(nxt)
+
+    @property
+    def empty(self) -> bool:
+        return len(self._goto) == 1
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        """Consume a token.
+
+        Returns:
+            Tuple[str, bool]: text that can be released, and whether a stop
+            sequence completed (the released text then ends right before it)
+        """
+        if self.empty:
+            return text, False
+        goto, fail, match = self._goto, self._fail, self._match
+        state = self._state
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if match[state]:
+                consumed = self._held + text[: i + 1]
+                self._state, self._held = 0, ""
+                return consumed[: len(consumed) - match[state]], True
+        self._state = state
+        pending = self._held + text
+        # Hold back the longest suffix that is still a prefix of a stop sequence
+        keep = self._depth[state]
+        self._held = pending[len(pending) - keep :] if keep else ""
+        return pending[: len(pending) - keep], False
+
+    def flush(self) -> str:
+        """Release the held back text once the stream ended without a stop sequence."""
+        held, self._held, self._state = self._held, "", 0
+        return held
+
+
+def truncate_at_stop(text: str, stop_sequences: Optional[List[str]]) -> str:
+    """Cut a complete generation before its first stop sequence."""
+    released, stopped = StopSequenceMatcher(stop_sequences).feed(text)
+    return released if stopped else text
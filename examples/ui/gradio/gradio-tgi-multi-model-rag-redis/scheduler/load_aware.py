@@ -0,0 +1,156 @@
+"""Load-aware selection of the provider and model of a session.
+
+`LoadTracker` keeps, per "provider: model", a moving average of the time to
+first token and of the decode speed of its generations, fed by
+`LoadCallback`. `LoadAwareScheduler` estimates from them the time a new
+generation would take on each candidate, counting the generations already
+outstanding there, and draws one with a probability proportional to its
+weight divided by that time. The configured weights are priors: with no load
+and no measurements the choice is the weighted one of round robin.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+# Weight of the last generation in the moving averages
+EWMA_ALPHA = 0.3
+# Measurements older than this are ignored, so a backend slow in the past gets traffic again
+STATS_TTL = 120.0
+# Tokens of a typical proposal, to weigh the decode speed against the time to first token
+TYPICAL_TOKENS = 1024
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.ttft: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        self.updated = 0.0
+
+    def add(self, ttft: float, tokens_per_second: Optional[float]) -> None:
+        self.ttft = ttft if self.ttft is None else self.ttft + EWMA_ALPHA * (ttft - self.ttft)
+        if tokens_per_second is not None:
+            self.tokens_per_second = (
+                tokens_per_second
+                if self.tokens_per_second is None
+                else self.tokens_per_second + EWMA_ALPHA * (tokens_per_second - self.tokens_per_second)
+            )
+        self.updated = time.monotonic()
+
+    def latency(self) -> Optional[float]:
+        """Expected seconds of a generation, None without recent measurements."""
+        if self.ttft is None or time.monotonic() - self.updated > STATS_TTL:
+            return None
+        if not self.tokens_per_second:
+            return self.ttft
+        return self.ttft + TYPICAL_TOKENS / self.tokens_per_second
+
+
+class LoadTracker:
+    """Live load and latency of each "provider: model".
+
+    `outstanding` returns the generations running or waiting for a key.
+    """
+
+    def __init__(self, outstanding: Callable[[str], int]) -> None:
+        self.outstanding = outstanding
+        self._stats: Dict[str, _Stats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, ttft: float, tokens: int, decode_time: float) -> None:
+        tokens_per_second = (tokens - 1) / decode_time if tokens > 1 and decode_time > 0 else None
+        with self._lock:
+            self._stats.setdefault(key, _Stats()).add(ttft, tokens_per_second)
+
+    def latency(self, key: str) -> Optional[float]:
+        with self._lock:
+            stats = self._stats.get(key)
+            return stats.latency() if stats is not None else None
+
+
+class LoadCallback(BaseCallbackHandler):
+    """Callback handler timing the generations of one request for a `LoadTracker`."""
+
+    # Cheap and non-blocking, so async runs call it on the event loop, not in an executor
+    run_inline = True
+
+    def __init__(self, tracker: LoadTracker, key: str) -> None:
+        self.tracker = tracker
+        self.key = key
+        # Start, first and last token time and token count of each LLM run
+        self._runs: Dict[UUID, list] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = [time.perf_counter(), None, None, 0]
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = [time.perf_counter(), None, None, 0]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if kwargs.get("cached"):
+            # Replayed from the response cache, it says nothing about the backend
+            self._runs.pop(run_id, None)
+            return
+        run = self._runs.get(run_id)
+        if run is None or not token:
+            return
+        now = time.perf_counter()
+        if run[1] is None:
+            run[1] = now
+        run[2] = now
+        run[3] += 1
+
+    def on_llm_end(self, *args: Any, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None and run[3]:
+            start, first, last, tokens = run
+            self.tracker.record(self.key, first - start, tokens, last - first)
+
+    def on_llm_error(self, *args: Any, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+
+class LoadAwareScheduler:
+    """Pick a "provider: model" by estimated generation time, weights as priors.
+
+    Has the `get_next` of `RoundRobinScheduler`, returning a
+    `(provider_model, weight)` tuple of the data set.
+    """
+
+    def __init__(self, s: List[Tuple[str, int]], tracker: LoadTracker, available: Optional[Callable[[str], bool]] = None) -> None:
+        self.data_set = [(key, weight) for key, weight in s if weight and weight > 0]
+        self.tracker = tracker
+        self.available = available
+        self.counter: Dict[str, int] = {}
+
+    def cost(self, key: str, weight: int, default_latency: float) -> float:
+        latency = self.tracker.latency(key)
+        if latency is None:
+            latency = default_latency
+        return (self.tracker.outstanding(key) + 1) * latency / weight
+
+    def schedule(self) -> Optional[Tuple[str, int]]:
+        if not self.data_set:
+            return None
+        # Open circuits are skipped, unless every backend is
+        candidates = [item for item in self.data_set if self.available is None or self.available(item[0])]
+        candidates = candidates or self.data_set
+        # Backends without recent measurements are assumed as fast as the average of the others
+        latencies = [latency for latency in (self.tracker.latency(key) for key, _ in candidates) if latency]
+        default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+
+        # Drawn rather than the cheapest: sessions keep their backend, and
+        # between two measurements every new one would go to the same backend
+        odds = [1 / self.cost(key, weight, default_latency) for key, weight in candidates]
+        item = random.choices(candidates, weights=odds)[0]
+        self.counter[item[0]] = self.counter.get(item[0], 0) + 1
+        return item
+
+    def get_next(self, n=1):
+        if n > 1:
+            return [self.schedule() for i in range(0, n)]
+        return self.schedule()
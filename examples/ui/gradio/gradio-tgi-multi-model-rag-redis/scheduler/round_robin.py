@@ -1,64 +1,208 @@
+"""Smooth weighted round robin.
+
+The order is the one of nginx's smooth weighted round robin: with weights
+5, 1, 1 it is a a b a c a a rather than a a a a a b c, so a heavy backend does
+not receive its share in bursts.
+
+One period of that order, as long as the sum of the weights divided by their
+greatest common divisor, is computed when the weights change and each pick
+is a lookup in it: O(1), and the shared position of the replicas is just an
+index. Weights with a period longer than MAX_PERIOD are picked step by step
+instead, nginx's way: each pick adds its weight to the current weight of
+every item and takes the highest, which then loses the total, O(number of
+items) whatever the weights.
+"""
 
-from functools import reduce
 import math
-import random
-import fractions
-
-class RoundRobinScheduler():    
-   
-    cw = 0
-    i = -1 
-    data_set = []
-    max_s = None
-    gcd_s = None
-    len_s = None
-    counter = {}
-
-    def __init__(self, s = None):
-        self._init_dataset(s)
-
-    def _init_dataset(self, s):
-        self.data_set = s
-        self.max_s = max(s, key=lambda x: x[1])[1]
-        self.gcd_s = reduce(math.gcd, [ weight for data, weight in s])
-        self.len_s = len(s)
-
-    def schedule(self):
-        while True:
-            self.i = (self.i + 1) % self.len_s
-            if self.i == 0:
-                self.cw = self.cw - self.gcd_s
-                if self.cw <= 0:
-                    self.cw = self.max_s
-                    if self.cw == 0:
-                        return None
-            if self.data_set[self.i][1] >= self.cw:
-                self._inc_counter(self.data_set[self.i]) 
-                return self.data_set[self.i]
-
-    def _inc_counter(self, item):
+import threading
+from functools import reduce
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Longest period computed as a table of picks
+MAX_PERIOD = 4096
+# Steps replayed at most to catch up with the picks of the other replicas
+# when picking step by step, beyond that this replica goes on from where it is
+CATCH_UP_LIMIT = 256
+
+
+def _reduced_weights(items: Sequence[Tuple[str, int]]) -> List[int]:
+    gcd = reduce(math.gcd, [weight for _, weight in items])
+    return [weight // gcd for _, weight in items]
+
+
+def smooth_weighted_order(s: Sequence[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """One period of the smooth weighted round robin order of `s`.
+
+    Items with a weight of 0 or less are never picked. The weights are
+    divided by their greatest common divisor, so the period is as short as
+    the proportions allow.
+    """
+    items = [item for item in s if item[1] > 0]
+    if not items:
+        return []
+    weights = _reduced_weights(items)
+    total = sum(weights)
+    current = [0] * len(items)
+    order = []
+    for _ in range(total):
+        best = 0
+        for i, weight in enumerate(weights):
+            current[i] += weight
+            if current[i] > current[best]:
+                best = i
+        current[best] -= total
+        order.append(items[best])
+    return order
+
+
+class RoundRobinScheduler():
+    """Thread-safe smooth weighted round robin over `(provider_model, weight)` items.
+
+    Items for which `available` returns False, open circuits, are skipped
+    while any other is available. With a `position` callable, returning the
+    position of the pick in a rotation shared by every replica or None when
+    it has none at hand, the replicas follow one rotation instead of one each.
+    """
+
+    def __init__(
+        self,
+        s: Optional[Sequence[Tuple[str, int]]] = None,
+        available: Optional[Callable[[str], bool]] = None,
+        position: Optional[Callable[[], Optional[int]]] = None,
+    ):
+        self.available = available
+        self.position = position
+        self._lock = threading.Lock()
+        self.data_set: List[Tuple[str, int]] = []
+        self.counter: Dict[str, int] = {}
+        # Period of the order when it is short enough to be a table, else None
+        self._order: Optional[List[Tuple[str, int]]] = []
+        self._i = 0
+        # Items and current weights of the step by step picks
+        self._items: List[Tuple[str, int]] = []
+        self._current: List[int] = []
+        self._step = 0
+        if s:
+            self.set_data(s)
+
+    def _shared_position(self) -> Optional[int]:
+        if self.position is None:
+            return None
         try:
-            self.counter[item[0]] += 1
-        except KeyError:
-            self.counter[item[0]] = 1
+            return self.position()
+        except Exception as e:
+            # The rotation of this replica goes on until the shared one is back
+            print(f"Shared round robin position unavailable: {e}")
+            return None
+
+    def _is_available(self, key: str) -> bool:
+        return self.available is None or self.available(key)
+
+    def _pick_from_order(self) -> Tuple[str, int]:
+        position = self._shared_position()
+        if position is not None:
+            self._i = position % len(self._order)
+        for _ in range(len(self._order)):
+            item = self._order[self._i]
+            self._i = (self._i + 1) % len(self._order)
+            if self._is_available(item[0]):
+                break
+        # With nothing available, the item picked last is returned anyway
+        return item
+
+    def _advance(self, indices: Iterable[int]) -> int:
+        """One step of the rotation among the items at `indices`, the index picked."""
+        total = 0
+        best = -1
+        for i in indices:
+            weight = self._items[i][1]
+            self._current[i] += weight
+            total += weight
+            if best < 0 or self._current[i] > self._current[best]:
+                best = i
+        self._current[best] -= total
+        return best
+
+    def _pick_step(self) -> Tuple[str, int]:
+        position = self._shared_position()
+        if position is not None:
+            # Replay the steps of the picks made by the other replicas since the last one here
+            gap = position - self._step
+            if 0 < gap <= CATCH_UP_LIMIT:
+                for _ in range(gap):
+                    self._advance(range(len(self._items)))
+            self._step = position
+        indices = [i for i, (key, _) in enumerate(self._items) if self._is_available(key)]
+        # With nothing available, the rotation goes on over every item anyway
+        item = self._items[self._advance(indices or range(len(self._items)))]
+        self._step += 1
+        return item
+
+    def schedule(self) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            if self._order:
+                item = self._pick_from_order()
+            elif self._order is None:
+                item = self._pick_step()
+            else:
+                return None
+            self.counter[item[0]] = self.counter.get(item[0], 0) + 1
+            return item
+
+    def _set_items(self, s: Sequence[Tuple[str, int]]) -> None:
+        """Table or current weights of `s`, called with the lock held."""
+        items = [item for item in s if item[1] > 0]
+        current = dict(zip((key for key, _ in self._items), self._current))
+        self.data_set = list(s)
+        self._items = items
+        # The items kept also keep their current weight
+        self._current = [current.get(key, 0) for key, _ in items]
+
+    def set_data(self, s: Sequence[Tuple[str, int]]):
+        """Replace the items and start a new rotation."""
+        order = self._table(s)
+        with self._lock:
+            self._items = []
+            self._set_items(s)
+            self._order = order
+            self._i = 0
+            self.counter = {}
+
+    def update_weights(self, s: Sequence[Tuple[str, int]]):
+        """Change the items or their weights, keeping the counters.
+
+        The new order continues from the same point of its period rather
+        than from its start.
+        """
+        order = self._table(s)
+        with self._lock:
+            position = self._i / len(self._order) if self._order else 0
+            self._set_items(s)
+            self._order = order
+            self._i = int(position * len(order)) if order else 0
 
-    def set_data(self, s):
-        self.reset()
-        self._init_dataset(s)
+    @staticmethod
+    def _table(s: Sequence[Tuple[str, int]]) -> Optional[List[Tuple[str, int]]]:
+        """Period of the order of `s`, None when it is longer than MAX_PERIOD."""
+        items = [item for item in s if item[1] > 0]
+        if items and sum(_reduced_weights(items)) > MAX_PERIOD:
+            return None
+        return smooth_weighted_order(items)
 
     def reset_counter(self):
-        self.counter = {}
+        with self._lock:
+            self.counter = {}
 
-    def reset(self):             
-        self.cw = 0
-        self.i = -1 
-        self.data_set = []
-        self.max_s = None
-        self.gcd_s = None
-        self.len_s = None
-        self.reset_counter()
+    def reset(self):
+        with self._lock:
+            self.data_set = []
+            self._order = []
+            self._i = 0
+            self._items = []
+            self._current = []
+            self.counter = {}
 
     def get_next(self, n = 1):
         if n > 1:
             return [ self.schedule() for i in range(0,n) ]
-        return self.schedule()
\ No newline at end of file
+        return self.schedule()
@@ -0,0 +1,7 @@
+"""Run with `python -m pytest tests` from the directory of the app."""
+
+import os
+import sys
+
+# The modules of the app import each other from its directory, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,152 @@
+import asyncio
+import os
+
+import pytest
+
+from utils import artifact_store
+from utils.artifact_store import ArtifactStore
+from utils.downloads import file_response
+
+CONTENT = b"0123456789"
+
+
+def writer(content):
+    def write(path):
+        with open(path, "wb") as f:
+            f.write(content)
+
+    return write
+
+
+def body(response) -> bytes:
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(read())
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "proposals"), max_bytes=15, max_age=3600)
+
+
+def test_put_and_open(store):
+    path = store.put("a.pdf", writer(CONTENT))
+    assert store.get("a.pdf") == path
+    with store.open("a.pdf") as f:
+        assert f.read() == CONTENT
+    assert store.total_bytes == len(CONTENT)
+    assert not [name for name in os.listdir(store.directory) if name != "a.pdf"]
+
+
+def test_invalid_names_are_rejected(store):
+    with pytest.raises(ValueError):
+        store.put("../a.pdf", writer(CONTENT))
+    with pytest.raises(ValueError):
+        store.path(".hidden")
+    assert store.open("../a.pdf") is None
+
+
+def test_least_recently_used_is_evicted(store):
+    store.put("a.pdf", writer(CONTENT))
+    store.put("b.pdf", writer(CONTENT))
+    assert store.open("a.pdf") is None
+    assert not os.path.exists(store.path("a.pdf"))
+    assert store.total_bytes == len(CONTENT)
+
+
+def test_open_file_survives_eviction(store):
+    store.put("a.pdf", writer(CONTENT))
+    f = store.open("a.pdf")
+    store.put("b.pdf", writer(CONTENT))
+    with f:
+        assert f.read() == CONTENT
+
+
+def test_old_files_expire(store, monkeypatch):
+    store.put("a.pdf", writer(CONTENT))
+    now = artifact_store.time.time()
+    monkeypatch.setattr(artifact_store.time, "time", lambda: now + 3601)
+    assert store.open("a.pdf") is None
+    assert store.total_bytes == 0
+
+
+def test_file_deleted_behind_the_store(store):
+    store.put("a.pdf", writer(CONTENT))
+    os.unlink(store.path("a.pdf"))
+    assert store.open("a.pdf") is None
+    assert store.total_bytes == 0
+
+
+def test_files_are_reloaded(store):
+    store.put("a.pdf", writer(CONTENT))
+    reloaded = ArtifactStore(store.directory, max_bytes=15, max_age=3600)
+    assert reloaded.total_bytes == len(CONTENT)
+    assert reloaded.get("a.pdf") is not None
+
+
+@pytest.fixture
+def download(store):
+    store.put("a.pdf", writer(CONTENT))
+    opened = []
+
+    def respond(headers):
+        f = store.open("a.pdf")
+        opened.append(f)
+        return file_response(f, headers, '"v1"', media_type="application/pdf")
+
+    respond.opened = opened
+    return respond
+
+
+def test_whole_file(download):
+    response = download({})
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert body(response) == CONTENT
+    assert download.opened[-1].closed
+
+
+@pytest.mark.parametrize(
+    "header, content_range, content",
+    [
+        ("bytes=2-5", "bytes 2-5/10", b"2345"),
+        ("bytes=7-", "bytes 7-9/10", b"789"),
+        ("bytes=-3", "bytes 7-9/10", b"789"),
+        ("bytes=8-100", "bytes 8-9/10", b"89"),
+    ],
+)
+def test_range(download, header, content_range, content):
+    response = download({"range": header})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == content_range
+    assert response.headers["content-length"] == str(len(content))
+    assert body(response) == content
+
+
+def test_unsatisfiable_range(download):
+    response = download({"range": "bytes=10-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+    assert download.opened[-1].closed
+
+
+def test_range_of_an_older_version_sends_the_whole_file(download):
+    response = download({"range": "bytes=2-5", "if-range": '"v0"'})
+    assert response.status_code == 200
+    assert body(response) == CONTENT
+
+
+def test_malformed_range_sends_the_whole_file(download):
+    response = download({"range": "bytes=1-2,4-5"})
+    assert response.status_code == 200
+
+
+def test_not_modified(download):
+    response = download({"if-none-match": 'W/"v1"'})
+    assert response.status_code == 304
+    assert download.opened[-1].closed
+    assert download({"if-none-match": '"v0"'}).status_code == 200
+    last_modified = download({}).headers["last-modified"]
+    assert download({"if-modified-since": last_modified}).status_code == 304
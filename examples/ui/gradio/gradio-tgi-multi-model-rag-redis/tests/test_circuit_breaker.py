@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+
+import pytest
+
+from utils import circuit_breaker
+from utils.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    HEALTH_CHECK_FAILURES,
+    MIN_REQUESTS,
+    OPEN,
+    CircuitBreaker,
+)
+
+_keys = itertools.count()
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(f"test: model-{next(_keys)}", open_seconds=30)
+
+
+def open_circuit(breaker):
+    for _ in range(MIN_REQUESTS):
+        breaker.record_failure("boom")
+    assert breaker.current_state() == OPEN
+
+
+def test_error_rate_opens_the_circuit(breaker):
+    for _ in range(MIN_REQUESTS - 1):
+        breaker.record_failure("boom")
+    # Too few requests to tell
+    assert breaker.current_state() == CLOSED
+    breaker.record_failure("boom")
+    assert breaker.current_state() == OPEN
+    assert not breaker.available()
+    assert not breaker.acquire(object())
+
+
+def test_successes_keep_the_circuit_closed(breaker):
+    for _ in range(MIN_REQUESTS):
+        breaker.record_success()
+    for _ in range(MIN_REQUESTS - 1):
+        breaker.record_failure("boom")
+    assert breaker.current_state() == CLOSED
+
+
+def test_half_open_lets_one_trial_through(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    assert breaker.current_state() == HALF_OPEN
+    first, second = object(), object()
+    assert breaker.acquire(first)
+    assert not breaker.available()
+    assert not breaker.acquire(second)
+    breaker.record_success()
+    assert breaker.current_state() == CLOSED
+    assert breaker.acquire(second)
+
+
+def test_failed_trial_opens_the_circuit_again(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    trial = object()
+    assert breaker.acquire(trial)
+    breaker.record_failure("still down")
+    assert breaker.current_state() == OPEN
+    breaker.release(trial)
+    assert not breaker.available()
+
+
+def test_cancelled_trial_is_released(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+
+    async def request(owner, started):
+        assert breaker.acquire(owner)
+        try:
+            started.set()
+            await asyncio.sleep(60)
+            breaker.record_success()
+        finally:
+            breaker.release(owner)
+
+    async def main():
+        started = asyncio.Event()
+        task = asyncio.create_task(request(object(), started))
+        await started.wait()
+        assert not breaker.available()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    # No outcome was recorded, the next request gets the trial
+    assert breaker.current_state() == HALF_OPEN
+    assert breaker.available()
+
+
+def test_release_keeps_the_trial_of_another_request(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    owner, other = object(), object()
+    assert breaker.acquire(owner)
+    breaker.release(other)
+    assert not breaker.available()
+    breaker.release(owner)
+    assert breaker.available()
+
+
+def test_health_checks_only_half_open_the_circuit(breaker):
+    open_circuit(breaker)
+    breaker.record_success(health_check=True)
+    assert breaker.current_state() == HALF_OPEN
+    # Only a request closes it
+    breaker.record_success(health_check=True)
+    assert breaker.current_state() == HALF_OPEN
+    assert breaker.acquire(object())
+    breaker.record_success()
+    assert breaker.current_state() == CLOSED
+
+
+def test_failing_health_checks_open_the_circuit(breaker):
+    for _ in range(HEALTH_CHECK_FAILURES - 1):
+        breaker.record_failure("unreachable", health_check=True)
+        assert breaker.current_state() == CLOSED
+    breaker.record_failure("unreachable", health_check=True)
+    assert breaker.current_state() == OPEN
+    assert breaker.last_error == "unreachable"
+
+
+def test_health_check_clears_a_stale_trial(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    assert breaker.acquire(object())
+    breaker.record_success(health_check=True)
+    # A trial in progress is kept
+    assert not breaker.available()
+    clock.now += 30
+    breaker.record_success(health_check=True)
+    assert breaker.available()
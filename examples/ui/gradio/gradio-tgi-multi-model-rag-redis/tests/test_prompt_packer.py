@@ -0,0 +1,64 @@
+import pytest
+from langchain_core.documents import Document
+
+from llm import prompt_packer
+from llm.prompt_packer import DOCUMENT_SEPARATOR_TOKENS, PromptPacker
+
+TEMPLATE = "{context} {question}"
+
+
+class WordTokenizer:
+    """One token per word, so the budgets of the tests are easy to follow."""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def truncate(self, text: str, tokens: int) -> str:
+        return " ".join(text.split()[: max(0, tokens)])
+
+
+@pytest.fixture(autouse=True)
+def words(monkeypatch):
+    monkeypatch.setitem(prompt_packer._tokenizers, "words", WordTokenizer())
+
+
+def documents(n, words=100):
+    return [Document(page_content=" ".join([f"d{i}"] * words), metadata={"i": i}) for i in range(n)]
+
+
+def packer(budget):
+    return PromptPacker("test: model", "words", context_window=budget + 100, max_new_tokens=100)
+
+
+def test_inputs_that_fit_are_unchanged():
+    inputs = {"context": documents(2), "question": "what is it"}
+    assert packer(1000).pack(inputs, TEMPLATE) is inputs
+
+
+def test_last_document_kept_is_trimmed_and_the_others_dropped():
+    inputs = {"context": documents(3), "question": "what is it"}
+    fixed = 2 + 3
+    first = 100 + DOCUMENT_SEPARATOR_TOKENS
+    packed = packer(fixed + first + 80).pack(inputs, TEMPLATE)
+    assert [d.metadata["i"] for d in packed["context"]] == [0, 1]
+    assert packed["context"][0] is inputs["context"][0]
+    assert len(packed["context"][1].page_content.split()) == 80 - DOCUMENT_SEPARATOR_TOKENS
+    # The inputs of the caller are left alone
+    assert len(inputs["context"]) == 3
+
+
+def test_short_remainder_drops_the_document():
+    inputs = {"context": documents(2), "question": "what is it"}
+    packed = packer(2 + 3 + 102 + 10).pack(inputs, TEMPLATE)
+    assert [d.metadata["i"] for d in packed["context"]] == [0]
+
+
+def test_text_is_trimmed_when_documents_are_not_enough():
+    inputs = {"context": documents(2), "question": "update it", "proposal": " ".join(["word"] * 500)}
+    template = "{context} {question} {proposal}"
+    budget = 300
+    packed = packer(budget).pack(inputs, template, trim_key="proposal")
+    assert packed["context"] == []
+    tokenizer = WordTokenizer()
+    total = sum(tokenizer.count(text) for text in (template, packed["question"], packed["proposal"]))
+    assert total == budget
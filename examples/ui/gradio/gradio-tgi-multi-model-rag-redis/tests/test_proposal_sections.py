@@ -0,0 +1,71 @@
+from utils.proposal_sections import affected_sections, plan_section_update, split_sections
+
+PROPOSAL = """# Proposal for Red Hat OpenShift AI
+
+Prepared for Acme.
+
+## 1. Introduction
+
+Acme wants to serve models.
+
+## 2. Benefits of Red Hat OpenShift AI
+
+Faster delivery.
+
+```
+## Not a heading
+```
+
+## 3. Pricing
+
+Per core.
+"""
+
+
+def test_split_sections():
+    sections = split_sections(PROPOSAL)
+    assert [section.title for section in sections] == [
+        None, "1. Introduction", "2. Benefits of Red Hat OpenShift AI", "3. Pricing"
+    ]
+    # The title heading belongs to the untitled first section
+    assert sections[0].text.startswith("# Proposal")
+    assert "## Not a heading" in sections[2].text
+    assert "".join(section.text for section in sections) == PROPOSAL
+
+
+def test_bold_headings():
+    sections = split_sections("**Introduction**\nText\n\n**Pricing**:\nMore\n")
+    assert [section.title for section in sections] == ["Introduction", "Pricing"]
+
+
+def test_without_sections():
+    sections = split_sections("Just a paragraph.\n")
+    assert len(sections) == 1 and sections[0].title is None
+
+
+def test_affected_sections():
+    sections = split_sections(PROPOSAL)
+    assert affected_sections(sections, "Add a volume discount to the pricing") == [3]
+    assert affected_sections(sections, "Rework section 2") == [2]
+    assert affected_sections(sections, "Mention faster delivery in the benefits") == [2]
+    assert affected_sections(sections, "Rewrite it in a formal tone") is None
+    assert affected_sections(sections, "Make it better") is None
+
+
+def test_words_of_most_titles_do_not_pick_a_section():
+    sections = split_sections("## Acme Overview\nx\n## Acme Benefits\ny\n## Pricing\nz\n")
+    assert affected_sections(sections, "Update the Acme pricing") == [2]
+
+
+def test_render_replaces_only_the_affected_sections():
+    update = plan_section_update(PROPOSAL, "Change the pricing")
+    assert update.affected == [3]
+    assert update.outline().splitlines()[-1] == "- 3. Pricing"
+    assert update.render({}) == PROPOSAL
+    rendered = update.render({3: "## 3. Pricing\n\nPer request.\n\n"})
+    assert rendered.endswith("## 3. Pricing\n\nPer request.\n")
+    assert rendered.startswith(PROPOSAL[: PROPOSAL.index("## 3. Pricing")])
+
+
+def test_whole_proposal_update():
+    assert plan_section_update(PROPOSAL, "Translate the proposal to French") is None
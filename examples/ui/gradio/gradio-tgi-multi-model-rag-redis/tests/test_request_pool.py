@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from utils.request_pool import INITIAL_SERVICE_TIME, RequestPool, ServerBusyError
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def main():
+        pool = RequestPool(max_workers=1, max_queue=0)
+        async with pool.worker():
+            with pytest.raises(ServerBusyError) as error:
+                await pool.acquire()
+        assert pool.busy == 0
+        return error.value
+
+    error = asyncio.run(main())
+    # One generation ahead, of the initial service time
+    assert error.retry_after == INITIAL_SERVICE_TIME
+    assert str(error.retry_after) in str(error)
+
+
+def test_wait_times_out():
+    async def main():
+        pool = RequestPool(max_workers=1, max_queue=1, max_wait=0.01)
+        async with pool.worker():
+            with pytest.raises(ServerBusyError):
+                await pool.acquire()
+            assert pool.waiting == 0
+
+    asyncio.run(main())
+
+
+def test_queued_request_gets_the_worker_released():
+    async def main():
+        pool = RequestPool(max_workers=1, max_queue=1, max_wait=5)
+        order = []
+
+        async def request(name):
+            async with pool.worker():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(request("first"), request("second"))
+        assert pool.busy == 0 and pool.waiting == 0
+        # The service time moves towards the measured one
+        assert pool.service_time < INITIAL_SERVICE_TIME
+        return order
+
+    assert asyncio.run(main()) == ["first", "second"]
+
+
+def test_retry_after_grows_with_the_queue():
+    pool = RequestPool(max_workers=2, max_queue=8)
+    pool.service_time = 10
+    assert pool.retry_after() == 5
+    pool.waiting = 3
+    assert pool.retry_after() == 20
+    pool.service_time = 0
+    assert pool.retry_after() == 1
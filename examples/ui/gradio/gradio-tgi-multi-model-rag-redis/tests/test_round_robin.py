@@ -0,0 +1,84 @@
+import itertools
+from collections import Counter
+
+from scheduler import round_robin
+from scheduler.round_robin import RoundRobinScheduler, smooth_weighted_order
+
+WEIGHTS = [("a", 5), ("b", 1), ("c", 1)]
+
+
+def picks(scheduler, n):
+    return "".join(item[0] for item in scheduler.get_next(n))
+
+
+def test_smooth_order():
+    assert "".join(key for key, _ in smooth_weighted_order(WEIGHTS)) == "aabacaa"
+
+
+def test_order_is_reduced_by_the_gcd():
+    assert smooth_weighted_order([("a", 10), ("b", 2), ("c", 2)]) == [
+        ("a", 10), ("a", 10), ("b", 2), ("a", 10), ("c", 2), ("a", 10), ("a", 10)
+    ]
+
+
+def test_items_without_weight_are_never_picked():
+    assert smooth_weighted_order([("a", 0), ("b", -1)]) == []
+    scheduler = RoundRobinScheduler([("a", 0), ("b", 2)])
+    assert picks(scheduler, 3) == "bbb"
+    assert RoundRobinScheduler().schedule() is None
+
+
+def test_scheduler_repeats_the_order():
+    scheduler = RoundRobinScheduler(WEIGHTS)
+    assert picks(scheduler, 14) == "aabacaa" * 2
+    assert scheduler.counter == {"a": 10, "b": 2, "c": 2}
+
+
+def test_step_by_step_picks_follow_the_same_order(monkeypatch):
+    monkeypatch.setattr(round_robin, "MAX_PERIOD", 1)
+    scheduler = RoundRobinScheduler(WEIGHTS)
+    assert scheduler._order is None
+    assert picks(scheduler, 14) == "aabacaa" * 2
+
+
+def test_long_periods_are_picked_step_by_step():
+    scheduler = RoundRobinScheduler([("a", 5000), ("b", 1)])
+    assert scheduler._order is None
+    assert Counter(picks(scheduler, 5001)) == {"a": 5000, "b": 1}
+
+
+def test_unavailable_items_are_skipped():
+    down = {"b"}
+    scheduler = RoundRobinScheduler(WEIGHTS, available=lambda key: key not in down)
+    assert picks(scheduler, 7) == "aaacaaa"
+    down = {"a", "b", "c"}
+    # With nothing available, the rotation goes on anyway
+    assert len(picks(scheduler, 3)) == 3
+
+
+def test_update_weights_keeps_the_counters():
+    scheduler = RoundRobinScheduler(WEIGHTS)
+    picks(scheduler, 3)
+    scheduler.update_weights([("a", 1), ("b", 1)])
+    assert Counter(picks(scheduler, 4)) == {"a": 2, "b": 2}
+    assert scheduler.counter == {"a": 4, "b": 3}
+    scheduler.set_data(WEIGHTS)
+    assert scheduler.counter == {}
+
+
+def test_replicas_follow_one_shared_rotation(monkeypatch):
+    for max_period in (round_robin.MAX_PERIOD, 1):
+        monkeypatch.setattr(round_robin, "MAX_PERIOD", max_period)
+        shared = itertools.count()
+        position = lambda: next(shared)
+        replicas = [RoundRobinScheduler(WEIGHTS, position=position) for _ in range(2)]
+        # Picks alternating between the replicas make one rotation between them
+        assert "".join(replicas[i % 2].schedule()[0] for i in range(14)) == "aabacaa" * 2
+
+
+def test_replica_goes_on_without_the_shared_position():
+    def position():
+        raise ConnectionError("redis down")
+
+    scheduler = RoundRobinScheduler(WEIGHTS, position=position)
+    assert picks(scheduler, 7) == "aabacaa"
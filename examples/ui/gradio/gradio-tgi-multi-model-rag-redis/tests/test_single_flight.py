@@ -0,0 +1,66 @@
+import asyncio
+
+from utils.single_flight import SingleFlight
+
+
+def generation(started, produced):
+    async def start(flight):
+        started.append(flight.key)
+        for item in produced:
+            flight.put_nowait(item)
+        # Generates until cancelled
+        await asyncio.sleep(60)
+
+    return start
+
+
+def test_follower_joins_the_generation_in_flight():
+    async def main():
+        single_flight = SingleFlight()
+        started = []
+        start = generation(started, ["a", "b"])
+        with single_flight.join("key", start) as leader:
+            assert await leader.get() == "a"
+            with single_flight.join("key", start) as follower:
+                # The items produced before it joined are replayed
+                assert [await follower.get(), await follower.get()] == ["a", "b"]
+        assert started == ["key"]
+
+    asyncio.run(main())
+
+
+def test_generation_cancelled_when_the_last_subscriber_leaves():
+    async def main():
+        single_flight = SingleFlight()
+        start = generation([], ["a"])
+        with single_flight.join("key", start) as leader:
+            await leader.get()
+            flight = single_flight._flights["key"]
+            with single_flight.join("key", start):
+                pass
+            # The leader is still reading
+            assert not flight.task.cancelled() and not flight.task.done()
+        await asyncio.sleep(0)
+        assert flight.task.cancelled()
+        assert "key" not in single_flight._flights
+
+    asyncio.run(main())
+
+
+def test_finished_generation_is_not_joined():
+    async def main():
+        single_flight = SingleFlight()
+        started = []
+
+        async def start(flight):
+            started.append(flight.key)
+            flight.put_nowait("done")
+
+        for _ in range(2):
+            with single_flight.join("key", start) as que:
+                assert await que.get() == "done"
+            await asyncio.sleep(0)
+        assert started == ["key", "key"]
+        assert not single_flight._flights
+
+    asyncio.run(main())
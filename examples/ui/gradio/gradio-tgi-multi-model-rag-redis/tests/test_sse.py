@@ -0,0 +1,40 @@
+import json
+
+from llm.sse import SSEParser, iter_sse_data
+
+STREAM = (
+    'data: {"token": {"text": "café"}}\r\n\r\n'
+    ": keep-alive\n\n"
+    'data: {"token": {"text": " au lait"}}\n\n'
+).encode("utf-8")
+
+
+def test_events_split_at_every_byte():
+    parser = SSEParser()
+    events = []
+    for i in range(len(STREAM)):
+        # Also splits the two bytes of "é" and the "\r\n" line endings
+        events.extend(parser.feed(STREAM[i : i + 1]))
+    assert [json.loads(data)["token"]["text"] for data in events] == ["café", " au lait"]
+    assert parser.flush() == []
+
+
+def test_events_split_at_any_boundary():
+    expected = list(iter_sse_data([STREAM]))
+    for cut in range(1, len(STREAM)):
+        assert list(iter_sse_data([STREAM[:cut], STREAM[cut:]])) == expected
+
+
+def test_multiline_data_is_joined():
+    assert list(iter_sse_data([b"data: a\ndata: b\n\n"])) == [b"a\nb"]
+
+
+def test_flush_dispatches_the_last_event():
+    parser = SSEParser()
+    assert parser.feed(b"data: [DONE]") == []
+    assert parser.flush() == [b"[DONE]"]
+    assert parser.flush() == []
+
+
+def test_empty_chunks_are_ignored():
+    assert list(iter_sse_data([b"", b"data: x\n", b"", b"\n"])) == [b"x"]
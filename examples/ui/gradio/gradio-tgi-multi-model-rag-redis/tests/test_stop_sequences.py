@@ -0,0 +1,49 @@
+from llm.stop_sequences import StopSequenceMatcher, truncate_at_stop
+
+
+def feed_all(matcher, tokens):
+    released = []
+    for token in tokens:
+        text, stopped = matcher.feed(token)
+        released.append(text)
+        if stopped:
+            return released, True
+    released.append(matcher.flush())
+    return released, False
+
+
+def test_stop_sequence_spanning_chunks():
+    released, stopped = feed_all(StopSequenceMatcher(["###"]), ["ab#", "#", "#cd"])
+    assert stopped
+    assert released == ["ab", "", ""]
+
+
+def test_stop_sequence_in_the_middle_of_a_chunk():
+    released, stopped = feed_all(StopSequenceMatcher(["</s>"]), ["Hello", " world</", "s> ignored"])
+    assert stopped
+    assert "".join(released) == "Hello world"
+
+
+def test_false_start_is_released():
+    released, stopped = feed_all(StopSequenceMatcher(["###"]), ["a#", "#b", "c#"])
+    assert not stopped
+    assert released == ["a", "##b", "c", "#"]
+
+
+def test_overlapping_stop_sequences():
+    # "ab" fails into the "b" of "bc" when the next character is "c"
+    released, stopped = feed_all(StopSequenceMatcher(["abd", "bc"]), ["xa", "b", "c"])
+    assert stopped
+    assert "".join(released) == "xa"
+
+
+def test_without_stop_sequences_text_is_passed_through():
+    matcher = StopSequenceMatcher(None)
+    assert matcher.empty
+    assert matcher.feed("###") == ("###", False)
+    assert matcher.flush() == ""
+
+
+def test_truncate_at_stop():
+    assert truncate_at_stop("hello</s>world</s>", ["</s>"]) == "hello"
+    assert truncate_at_stop("hello", ["</s>"]) == "hello"
@@ -0,0 +1,153 @@
+"""Bounded on-disk store of generated files.
+
+The files are kept in one directory, written atomically, and evicted when
+they get older than `max_age` seconds or, least recently used first, when
+their total size goes over `max_bytes`. The directory is scanned when the
+store is created, so files written before a restart are reused and count
+towards the limits.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+ARTIFACT_STORE_BYTES_GAUGE = Gauge(
+    "artifact_store_bytes", "Size of the files of the artifact store", ["store"]
+)
+ARTIFACT_STORE_FILES_GAUGE = Gauge(
+    "artifact_store_files", "Number of files of the artifact store", ["store"]
+)
+ARTIFACT_EVICTIONS_COUNTER = Counter(
+    "artifact_store_evictions", "Files evicted from the artifact store by reason (size, age)", ["store", "reason"]
+)
+
+_TMP_PREFIX = ".tmp-"
+_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+class ArtifactStore:
+    """Files of one directory, bounded in total size and age, evicted LRU first."""
+
+    def __init__(self, directory: str, max_bytes: int, max_age: float) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.total_bytes = 0
+        self._labels = {"store": os.path.basename(os.path.normpath(directory))}
+        # File name -> (size, creation time), least recently used first
+        self._files: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(_TMP_PREFIX):
+                # Left over by a write interrupted by a restart
+                os.unlink(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            # Without access times at hand, the oldest files are the least recently used
+            for mtime, name, size in sorted(entries):
+                self._files[name] = (size, mtime)
+                self.total_bytes += size
+            self._evict()
+
+    def path(self, name: str) -> str:
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid artifact name {name!r}")
+        return os.path.join(self.directory, name)
+
+    def get(self, name: str) -> Optional[str]:
+        """Path of the file `name`, None if it is not in the store (anymore)."""
+        with self._lock:
+            return self._get(name)
+
+    def _get(self, name: str) -> Optional[str]:
+        entry = self._files.get(name)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.max_age:
+            self._remove(name, "age")
+            self._update_gauges()
+            return None
+        self._files.move_to_end(name)
+        return self.path(name)
+
+    def open(self, name: str) -> Optional[BinaryIO]:
+        """File `name` opened for reading, None if it is not in the store (anymore).
+
+        Opened under the lock, so it cannot be evicted in between: once
+        open, it can be read to the end even if it is evicted meanwhile.
+        """
+        with self._lock:
+            if self._get(name) is None:
+                return None
+            try:
+                return open(self.path(name), "rb")
+            except FileNotFoundError:
+                # Deleted behind the back of the store
+                size, _ = self._files.pop(name)
+                self.total_bytes -= size
+                self._update_gauges()
+                return None
+
+    def put(self, name: str, write: Callable[[str], None]) -> str:
+        """Store the file `name` written by `write(path)`, return its path.
+
+        `write` writes a temporary file, which replaces the stored one only
+        once complete: readers never see a partially written file.
+        """
+        path = self.path(name)
+        fd, tmp_path = tempfile.mkstemp(prefix=_TMP_PREFIX, dir=self.directory)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            previous = self._files.pop(name, None)
+            if previous is not None:
+                self.total_bytes -= previous[0]
+            self._files[name] = (size, time.time())
+            self.total_bytes += size
+            self._evict()
+        return path
+
+    def _remove(self, name: str, reason: str) -> None:
+        size, _ = self._files.pop(name)
+        self.total_bytes -= size
+        ARTIFACT_EVICTIONS_COUNTER.labels(reason=reason, **self._labels).inc()
+        try:
+            # A download in progress keeps reading the open file
+            os.unlink(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        now = time.time()
+        for name, (_, created) in list(self._files.items()):
+            if now - created > self.max_age:
+                self._remove(name, "age")
+        # The most recently used file is kept even if it alone is over the limit
+        while self.total_bytes > self.max_bytes and len(self._files) > 1:
+            self._remove(next(iter(self._files)), "size")
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        ARTIFACT_STORE_BYTES_GAUGE.labels(**self._labels).set(self.total_bytes)
+        ARTIFACT_STORE_FILES_GAUGE.labels(**self._labels).set(len(self._files))
@@ -1,4 +1,8 @@
-from langchain.callbacks.base import BaseCallbackHandler
+import asyncio
+from typing import Hashable, Optional
+
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+
 
 class QueueCallback(BaseCallbackHandler):
     """Callback handler for streaming LLM responses to a queue."""
@@ -12,3 +16,20 @@ class QueueCallback(BaseCallbackHandler):
     def on_llm_end(self, *args, **kwargs: any) -> None:
         return self.q.empty()
         pass
+
+
+class AsyncQueueCallback(AsyncCallbackHandler):
+    """Callback handler for streaming LLM responses to an asyncio queue.
+
+    Used by the async pipeline: tokens are put from the event loop running the
+    LLM, so no thread is needed per request. Cancelling the task running the
+    chain stops the generation. With a `tag`, `(tag, token)` tuples are put,
+    to tell apart generations sharing the queue.
+    """
+
+    def __init__(self, q: asyncio.Queue, tag: Optional[Hashable] = None):
+        self.q = q
+        self.tag = tag
+
+    async def on_llm_new_token(self, token: str, **kwargs: any) -> None:
+        self.q.put_nowait(token if self.tag is None else (self.tag, token))
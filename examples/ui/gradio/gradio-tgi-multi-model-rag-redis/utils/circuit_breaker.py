@@ -0,0 +1,159 @@
+"""Circuit breakers per "provider: model".
+
+A breaker opens when the recent requests of its model fail too often, or
+when its health checks keep failing. While open, the model is skipped by the
+schedulers and the provider list. After `open_seconds`, or as soon as a
+health check succeeds, it is half-open: one request at a time is let through
+as a trial, which closes the breaker when it succeeds and opens it again when
+it fails. The health checks are not counted in the error rate of the requests.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE_GAUGE = Gauge(
+    "circuit_breaker_state", "Circuit breaker state (0 closed, 1 half open, 2 open)", ["provider_model"]
+)
+CIRCUIT_OPENED_COUNTER = Counter(
+    "circuit_breaker_opened", "Number of times a circuit breaker opened", ["provider_model"]
+)
+
+# Outcomes of the last requests considered for the error rate
+WINDOW = 20
+# Requests in the window before the error rate can open the breaker
+MIN_REQUESTS = 5
+# Error rate of the window opening the breaker
+ERROR_RATE = 0.5
+# Consecutive failed health checks opening the breaker
+HEALTH_CHECK_FAILURES = 2
+# Seconds an open breaker waits before letting a trial through
+OPEN_SECONDS = 30.0
+
+
+class CircuitBreaker:
+    """Error tracking and state of the circuit of one model."""
+
+    def __init__(self, key: str, open_seconds: float = OPEN_SECONDS) -> None:
+        self.key = key
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.last_error = ""
+        self._outcomes: deque = deque(maxlen=WINDOW)
+        self._check_failures = 0
+        # Request holding the trial of the half-open circuit, and since when
+        self._trial_owner: Optional[object] = None
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE_GAUGE.labels(provider_model=key).set(_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        if state == OPEN and self.state != OPEN:
+            self.opened_at = time.monotonic()
+            CIRCUIT_OPENED_COUNTER.labels(provider_model=self.key).inc()
+            print(f"Circuit of {self.key} opened: {self.last_error}")
+        elif state == CLOSED and self.state != CLOSED:
+            self._outcomes.clear()
+            print(f"Circuit of {self.key} closed")
+        self._trial_owner = None
+        self.state = state
+        CIRCUIT_STATE_GAUGE.labels(provider_model=self.key).set(_STATE_VALUES[state])
+
+    def _refresh(self) -> None:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+
+    def current_state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self.state
+
+    def available(self) -> bool:
+        """Whether a request may be sent to the model, without claiming the trial of a half-open circuit."""
+        with self._lock:
+            self._refresh()
+            return self.state == CLOSED or (self.state == HALF_OPEN and self._trial_owner is None)
+
+    def acquire(self, owner: object) -> bool:
+        """Let the request `owner` through, claiming the trial when the circuit is half-open.
+
+        The trial ends with the outcome recorded, or `release(owner)` when
+        the request ends without one.
+        """
+        with self._lock:
+            self._refresh()
+            if self.state == HALF_OPEN and self._trial_owner is None:
+                self._trial_owner = owner
+                self._trial_started = time.monotonic()
+                return True
+            return self.state == CLOSED
+
+    def release(self, owner: object) -> None:
+        """Give back the trial of `owner` if it still holds it, the trial of another request is kept."""
+        with self._lock:
+            if self._trial_owner is owner:
+                self._trial_owner = None
+
+    def record_success(self, health_check: bool = False) -> None:
+        with self._lock:
+            self._refresh()
+            if health_check:
+                # A model answering again gets a trial request, only requests close the circuit
+                self._check_failures = 0
+                if self.state == OPEN:
+                    self._set_state(HALF_OPEN)
+                elif (
+                    self._trial_owner is not None
+                    and time.monotonic() - self._trial_started >= self.open_seconds
+                ):
+                    # A trial lost without an outcome must not keep the circuit half-open forever
+                    self._trial_owner = None
+                return
+            self._outcomes.append(True)
+            if self.state == HALF_OPEN:
+                self._set_state(CLOSED)
+
+    def record_failure(self, error: str = "", health_check: bool = False) -> None:
+        with self._lock:
+            self._refresh()
+            self.last_error = error
+            if health_check:
+                self._check_failures += 1
+                if self._check_failures >= HEALTH_CHECK_FAILURES:
+                    self._set_state(OPEN)
+                return
+            if self.state == HALF_OPEN:
+                # The trial failed
+                self._set_state(OPEN)
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= MIN_REQUESTS and failures >= ERROR_RATE * len(self._outcomes):
+                self._set_state(OPEN)
+
+
+_breakers_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(key: str) -> CircuitBreaker:
+    """Shared breaker of a "provider: model"."""
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key)
+            _breakers[key] = breaker
+        return breaker
+
+
+def is_available(key: str) -> bool:
+    return get_circuit_breaker(key).available()
@@ -20,8 +20,15 @@ class ModelConfig():
     name: Optional[str] = "OpenShift AI (vLLM): ibm-granite-instruct"
     url: Optional[str] = "https://ibm-granite-instruct-rag-llm.apps.cluster-chwxg.chwxg.sandbox322.opentlc.com/v1"
     credentials: Optional[str] = None
+    credentials_path: Optional[str] = None
     enabled: Optional[bool] = None
     weight: Optional[int] = None
+    alternate_urls: Optional[list] = None
+    hedge: Optional[dict] = None
+    admission: Optional[dict] = None
+    max_concurrency: Optional[int] = None
+    context_window: Optional[int] = None
+    tokenizer: Optional[str] = None
 
     def __init__(self, data: Optional[dict] = None) -> None:
         """Initialize configuration and perform basic validation."""
@@ -30,14 +37,41 @@ class ModelConfig():
         self.name = data.get("name", None)
         self.url = data.get("url", None)
         self.credentials = data.get("credentials", None) or _get_attribute_from_file(data, "credentials_path")
+        self.credentials_path = data.get("credentials_path", None)
         self.enabled = data.get("enabled", True)
         self.weight = data.get("weight", 1)
+        self.alternate_urls = data.get("alternate_urls", None) or []
+        self.hedge = data.get("hedge", None) or {}
+        self.admission = data.get("admission", None) or {}
+        self.max_concurrency = data.get("max_concurrency", None)
+        self.context_window = data.get("context_window", None)
+        self.tokenizer = data.get("tokenizer", None)
         self.params = {}
         param_data = data.get("params", None)
         if param_data:
             for param in param_data:
                 self.params[param["name"]] = param["value"]
 
+    def to_dict(self) -> dict:
+        """Data this configuration can be created again from, the credentials only by their file."""
+        return {
+            "name": self.name,
+            "url": self.url,
+            "credentials_path": self.credentials_path,
+            "enabled": self.enabled,
+            "weight": self.weight,
+            "alternate_urls": self.alternate_urls,
+            "hedge": self.hedge,
+            "admission": self.admission,
+            "max_concurrency": self.max_concurrency,
+            "context_window": self.context_window,
+            "tokenizer": self.tokenizer,
+            "params": [
+                {"name": name, "value": value}
+                for name, value in getattr(self, "params", {}).items()
+            ],
+        }
+
 
 class ProviderConfig():
     """LLM provider configuration."""
@@ -45,6 +79,7 @@ class ProviderConfig():
     name: Optional[str] = None
     url: Optional[str] = None
     credentials: Optional[str] = None
+    credentials_path: Optional[str] = None
     enabled: Optional[bool] = None
     
     def __init__(self, data: Optional[dict] = None) -> None:
@@ -54,13 +89,24 @@ class ProviderConfig():
             return
         self.name = data.get("name", None)
         self.url = data.get("url", None)
-        self.credentials = _get_attribute_from_file(data, "credentials_path")
+        self.credentials = data.get("credentials", None) or _get_attribute_from_file(data, "credentials_path")
+        self.credentials_path = data.get("credentials_path", None)
         self.enabled = data.get("enabled", True)
         if "models" in data:
             for m in data["models"]:
                 model = ModelConfig(m)
                 self.models[m["name"]] = model
 
+    def to_dict(self) -> dict:
+        """Data this configuration can be created again from, the credentials only by their file."""
+        return {
+            "name": self.name,
+            "url": self.url,
+            "credentials_path": self.credentials_path,
+            "enabled": self.enabled,
+            "models": [model.to_dict() for model in self.models.values()],
+        }
+
 class LLMProviders():
     """LLM providers configuration."""
 
@@ -68,11 +114,32 @@ class LLMProviders():
 
     def __init__(self, data: Optional[dict] = None) -> None:
         """Initialize configuration and perform basic validation."""
+        # Not the class attribute, a new configuration must not keep the providers of the previous one
+        self.providers = {}
         if data is None:
             return
         for p in data:
             provider = ProviderConfig(p)
             self.providers[p["name"]] = provider
+
+    def to_dict(self) -> list:
+        return [provider.to_dict() for provider in self.providers.values()]
+
+    def keep_credentials(self, previous: "LLMProviders") -> None:
+        """Keep the credentials of `previous` where this configuration has none.
+
+        Credentials entered in the UI are not in `to_dict()`, they stay on
+        the replica they were entered on.
+        """
+        for name, provider in self.providers.items():
+            old_provider = previous.providers.get(name)
+            if old_provider is None:
+                continue
+            provider.credentials = provider.credentials or old_provider.credentials
+            for model_name, model in provider.models.items():
+                old_model = old_provider.models.get(model_name)
+                if old_model is not None:
+                    model.credentials = model.credentials or old_model.credentials
  
 class Config():
     """Global service configuration."""
@@ -93,4 +160,17 @@ class Config():
         self.default_model = data.get("default_model", None)
         self.type = data.get("type", "default")
 
+    def to_dict(self) -> dict:
+        """Data this configuration can be created again from, as loaded from config.yaml.
+
+        The credentials are left out, each replica reads them from their
+        `credentials_path`.
+        """
+        return {
+            "llm_providers": self.llm_providers.to_dict() if self.llm_providers is not None else None,
+            "default_provider": self.default_provider,
+            "default_model": self.default_model,
+            "type": self.type,
+        }
+
 
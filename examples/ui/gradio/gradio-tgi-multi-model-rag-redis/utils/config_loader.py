@@ -5,11 +5,15 @@ from io import TextIOBase
 import os
 
 import yaml
+from utils.circuit_breaker import get_circuit_breaker, is_available
 from utils.config import Config, ModelConfig, ProviderConfig
 
 config = None
 llm_config = None
 
+# Generation slots of a model without `max_concurrency` in its configuration
+DEFAULT_MAX_CONCURRENCY = 1
+
 
 def load_config_from_stream(stream: TextIOBase) -> Config:
     """Load configuration from a YAML stream."""
@@ -35,6 +39,15 @@ def init_config() -> None:
         raise e
 
 
+def set_config(c: Config) -> None:
+    """Replace the configuration, with the one shared by the other replicas."""
+    global config
+    global llm_config
+
+    config = c
+    llm_config = c.llm_providers
+
+
 def get_default_model():
     if config.type == "default":
         return config.default_model
@@ -83,7 +96,9 @@ def get_provider_model_weight_list():
     return provider_model_list
 
 
-def get_provider_model_list():
+def get_provider_model_list(include_unavailable=False):
+    """Enabled "provider: model" list, without the models whose circuit is
+    open unless `include_unavailable` is set."""
     provider_model_list = []
     if config.type == "default":
         provider_model_name = f"{get_default_provider()}: {get_default_model()}"
@@ -97,10 +112,24 @@ def get_provider_model_list():
                     model_cfg = provider_cfg.models[model_name]
                     if model_cfg.enabled:
                         provider_model_name = f"{provider_name}: {model_name}"
-                        provider_model_list.append(provider_model_name)
+                        if include_unavailable or is_available(provider_model_name):
+                            provider_model_list.append(provider_model_name)
     return provider_model_list
 
 
+def get_max_concurrency(provider_model: str) -> int:
+    """Generation slots of a "provider: model", from its `max_concurrency`."""
+    default = int(os.environ.get("DEFAULT_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+    provider_name, _, model_name = provider_model.partition(": ")
+    provider_cfg = llm_config.providers.get(provider_name)
+    if provider_cfg is None:
+        return default
+    model_cfg = provider_cfg.models.get(model_name)
+    if model_cfg is None or model_cfg.max_concurrency is None:
+        return default
+    return int(model_cfg.max_concurrency)
+
+
 def get_provider_display_list():
     provider_display_list = []
     providers = config.llm_providers.providers
@@ -120,6 +149,11 @@ def get_provider_display_list():
             provider["model_name"] = model_name
             provider["url"] = url
             provider["enabled"] = enabled
+            provider["health"] = (
+                get_circuit_breaker(f"{provider_name}: {model_name}").current_state()
+                if enabled
+                else ""
+            )
             provider_display_list.append(provider)
     return provider_display_list
 
@@ -0,0 +1,124 @@
+"""Streaming file responses with range requests and conditional GETs.
+
+Starlette's `FileResponse` of the pinned version ignores the `Range` and
+conditional headers, so the PDF viewer of the browser downloads the whole
+file again for every request.
+"""
+
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO, Iterator, Mapping, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _read(f: BinaryIO, start: int, length: int) -> Iterator[bytes]:
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _not_modified(headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """First and last byte of a single `bytes` range, None to send the whole file.
+
+    Raises ValueError if the range is not satisfiable.
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # Malformed or multiple ranges, which may be ignored
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The last `last` bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def file_response(
+    f: BinaryIO,
+    headers: Mapping[str, str],
+    etag: str,
+    media_type: str = "application/octet-stream",
+    filename: Optional[str] = None,
+) -> Response:
+    """Stream the file `f`, opened in binary mode, for a request with `headers`.
+
+    Answers 304 to a conditional GET for the current version, 206 with the
+    requested part to a single range request and 416 to an unsatisfiable
+    one. `etag` must change whenever the content of the file does. The
+    file is closed once sent.
+    """
+    try:
+        stat = os.fstat(f.fileno())
+        response_headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "private, max-age=86400",
+        }
+        if filename is not None:
+            response_headers["Content-Disposition"] = f'inline; filename="{filename}"'
+        if _not_modified(headers, etag, stat.st_mtime):
+            f.close()
+            return Response(status_code=304, headers=response_headers)
+
+        size = stat.st_size
+        byte_range = None
+        range_header = headers.get("range")
+        if_range = headers.get("if-range")
+        # A range of an older version is not sent, the whole file is
+        if range_header is not None and (if_range is None or if_range.strip() == etag):
+            try:
+                byte_range = _parse_range(range_header, size)
+            except ValueError:
+                f.close()
+                response_headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=response_headers)
+
+        if byte_range is None:
+            response_headers["Content-Length"] = str(size)
+            return StreamingResponse(_read(f, 0, size), media_type=media_type, headers=response_headers)
+        start, end = byte_range
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response_headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _read(f, start, end - start + 1), status_code=206, media_type=media_type, headers=response_headers
+        )
+    except BaseException:
+        f.close()
+        raise
@@ -0,0 +1,74 @@
+"""Coalescing of streamed tokens into UI frames.
+
+Gradio sends the whole value of the output box with every update, so
+yielding once per token sends the proposal again and again, quadratic in its
+length. `FrameThrottle` groups the tokens: a frame is flushed when `interval`
+seconds passed since the previous one or `max_tokens` tokens are pending,
+whichever comes first, and the final state is always flushed.
+"""
+
+import time
+from typing import Optional
+
+from prometheus_client import Histogram
+
+UI_FRAMES_HISTOGRAM = Histogram(
+    "ui_stream_frames",
+    "Frames sent to the UI per request",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+UI_BYTES_HISTOGRAM = Histogram(
+    "ui_stream_bytes",
+    "Bytes of output sent to the UI per request, summed over its frames",
+    buckets=(1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8),
+)
+UI_TOKENS_PER_FRAME_HISTOGRAM = Histogram(
+    "ui_stream_tokens_per_frame",
+    "Tokens coalesced in each frame sent to the UI",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+class FrameThrottle:
+    """Decide when the tokens received so far are sent to the UI as a frame."""
+
+    def __init__(self, interval: float, max_tokens: int) -> None:
+        self.interval = interval
+        self.max_tokens = max(1, max_tokens)
+        self.pending = 0
+        self.frames = 0
+        self.bytes = 0
+        self._last_flush = time.perf_counter()
+        self._finished = False
+
+    def add(self) -> None:
+        self.pending += 1
+
+    def due(self) -> bool:
+        """Whether the pending tokens should be flushed now."""
+        if not self.pending:
+            return False
+        return self.pending >= self.max_tokens or self.timeout() == 0
+
+    def timeout(self) -> Optional[float]:
+        """Seconds until the pending tokens are due, None if there are none."""
+        if not self.pending:
+            return None
+        return max(0.0, self._last_flush + self.interval - time.perf_counter())
+
+    def flush(self, content: str) -> str:
+        """Account for a frame of `content` and return it."""
+        UI_TOKENS_PER_FRAME_HISTOGRAM.observe(self.pending)
+        self.pending = 0
+        self.frames += 1
+        self.bytes += len(content.encode("utf-8"))
+        self._last_flush = time.perf_counter()
+        return content
+
+    def finish(self) -> None:
+        """Record the frame and byte counts of the request, once."""
+        if self._finished or not self.frames:
+            return
+        self._finished = True
+        UI_FRAMES_HISTOGRAM.observe(self.frames)
+        UI_BYTES_HISTOGRAM.observe(self.bytes)
@@ -0,0 +1,75 @@
+"""Content-addressed PDF rendering of proposals.
+
+PDFs are rendered on demand, when the user asks to download a proposal, and
+named after a hash of the proposal text: identical proposals share one file,
+and a proposal already rendered is served without running wkhtmltopdf again.
+They are kept in a bounded `ArtifactStore`.
+"""
+
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import pdfkit
+from markdown import markdown
+from prometheus_client import Counter
+
+from utils.artifact_store import ArtifactStore
+
+PDF_RENDER_COUNTER = Counter(
+    "pdf_renders", "PDF download requests by result (cached, rendered, joined)", ["result"]
+)
+
+
+def render_pdf(text: str, path: str) -> None:
+    """Render the markdown `text` to `path`."""
+    html_text = markdown(text, output_format="html4")
+    pdfkit.from_string(html_text, path)
+
+
+class PdfRenderer:
+    """Render proposals to PDF files keyed by the hash of their text.
+
+    The wkhtmltopdf processes started by pdfkit are waited for in a small
+    thread pool, which bounds how many render at once and keeps the event
+    loop free. Concurrent requests for the same text share one render.
+    """
+
+    def __init__(self, store: ArtifactStore, max_workers: int = 2) -> None:
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf")
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def name_for(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"proposal-{digest[:32]}.pdf"
+
+    def _render(self, text: str, name: str) -> str:
+        return self.store.put(name, lambda path: render_pdf(text, path))
+
+    async def render(self, text: str) -> str:
+        """Return the file name of the PDF of `text` in the store, rendering it if needed."""
+        name = self.name_for(text)
+        if self.store.get(name) is not None:
+            PDF_RENDER_COUNTER.labels(result="cached").inc()
+            return name
+        future = self._inflight.get(name)
+        if future is not None:
+            PDF_RENDER_COUNTER.labels(result="joined").inc()
+            await asyncio.shield(future)
+            return name
+
+        loop = asyncio.get_running_loop()
+        future = asyncio.ensure_future(loop.run_in_executor(self._executor, self._render, text, name))
+        self._inflight[name] = future
+        try:
+            # Shielded so a user leaving does not fail the render for the others waiting
+            await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._inflight.pop(name, None)
+            else:
+                future.add_done_callback(lambda _: self._inflight.pop(name, None))
+        PDF_RENDER_COUNTER.labels(result="rendered").inc()
+        return name
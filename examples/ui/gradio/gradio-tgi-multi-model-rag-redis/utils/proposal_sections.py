@@ -0,0 +1,178 @@
+"""Section level updates of markdown proposals.
+
+A proposal is split into its top level sections. When the user asks to change
+some of them, only those are regenerated, in parallel, and spliced back into
+the proposal; the other sections are kept as they are.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter
+
+SECTION_UPDATE_COUNTER = Counter(
+    "proposal_updates", "Proposal updates by mode (sections, full)", ["mode"]
+)
+SECTIONS_REGENERATED_COUNTER = Counter(
+    "proposal_sections_regenerated", "Sections regenerated by section level updates"
+)
+SECTIONS_KEPT_COUNTER = Counter(
+    "proposal_sections_kept", "Sections kept unchanged by section level updates"
+)
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# The generation prompt asks for bold headings, which models often write without '#'
+_BOLD_HEADING = re.compile(r"^\*\*([^*].*?)\*\*:?\s*$")
+_BOLD_LEVEL = 7
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_WORD = re.compile(r"[a-z0-9][a-z0-9+\-]*")
+_SECTION_NUMBER = re.compile(r"\bsection\s+(\d+)\b")
+# Requests that are about the whole proposal
+_WHOLE_PROPOSAL = re.compile(
+    r"\b(whole|entire|every|all|overall|throughout|everywhere|rewrite|translate|shorten|tone)\b"
+)
+_STOP_WORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "into", "about", "more", "less",
+    "section", "sections", "proposal", "part", "please", "add", "update", "change", "make",
+    "remove", "replace", "include", "mention", "new", "also", "its", "their", "our", "your",
+}
+
+
+@dataclass
+class Section:
+    title: Optional[str]
+    text: str
+
+
+def _heading_level(line: str) -> Optional[int]:
+    match = _HEADING.match(line)
+    if match:
+        return len(match.group(1))
+    if _BOLD_HEADING.match(line):
+        return _BOLD_LEVEL
+    return None
+
+
+def _heading_title(line: str) -> str:
+    match = _HEADING.match(line) or _BOLD_HEADING.match(line)
+    return match.groups()[-1].strip("* ")
+
+
+def split_sections(text: str) -> List[Section]:
+    """Split a markdown proposal into its top level sections.
+
+    The top level is the highest heading level used at least twice, so a
+    single title heading does not make the whole proposal one section. Text
+    before the first section, and under a title heading, is returned as a
+    section without title, which is never regenerated.
+    """
+    lines = text.splitlines(keepends=True)
+    levels = []
+    in_fence = False
+    for line in lines:
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        levels.append(None if in_fence else _heading_level(line.rstrip("\n")))
+
+    used = [level for level in levels if level is not None]
+    top = min((level for level in set(used) if used.count(level) > 1), default=None)
+    if top is None:
+        return [Section(None, text)]
+
+    sections = [Section(None, "")]
+    for line, level in zip(lines, levels):
+        if level is not None and level <= top:
+            # A heading above the top level, the title of the proposal, does not name a section
+            title = _heading_title(line.rstrip("\n")) if level == top else None
+            sections.append(Section(title, ""))
+        sections[-1].text += line
+    if not sections[0].text:
+        sections.pop(0)
+    return sections
+
+
+def _words(text: str) -> set:
+    words = set()
+    for word in _WORD.findall(text.lower()):
+        if len(word) > 2 and word not in _STOP_WORDS:
+            # Crude singular, enough to match "benefit" with "Benefits"
+            words.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return words
+
+
+def affected_sections(sections: List[Section], user_query: str) -> Optional[List[int]]:
+    """Indexes of the sections the user query asks to change.
+
+    Returns None when the query is about the whole proposal or no section can
+    be told apart, the proposal should then be regenerated in full.
+    """
+    query = user_query.lower()
+    titled = [i for i, section in enumerate(sections) if section.title]
+    if len(titled) < 2 or _WHOLE_PROPOSAL.search(query):
+        return None
+
+    affected = set()
+    for number in _SECTION_NUMBER.findall(query):
+        # Headings are often numbered, otherwise count the sections
+        numbered = [i for i in titled if re.match(rf"{number}\b", sections[i].title)]
+        if numbered:
+            affected.update(numbered)
+        elif 1 <= int(number) <= len(titled):
+            affected.add(titled[int(number) - 1])
+
+    # Words found in half the titles or more, the product name typically, do not identify a section
+    title_words = {i: _words(sections[i].title) for i in titled}
+    common = {
+        word for word in set().union(*title_words.values())
+        if sum(word in words for words in title_words.values()) * 2 >= len(titled)
+    }
+    query_words = _words(query) - common
+    affected.update(i for i, words in title_words.items() if words & query_words)
+
+    # Regenerating most sections one by one loses the flow of the proposal
+    if not affected or len(affected) * 2 > len(titled):
+        return None
+    return sorted(affected)
+
+
+@dataclass
+class SectionUpdate:
+    """The sections of a proposal and the indexes of those to regenerate."""
+
+    sections: List[Section]
+    affected: List[int]
+
+    def outline(self) -> str:
+        return "\n".join(f"- {section.title}" for section in self.sections if section.title)
+
+    def render(self, generated: Dict[int, str]) -> str:
+        """The proposal with the text generated so far in place of the affected sections.
+
+        A section keeps its old text until its first token is generated.
+        """
+        parts = []
+        for i, section in enumerate(self.sections):
+            text = generated.get(i)
+            if text is None:
+                parts.append(section.text)
+            else:
+                # Keep the blank lines that separated the section from the next one
+                parts.append(text.strip("\n") + section.text[len(section.text.rstrip()):])
+        return "".join(parts)
+
+
+def plan_section_update(proposal: str, user_query: str) -> Optional[SectionUpdate]:
+    """Plan the update of the sections of `proposal` affected by `user_query`.
+
+    Returns None when the whole proposal should be regenerated.
+    """
+    sections = split_sections(proposal)
+    affected = affected_sections(sections, user_query)
+    if affected is None:
+        SECTION_UPDATE_COUNTER.labels(mode="full").inc()
+        return None
+    SECTION_UPDATE_COUNTER.labels(mode="sections").inc()
+    SECTIONS_REGENERATED_COUNTER.inc(len(affected))
+    SECTIONS_KEPT_COUNTER.inc(len(sections) - len(affected))
+    return SectionUpdate(sections, affected)
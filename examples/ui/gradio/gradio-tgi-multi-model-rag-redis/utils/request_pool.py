@@ -0,0 +1,103 @@
+"""Bounded pool of proposal generations with backpressure.
+
+At most `max_workers` requests generate at once across the pod. Up to
+`max_queue` more wait, each for at most `max_wait` seconds. Beyond that the
+request is rejected right away with an estimate of when to retry, rather than
+piling up until the model servers time out.
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+REQUEST_QUEUE_DEPTH_GAUGE = Gauge(
+    "request_queue_depth", "Requests waiting for a generation worker"
+)
+REQUEST_WORKERS_BUSY_GAUGE = Gauge(
+    "request_workers_busy", "Generation workers in use"
+)
+REQUEST_QUEUE_WAIT_HISTOGRAM = Histogram(
+    "request_queue_wait_seconds",
+    "Time spent waiting for a generation worker",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+REQUEST_REJECTED_COUNTER = Counter(
+    "request_rejected", "Requests rejected because the server was busy", ["reason"]
+)
+
+# Seconds a generation is assumed to take before any was measured
+INITIAL_SERVICE_TIME = 30.0
+# Weight of the last generation in the moving average of the service time
+SERVICE_TIME_ALPHA = 0.2
+
+
+class ServerBusyError(Exception):
+    """No generation worker is available, retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Server busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class RequestPool:
+    """Generation workers shared by every request of the event loop."""
+
+    def __init__(self, max_workers: int = 16, max_queue: int = 32, max_wait: float = 30.0) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.busy = 0
+        self.waiting = 0
+        self.service_time = INITIAL_SERVICE_TIME
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request should have drained."""
+        return max(1, math.ceil(self.service_time * (self.waiting + 1) / self.max_workers))
+
+    def _reject(self, reason: str):
+        REQUEST_REJECTED_COUNTER.labels(reason=reason).inc()
+        raise ServerBusyError(self.retry_after())
+
+    async def acquire(self) -> None:
+        start = time.perf_counter()
+        if not self._semaphore.locked():
+            # A free worker is taken right away, without suspending
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full")
+            self.waiting += 1
+            REQUEST_QUEUE_DEPTH_GAUGE.set(self.waiting)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+                timed_out = False
+            except asyncio.TimeoutError:
+                timed_out = True
+            finally:
+                self.waiting -= 1
+                REQUEST_QUEUE_DEPTH_GAUGE.set(self.waiting)
+            if timed_out:
+                self._reject("timeout")
+        REQUEST_QUEUE_WAIT_HISTOGRAM.observe(time.perf_counter() - start)
+        self.busy += 1
+        REQUEST_WORKERS_BUSY_GAUGE.set(self.busy)
+
+    def release(self, service_time: float) -> None:
+        self.service_time += SERVICE_TIME_ALPHA * (service_time - self.service_time)
+        self.busy -= 1
+        REQUEST_WORKERS_BUSY_GAUGE.set(self.busy)
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def worker(self):
+        """Hold a generation worker, raise `ServerBusyError` if none frees up in time."""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
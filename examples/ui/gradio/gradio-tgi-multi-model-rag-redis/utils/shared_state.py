@@ -0,0 +1,201 @@
+"""Configuration and round robin position shared by the app replicas through Redis.
+
+Without it each replica has its own rotation and its own configuration, only
+changed by the Configuration tab of that replica. With it:
+
+- the configuration is stored as JSON under a version key. A change made on
+  one replica increments the version and is announced on a pub/sub channel.
+  The others load it at once, or within a second if they missed the message,
+  since the version is also polled.
+- the round robin position is a counter the replicas claim blocks of
+  positions from, so they together follow one smooth weighted rotation.
+  The blocks are claimed in the background: a pick never waits for Redis,
+  and goes on with the rotation of its replica when no position is at hand.
+
+A replica starting adopts the shared configuration if there is one derived
+from the same config.yaml, so changes made in the UI outlive restarts. The
+shared configuration is stored with a hash of the config.yaml it started
+from: a replica deployed with an edited config.yaml shares it instead, and
+the other replicas apply it. The credentials are not shared, only the `credentials_path` they
+are read from by each replica: an API key entered in the UI stays on its
+replica.
+
+Configured with environment variables:
+    SHARED_STATE: "none" (default) or "redis" (uses REDIS_URL)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Tuple
+
+REDIS = "redis"
+
+PREFIX = "llm-scheduler:"
+CONFIG_KEY = PREFIX + "config"
+VERSION_KEY = PREFIX + "config-version"
+SOURCE_KEY = PREFIX + "config-source"
+POSITION_KEY = PREFIX + "round-robin-position"
+CHANNEL = PREFIX + "config-changed"
+
+# Seconds between two checks of the version, in case a notification was missed
+POLL_INTERVAL = 1.0
+# Seconds to wait for Redis, then the local state is used
+SOCKET_TIMEOUT = 2.0
+# Seconds the shared position is not asked for again after a failure
+RETRY_AFTER = 10.0
+# Round robin positions claimed at once, the next block is claimed when half is used
+POSITION_BLOCK = 8
+
+# The version, the configuration and the hash of its config.yaml change together
+PUBLISH_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[2], ARGV[1])
+redis.call('SET', KEYS[3], ARGV[3])
+redis.call('PUBLISH', ARGV[2], version)
+return version
+"""
+
+
+def config_hash(data: dict) -> str:
+    """Hash of a configuration as loaded from config.yaml."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SharedState:
+    """Configuration and round robin position of the replicas, kept in Redis."""
+
+    def __init__(self, url: str) -> None:
+        import redis
+
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=SOCKET_TIMEOUT, socket_connect_timeout=SOCKET_TIMEOUT
+        )
+        self._publish = self.client.register_script(PUBLISH_SCRIPT)
+        # Version of the configuration applied on this replica
+        self.version = 0
+        # Hash of the config.yaml of this replica
+        self.source = ""
+        self._lock = threading.Lock()
+        # Blocks of round robin positions claimed, (next, end)
+        self._positions = deque()
+        self._positions_lock = threading.Lock()
+        self._claiming = False
+        self._failed_at = 0.0
+        self._on_change: Optional[Callable[[dict], None]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> Optional[Tuple[int, dict]]:
+        """Version and data of the shared configuration, None if none was shared yet."""
+        version, data = self.client.mget(VERSION_KEY, CONFIG_KEY)
+        if version is None or data is None:
+            return None
+        return int(version), json.loads(data)
+
+    def publish(self, data: dict) -> None:
+        """Share the configuration changed on this replica."""
+        try:
+            with self._lock:
+                self.version = int(self._publish(
+                    keys=[VERSION_KEY, CONFIG_KEY, SOURCE_KEY], args=[json.dumps(data), CHANNEL, self.source]
+                ))
+        except Exception as e:
+            print(f"Configuration change not shared with the other replicas: {e}")
+
+    def refresh(self) -> None:
+        """Apply the shared configuration if it changed since the last one applied."""
+        with self._lock:
+            state = self.load()
+            if state is None or state[0] <= self.version:
+                return
+            self.version, data = state
+        print(f"Applying the shared configuration version {self.version}")
+        self._on_change(data)
+
+    def start(self, data: dict, on_change: Callable[[dict], None]) -> None:
+        """Apply the shared configuration with `on_change`, or share `data`, loaded from
+        config.yaml, if there is none or the shared one comes from another config.yaml.
+
+        Later changes of the other replicas are applied from a daemon thread.
+        """
+        self._on_change = on_change
+        self.source = config_hash(data)
+        try:
+            source = self.client.get(SOURCE_KEY)
+            if self.load() is None or source is None or source.decode("utf-8") != self.source:
+                print("Sharing the configuration of config.yaml")
+                self.publish(data)
+            self.refresh()
+        except Exception as e:
+            print(f"Shared configuration unavailable, using the local one: {e}")
+        self._thread = threading.Thread(target=self._run, name="shared-state", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        pubsub = None
+        while not self._stop.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CHANNEL)
+                # Woken up by the notifications, the version tells what to apply
+                pubsub.get_message(timeout=POLL_INTERVAL)
+                self.refresh()
+            except Exception as e:
+                print(f"Watching the shared configuration failed: {e}")
+                if pubsub is not None:
+                    pubsub.close()
+                    pubsub = None
+                self._stop.wait(POLL_INTERVAL)
+
+    def next_position(self) -> Optional[int]:
+        """Position of the next round robin pick among the picks of every replica.
+
+        None when no position was claimed yet or Redis is unavailable.
+        """
+        with self._positions_lock:
+            position = None
+            if self._positions:
+                position, end = self._positions[0]
+                if position + 1 < end:
+                    self._positions[0] = (position + 1, end)
+                else:
+                    self._positions.popleft()
+            left = sum(end - start for start, end in self._positions)
+            if (
+                left <= POSITION_BLOCK // 2
+                and not self._claiming
+                and time.monotonic() - self._failed_at >= RETRY_AFTER
+            ):
+                self._claiming = True
+                threading.Thread(target=self._claim_positions, name="shared-position", daemon=True).start()
+        return position
+
+    def _claim_positions(self) -> None:
+        try:
+            end = self.client.incrby(POSITION_KEY, POSITION_BLOCK)
+            with self._positions_lock:
+                self._positions.append((end - POSITION_BLOCK, end))
+        except Exception as e:
+            print(f"Shared round robin position unavailable: {e}")
+            self._failed_at = time.monotonic()
+        finally:
+            self._claiming = False
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """Create the shared state selected by the SHARED_STATE environment variable."""
+    backend = os.getenv("SHARED_STATE", "none").lower()
+    if backend == REDIS:
+        url = os.getenv("REDIS_URL")
+        if url is None:
+            raise ValueError("REDIS_URL is not specified")
+        return SharedState(url)
+    return None
@@ -0,0 +1,86 @@
+"""Single-flight coalescing of identical requests.
+
+When a request arrives while an identical one is still generating, it does
+not start a generation of its own: it joins the one in flight. Every item the
+generation produced so far is replayed to it from a buffer, then it receives
+the new ones as they come.
+
+The generation runs in its own task, and every request reading it is a
+subscriber with its own queue. A subscriber leaving does not disturb the
+others; the generation is cancelled only when the last one has left.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+from prometheus_client import Counter, Gauge
+
+SINGLE_FLIGHT_COUNTER = Counter(
+    "single_flight_requests", "Requests by role in their generation (leader, follower)", ["role"]
+)
+SINGLE_FLIGHT_GAUGE = Gauge(
+    "single_flight_generations", "Generations in flight, shared by one or more requests"
+)
+
+
+class Flight:
+    """One generation in flight, fanned out to its subscribers.
+
+    Has the `put_nowait` of a queue, so the generation writes to it as it
+    would to the queue of a single request.
+    """
+
+    def __init__(self, key: Hashable) -> None:
+        self.key = key
+        self.buffer: List[Any] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: asyncio.Task = None
+
+    def put_nowait(self, item: Any) -> None:
+        self.buffer.append(item)
+        for que in self.subscribers:
+            que.put_nowait(item)
+
+
+class SingleFlight:
+    """Generations in flight of the event loop, keyed on their request."""
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, Flight] = {}
+
+    @contextmanager
+    def join(self, key: Hashable, start: Callable[[Flight], Awaitable[None]]):
+        """Subscribe to the generation of `key`, starting it with `start` if none is in flight.
+
+        Yields a queue receiving every item of the generation from the start.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(key)
+            self._flights[key] = flight
+            SINGLE_FLIGHT_GAUGE.set(len(self._flights))
+            flight.task = asyncio.create_task(start(flight))
+            # Later requests start a new generation once this one is over
+            flight.task.add_done_callback(lambda _: self._forget(flight))
+            SINGLE_FLIGHT_COUNTER.labels(role="leader").inc()
+        else:
+            SINGLE_FLIGHT_COUNTER.labels(role="follower").inc()
+
+        que = asyncio.Queue()
+        for item in flight.buffer:
+            que.put_nowait(item)
+        flight.subscribers.add(que)
+        try:
+            yield que
+        finally:
+            flight.subscribers.discard(que)
+            if not flight.subscribers and not flight.task.done():
+                # Nobody is reading anymore, stop generating
+                self._forget(flight)
+                flight.task.cancel()
+
+    def _forget(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+            SINGLE_FLIGHT_GAUGE.set(len(self._flights))